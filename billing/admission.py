@@ -0,0 +1,84 @@
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from billing.deadline import Deadline
+
+
+class Overloaded(Exception):
+    pass
+
+
+@dataclass(slots=True)
+class AdmissionStats:
+    admitted: int = 0
+    shed: int = 0
+    in_flight: int = 0
+    queued: int = 0
+
+    @property
+    def shed_rate(self) -> float:
+        """The fraction of requests shed since the start."""
+        total = self.admitted + self.shed
+        return self.shed / total if total else 0.0
+
+
+class AdmissionController:
+    """
+    Bounds how much expensive work runs at once: up to `max_in_flight` callers are admitted, up to `max_queued` more wait
+    (for at most `queue_timeout_seconds`) for one of them to finish, and anyone else is refused straight away with
+    Overloaded.
+
+    Decision #1: Shedding early rather than letting every request start. Past capacity each extra request slows down
+    all the others (they share the upstream connections, the report fetch threads and the CPU), so admitting them all
+    makes everyone time out. Refusing the excess keeps the admitted requests at full speed.
+
+    Decision #2: A waiting caller isn't guaranteed to be admitted before a caller which arrives after it, which keeps
+    this a Condition rather than a hand-rolled FIFO. The queue timeout bounds how long anyone waits regardless.
+
+    Decision #3: A caller with a deadline waits at most until the deadline, so the time spent queued counts against the
+    same latency bound as the work itself rather than adding to it.
+    """
+
+    def __init__(self, max_in_flight: int, max_queued: int, queue_timeout_seconds: float) -> None:
+        self._max_in_flight = max_in_flight
+        self._max_queued = max_queued
+        self._queue_timeout_seconds = queue_timeout_seconds
+        self._condition = threading.Condition()
+        self.stats = AdmissionStats()
+
+    @contextmanager
+    def admit(self, deadline: Deadline | None = None) -> Iterator[None]:
+        """Runs the enclosed block once admitted, raises Overloaded if the caller is shed."""
+        self._acquire(deadline)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _acquire(self, deadline: Deadline | None) -> None:
+        stats = self.stats
+        timeout = self._queue_timeout_seconds
+        if deadline is not None:
+            timeout = min(timeout, deadline.remaining())
+        with self._condition:
+            if stats.in_flight >= self._max_in_flight:
+                if stats.queued >= self._max_queued:
+                    stats.shed += 1
+                    raise Overloaded()
+                stats.queued += 1
+                try:
+                    admitted = self._condition.wait_for(lambda: stats.in_flight < self._max_in_flight, timeout)
+                finally:
+                    stats.queued -= 1
+                if not admitted:
+                    stats.shed += 1
+                    raise Overloaded()
+            stats.in_flight += 1
+            stats.admitted += 1
+
+    def _release(self) -> None:
+        with self._condition:
+            self.stats.in_flight -= 1
+            self._condition.notify()
@@ -0,0 +1,272 @@
+"""
+Offline batch billing over archived message dumps, for rebilling historical periods without going through /usage.
+
+Usage: python -m billing.batch messages.jsonl [more.jsonl ...] --reports reports.jsonl --output usage.csv
+
+Decision #1: Messages are streamed and billed in chunks by a pool of worker processes (credit calculation is CPU bound
+so threads wouldn't help). Only a bounded number of chunks are in flight at once, so memory stays constant however big
+the dump is. Workers also serialize their rows, so the parent process only writes bytes.
+
+Decision #2: After every chunk is written the number of messages processed and the size of the output are saved to a
+checkpoint file. Resuming skips those messages and truncates anything written after the checkpoint, so an interrupted
+run can be restarted without duplicating rows. The checkpoint also records what the run was over (the input files with
+their size and modification time, the chunk size and the pricing, i.e. the billing parameters and the rules), and a
+run over anything else refuses to resume from it rather than skipping the wrong rows (or billing under two pricings).
+It's deleted once the run completes, so running again rebills.
+
+Decision #3: This module deliberately doesn't import the services (which depend on FastAPI and requests), reports are
+looked up from a local dump instead of the reports API. tests/test_startup.py checks it stays that way.
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
+from pathlib import Path
+from typing import Any, Self
+
+from billing.constants import DEFAULT_BILLING_PARAMETERS
+from billing.dataclasses import BillingParameters, Credit
+from billing.models import Message, Report
+from billing.schemas import UsageEntry
+from billing.services.credit_calculation_service import CalculateCreditsService
+
+DEFAULT_CHUNK_SIZE = 10_000
+CSV_COLUMNS = ["message_id", "timestamp", "report_name", "credits_used"]
+
+
+class CheckpointMismatch(Exception):
+    pass
+
+
+@dataclass(frozen=True, slots=True)
+class BatchRun:
+    """What a run bills: each input file as (path, size, modification time), the chunk size and the pricing."""
+
+    inputs: tuple[tuple[str, int, int], ...]
+    chunk_size: int
+    pricing_fingerprint: str
+
+    @classmethod
+    def describe(cls, paths: Iterable[Path], chunk_size: int, parameters: BillingParameters) -> Self:
+        inputs = []
+        for path in paths:
+            stat = path.stat()
+            inputs.append((str(path.resolve()), stat.st_size, stat.st_mtime_ns))
+        # The calculator's fingerprint rather than the parameters', so a change to the rules also refuses to resume.
+        return cls(
+            inputs=tuple(inputs),
+            chunk_size=chunk_size,
+            pricing_fingerprint=CalculateCreditsService(parameters).fingerprint,
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Checkpoint:
+    run: BatchRun
+    messages_processed: int
+    output_bytes: int
+
+    @classmethod
+    def load(cls, path: Path) -> Self | None:
+        if not path.exists():
+            return None
+        data = json.loads(path.read_text())
+        try:
+            run = BatchRun(
+                inputs=tuple((str(p), int(size), int(mtime)) for p, size, mtime in data["inputs"]),
+                chunk_size=data["chunk_size"],
+                pricing_fingerprint=data["pricing_fingerprint"],
+            )
+        except (KeyError, TypeError, ValueError):
+            raise CheckpointMismatch(f"{path} isn't a checkpoint of this version, delete it to start over")
+        return cls(run=run, messages_processed=data["messages_processed"], output_bytes=data["output_bytes"])
+
+    def save(self, path: Path) -> None:
+        # Write then rename so a crash never leaves a half written checkpoint.
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        tmp_path.write_text(
+            json.dumps(
+                {
+                    "inputs": self.run.inputs,
+                    "chunk_size": self.run.chunk_size,
+                    "pricing_fingerprint": self.run.pricing_fingerprint,
+                    "messages_processed": self.messages_processed,
+                    "output_bytes": self.output_bytes,
+                }
+            )
+        )
+        os.replace(tmp_path, path)
+
+
+def _iter_records(path: Path, key: str) -> Iterator[dict[str, Any]]:
+    """
+    JSONL files are streamed line by line. Assumption: JSON files are small enough to load, either a list of records or
+    an object with the records under `key` (the same shape as the API responses). Large dumps should use JSONL.
+    """
+    if path.suffix == ".jsonl":
+        with path.open(encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        data = json.loads(path.read_text(encoding="utf-8"))
+        yield from data[key] if isinstance(data, dict) else data
+
+
+def iter_messages(paths: Iterable[Path]) -> Iterator[dict[str, Any]]:
+    for path in paths:
+        yield from _iter_records(path, "messages")
+
+
+def load_reports(path: Path | None) -> dict[int, Report]:
+    if path is None:
+        return {}
+    return {report.id: report for report in (Report(**record) for record in _iter_records(path, "reports"))}
+
+
+def _chunks(records: Iterator[dict[str, Any]], chunk_size: int) -> Iterator[list[dict[str, Any]]]:
+    while chunk := list(islice(records, chunk_size)):
+        yield chunk
+
+
+# Set once per worker process by _init_worker, so the reports and calculator aren't pickled with every chunk.
+_calculator: CalculateCreditsService | None = None
+_reports: dict[int, Report] = {}
+
+
+def _init_worker(parameters: BillingParameters, reports: dict[int, Report]) -> None:
+    global _calculator, _reports
+    _calculator = CalculateCreditsService(parameters)
+    _reports = reports
+
+
+def _bill_message(message: Message) -> UsageEntry:
+    # NOTE: Same logic as UsageService, but with reports looked up from the local dump.
+    if _calculator is None:
+        raise RuntimeError("_init_worker must be called before billing messages")
+    report = _reports.get(message.report_id) if message.report_id else None
+    if report:
+        credits_used = Credit(amount=report.credit_cost)
+    else:
+        credits_used = _calculator.calculate_credits(message.text)
+    return UsageEntry(
+        report_name=report.name if report else None,
+        message_id=message.id,
+        timestamp=message.timestamp,
+        credits_used=float(credits_used.amount),
+    )
+
+
+def _bill_chunk(chunk: list[dict[str, Any]], output_format: str) -> bytes:
+    entries = [_bill_message(Message(**record)) for record in chunk]
+    if output_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerows(
+            [entry.message_id, entry.timestamp, entry.report_name or "", entry.credits_used] for entry in entries
+        )
+        return buffer.getvalue().encode()
+    return b"".join(entry.model_dump_json(exclude_none=True).encode() + b"\n" for entry in entries)
+
+
+def run_batch(
+    message_paths: list[Path],
+    output_path: Path,
+    reports_path: Path | None = None,
+    checkpoint_path: Path | None = None,
+    parameters: BillingParameters = DEFAULT_BILLING_PARAMETERS,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: int = 1,
+) -> int:
+    """
+    Bills every message in `message_paths` into `output_path` and returns the total number of messages billed. Raises
+    CheckpointMismatch if there's a checkpoint from a run over different inputs or parameters.
+    """
+    output_format = "csv" if output_path.suffix == ".csv" else "jsonl"
+    checkpoint_path = checkpoint_path or output_path.with_name(f"{output_path.name}.checkpoint")
+    run = BatchRun.describe([*message_paths, *([reports_path] if reports_path else [])], chunk_size, parameters)
+    checkpoint = Checkpoint.load(checkpoint_path) if output_path.exists() else None
+    if checkpoint is not None and checkpoint.run != run:
+        raise CheckpointMismatch(
+            f"{checkpoint_path} is from a run over different inputs, chunk size or parameters, delete it (and the "
+            "output) to start over"
+        )
+    reports = load_reports(reports_path)
+
+    messages = iter_messages(message_paths)
+    messages_processed = 0
+    if checkpoint is not None:
+        messages_processed = checkpoint.messages_processed
+        # Consume without keeping anything, rather than materializing the skipped messages.
+        for _ in islice(messages, messages_processed):
+            pass
+
+    with output_path.open("r+b" if checkpoint is not None else "wb") as output:
+        if checkpoint is not None:
+            output.truncate(checkpoint.output_bytes)
+            output.seek(checkpoint.output_bytes)
+        elif output_format == "csv":
+            output.write((",".join(CSV_COLUMNS) + "\n").encode())
+
+        def write(rows: bytes, count: int) -> None:
+            nonlocal messages_processed
+            output.write(rows)
+            output.flush()
+            messages_processed += count
+            Checkpoint(run=run, messages_processed=messages_processed, output_bytes=output.tell()).save(checkpoint_path)
+
+        chunks = _chunks(messages, chunk_size)
+        if workers <= 1:
+            _init_worker(parameters, reports)
+            for chunk in chunks:
+                write(_bill_chunk(chunk, output_format), len(chunk))
+        else:
+            with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(parameters, reports)) as executor:
+                # Results are written in submission order, so the output order matches the input order.
+                in_flight: deque[tuple[Future[bytes], int]] = deque()
+                for chunk in chunks:
+                    in_flight.append((executor.submit(_bill_chunk, chunk, output_format), len(chunk)))
+                    if len(in_flight) >= workers * 2:
+                        future, count = in_flight.popleft()
+                        write(future.result(), count)
+                while in_flight:
+                    future, count = in_flight.popleft()
+                    write(future.result(), count)
+
+    checkpoint_path.unlink(missing_ok=True)
+    return messages_processed
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Bill archived message dumps (JSON or JSONL) offline.")
+    parser.add_argument("messages", nargs="+", type=Path, help="Message dumps, billed in the order given")
+    parser.add_argument("--output", required=True, type=Path, help="Output file, .csv for CSV otherwise JSONL")
+    parser.add_argument("--reports", type=Path, help="Report dump used to look up report ids")
+    parser.add_argument("--checkpoint", type=Path, help="Checkpoint file (default: <output>.checkpoint)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    try:
+        billed = run_batch(
+            message_paths=args.messages,
+            output_path=args.output,
+            reports_path=args.reports,
+            checkpoint_path=args.checkpoint,
+            chunk_size=args.chunk_size,
+            workers=args.workers,
+        )
+    except CheckpointMismatch as e:
+        parser.exit(1, f"{e}\n")
+    print(f"Billed {billed} messages into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
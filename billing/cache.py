@@ -0,0 +1,205 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass, field, replace
+from enum import StrEnum
+
+from billing.compression import ENCODERS
+from billing.shared_cache import SharedCache
+
+
+class CacheStatus(StrEnum):
+    HIT = "hit"
+    STALE = "stale"
+    MISS = "miss"
+
+
+@dataclass(frozen=True, slots=True)
+class CachedResponse:
+    body: bytes
+    version: str | None
+    created_at: float
+    # False for a partial response computed against a deadline, which is served once but never cached.
+    complete: bool = True
+    # The body compressed in each encoding (see billing.compression), compressed once and served from the cache.
+    encoded_bodies: Mapping[str, bytes] = field(default_factory=dict)
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self.body) + sum(len(encoded) for encoded in self.encoded_bodies.values())
+
+
+class ResponseCache:
+    """
+    Decision #1: Caching the serialized bytes rather than the UsageResponse. A hit then costs a dictionary lookup and
+    writing the bytes out, we skip both the UsageService and pydantic serialization.
+
+    Decision #2: Stale-while-revalidate. Entries are fresh for `ttl_seconds`, after that they are served as stale for a
+    further `stale_seconds` while the caller refreshes them in the background. Only entries older than both are
+    treated as a miss, so pollers only ever wait on a cold cache.
+
+    Decision #3: Memory is bounded by the total size of the cached bodies (evicting least recently used first) instead
+    of a number of entries, as the size of a usage response depends on the period.
+
+    Decision #4: With a `shared` cache, responses are written through to it and an entry which isn't fresh here is
+    looked up there, so a response computed by one worker on the host is served by all of them. The in-process tier is
+    then only meant to be small (see USAGE_CACHE_LOCAL_MAX_BYTES), so that host memory doesn't grow with the number of
+    workers: responses which don't fit it are served from the shared cache on every hit, which is memory mapped.
+
+    Decision #5: Keys don't include the upstream version. Finding out the version costs an upstream call, which is what a
+    fresh hit avoids, so a change upstream is only picked up once the entry goes stale (at most `ttl_seconds` later). The
+    version is stored with each entry so that revalidation only recomputes a response when the upstream has changed.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl_seconds: float,
+        stale_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+        shared: SharedCache | None = None,
+    ) -> None:
+        self._max_bytes = max_bytes
+        self._ttl_seconds = ttl_seconds
+        self._stale_seconds = stale_seconds
+        self._clock = clock
+        self._shared = shared
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._size_bytes = 0
+        self._revalidating: set[str] = set()
+        # The router runs sync endpoints and background tasks in a thread pool, so access needs to be serialized.
+        self._lock = threading.Lock()
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size_bytes
+
+    def lookup(self, key: str) -> tuple[CachedResponse | None, CacheStatus]:
+        entry, status = self._lookup_local(key)
+        if status is not CacheStatus.HIT and self._shared is not None:
+            shared_entry = self._lookup_shared(self._shared, key)
+            shared_status = self._status(shared_entry) if shared_entry is not None else None
+            if (
+                shared_entry is not None
+                and shared_status is not None
+                and (entry is None or shared_entry.created_at > entry.created_at)
+            ):
+                # Only kept in process if it fits, otherwise it's served from the shared cache each time.
+                self._store(key, shared_entry)
+                entry, status = shared_entry, shared_status
+        return entry, status
+
+    def set(
+        self, key: str, body: bytes, version: str | None, encoded_bodies: Mapping[str, bytes] | None = None
+    ) -> CachedResponse:
+        entry = CachedResponse(
+            body=body, version=version, created_at=self._clock(), encoded_bodies=dict(encoded_bodies or {})
+        )
+        self._store(key, entry)
+        if self._shared is not None:
+            self._shared.set(key, body, version)
+            # Each encoding is its own row, tagged with the digest of the body it encodes rather than the version, as
+            # the version doesn't tell apart bodies computed without one (or a newer body left without this encoding).
+            for encoding, encoded in entry.encoded_bodies.items():
+                self._shared.set(f"{key}:{encoding}", encoded, _body_digest(body))
+        return entry
+
+    def _lookup_local(self, key: str) -> tuple[CachedResponse | None, CacheStatus]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, CacheStatus.MISS
+
+            status = self._status(entry)
+            if status is None:
+                self._remove(key)
+                return None, CacheStatus.MISS
+
+            self._entries.move_to_end(key)
+            return entry, status
+
+    def _status(self, entry: CachedResponse) -> CacheStatus | None:
+        """HIT or STALE by the entry's age, None once it's too old to serve."""
+        age = self._clock() - entry.created_at
+        if age > self._ttl_seconds + self._stale_seconds:
+            return None
+        if age > self._ttl_seconds:
+            return CacheStatus.STALE
+        return CacheStatus.HIT
+
+    def _lookup_shared(self, shared: SharedCache, key: str) -> CachedResponse | None:
+        shared_entry = shared.get(key)
+        if shared_entry is None:
+            return None
+        # The shared cache's timestamps are wall clock time, converted to this cache's clock by the entry's age.
+        created_at = self._clock() - shared.age(shared_entry)
+        encoded_bodies = {}
+        body_digest = None
+        for encoding in ENCODERS:
+            encoded = shared.get(f"{key}:{encoding}")
+            if encoded is None:
+                continue
+            body_digest = body_digest or _body_digest(shared_entry.value)
+            # An encoding evicted separately (or of another body) is left out, the plain body is served instead.
+            if encoded.version == body_digest:
+                encoded_bodies[encoding] = encoded.value
+        return CachedResponse(
+            body=shared_entry.value,
+            version=shared_entry.version,
+            created_at=created_at,
+            encoded_bodies=encoded_bodies,
+        )
+
+    def _store(self, key: str, entry: CachedResponse) -> None:
+        with self._lock:
+            self._remove(key)
+            if entry.size_bytes > self._max_bytes:
+                # Not worth evicting everything else for a response which can't fit anyway.
+                return
+            self._entries[key] = entry
+            self._size_bytes += entry.size_bytes
+            while self._size_bytes > self._max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+
+    def touch(self, key: str) -> None:
+        """Marks an entry as fresh again, used when revalidation finds the upstream hasn't changed."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = replace(entry, created_at=self._clock())
+                # Revalidated entries are the ones in use, so they go to the back of the eviction queue.
+                self._entries.move_to_end(key)
+        if self._shared is not None:
+            self._shared.touch(key)
+            for encoding in ENCODERS:
+                self._shared.touch(f"{key}:{encoding}")
+
+    def start_revalidation(self, key: str) -> bool:
+        """Returns False if the key is already being revalidated, so a burst of stale hits triggers one refresh."""
+        with self._lock:
+            if key in self._revalidating:
+                return False
+            self._revalidating.add(key)
+            return True
+
+    def finish_revalidation(self, key: str) -> None:
+        with self._lock:
+            self._revalidating.discard(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size_bytes = 0
+            self._revalidating.clear()
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size_bytes -= entry.size_bytes
+
+
+def _body_digest(body: bytes) -> str:
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
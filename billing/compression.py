@@ -0,0 +1,83 @@
+"""
+Negotiated compression of the /usage responses.
+
+Decision #1: gzip only. It's in the standard library and every client supports it. Faster codecs (zstd, brotli) would
+need a dependency (the standard library only gets zstd in Python 3.14), adding one is a matter of registering it in
+ENCODERS.
+
+Decision #2: Compression level 5, from benchmarking a 4.5MB /usage response of 50k entries (run
+`python -m billing.compression <response.json>` to repeat it against a real response):
+
+    level   ratio   time
+    1       4.5x    39ms
+    3       4.8x    69ms
+    5       5.3x    109ms
+    6       5.4x    119ms
+    7       5.7x    182ms
+    9       5.7x    533ms
+
+Responses are compressed once when they're cached and served compressed many times, so the bytes saved matter more
+than the CPU. Level 5 is the knee: 6 saves almost nothing more and 7 onwards costs far more time for a few percent.
+
+Decision #3: Bodies under COMPRESSION_MIN_BYTES aren't compressed, as the saving doesn't cover the gzip overhead.
+"""
+
+import gzip
+import sys
+import time
+from collections.abc import Callable, Iterable
+from functools import partial
+from pathlib import Path
+
+from billing.constants import COMPRESSION_LEVEL, COMPRESSION_MIN_BYTES
+
+ENCODERS: dict[str, Callable[[bytes], bytes]] = {
+    # mtime=0 so the same body always compresses to the same bytes.
+    "gzip": partial(gzip.compress, compresslevel=COMPRESSION_LEVEL, mtime=0),
+}
+
+
+def compress_body(body: bytes) -> dict[str, bytes]:
+    """The body in every supported encoding, or none if it's too small to be worth compressing."""
+    if len(body) < COMPRESSION_MIN_BYTES:
+        return {}
+    return {encoding: encode(body) for encoding, encode in ENCODERS.items()}
+
+
+def negotiate_encoding(accept_encoding: str | None, available: Iterable[str]) -> str | None:
+    """
+    The available encoding the client prefers according to its Accept-Encoding header (by q-value, with `*` covering
+    the encodings it doesn't list). None means the uncompressed body.
+    """
+    if not accept_encoding:
+        return None
+    qualities: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        encoding, _, params = part.partition(";")
+        name, _, value = params.partition("=")
+        try:
+            quality = float(value) if name.strip() == "q" else 1.0
+        except ValueError:
+            quality = 0.0
+        qualities.setdefault(encoding.strip().lower(), quality)
+    default_quality = qualities.get("*", 0.0)
+    best = max(available, key=lambda encoding: qualities.get(encoding, default_quality), default=None)
+    if best is None or qualities.get(best, default_quality) <= 0:
+        return None
+    return best
+
+
+def benchmark(body: bytes, levels: range = range(1, 10), repeat: int = 3) -> list[tuple[int, float, float]]:
+    """The compression ratio and seconds per compression of `body` at each gzip level."""
+    results = []
+    for level in levels:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            compressed = gzip.compress(body, compresslevel=level, mtime=0)
+        results.append((level, len(body) / len(compressed), (time.perf_counter() - start) / repeat))
+    return results
+
+
+if __name__ == "__main__":
+    for level, ratio, seconds in benchmark(Path(sys.argv[1]).read_bytes()):
+        print(f"level {level}: {ratio:.1f}x in {seconds * 1000:.0f}ms")
@@ -1,10 +1,11 @@
+import os
+
 from billing.dataclasses import BillingParameters, Credit
 
 # Decision: I've hard coded this here but in a real-world scenario, this would be stored in a configuration file/database/environment variable and set at a higher level.
 BASE_SERVICE_URL = "https://owpublic.blob.core.windows.net/tech-task"
-# Decision: I'm using a global variable for the default billing parameters. This is a simple application and we don't need
-# to worry about different customers having different parameters. If we need to support different parameters in the future,
-# we can always refactor this to use a database or configuration file to store the parameters.
+# Decision: I'm using a global variable for the default billing parameters. Customers with their own pricing are configured
+# in the BILLING_PARAMETERS_PATH file (see BillingParametersService), everyone else uses these.
 DEFAULT_BILLING_PARAMETERS = BillingParameters(
     BASE_CREDIT_COST=Credit.from_int(1),
     CHAR_CREDIT_COST=Credit.from_float(0.05),
@@ -17,3 +18,91 @@ DEFAULT_BILLING_PARAMETERS = BillingParameters(
     PALINDROME_MULTIPLIER=2,
     VOWEL_COST=Credit.from_float(0.3),
 )
+
+# Decision: The /usage response cache settings. Responses are fresh for a short time so dashboards see new messages
+# quickly, and then served stale (while being refreshed in the background) for a while longer so that pollers never
+# wait on the upstream. The byte limit bounds the memory used by the cache in each process.
+USAGE_CACHE_TTL_SECONDS = 30.0
+USAGE_CACHE_STALE_SECONDS = 300.0
+USAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Decision: The refresh worker keeps the report cache and the cached /usage response warm. These are read from the
+# environment so they can be tuned per deployment (e.g. disabled when running locally without network access).
+USAGE_REFRESH_ENABLED = os.environ.get("USAGE_REFRESH_ENABLED", "true").lower() == "true"
+# Shorter than the cache TTL so that pollers keep getting fresh hits while the upstream is reachable.
+USAGE_REFRESH_INTERVAL_SECONDS = float(os.environ.get("USAGE_REFRESH_INTERVAL_SECONDS", "20"))
+
+# Decision: Where the refresh worker stores the latest computed usage as a columnar snapshot (see billing/snapshot.py).
+# A new process serves from it until its own caches are warm. Disabled unless set.
+USAGE_SNAPSHOT_PATH = os.environ.get("USAGE_SNAPSHOT_PATH")
+
+# Decision: Record/replay of upstream responses for offline performance testing (see billing/transports.py). Replay
+# takes precedence if both are set. The latency scale multiplies the recorded latencies when replaying.
+UPSTREAM_RECORD_PATH = os.environ.get("UPSTREAM_RECORD_PATH")
+UPSTREAM_REPLAY_PATH = os.environ.get("UPSTREAM_REPLAY_PATH")
+UPSTREAM_REPLAY_LATENCY_SCALE = float(os.environ.get("UPSTREAM_REPLAY_LATENCY_SCALE", "1.0"))
+
+# Decision: The fraction of calculated messages which are also run through the candidate credits engine, to compare it
+# against the current one in production. 0 disables shadow calculation.
+SHADOW_SAMPLE_RATE = float(os.environ.get("SHADOW_SAMPLE_RATE", "0"))
+
+# Decision: A JSON file with per-customer billing parameters, hot-reloaded when it changes (see
+# billing/services/billing_parameters_service.py). Every customer uses DEFAULT_BILLING_PARAMETERS unless set.
+BILLING_PARAMETERS_PATH = os.environ.get("BILLING_PARAMETERS_PATH")
+
+# Decision: Tracing of the /usage pipeline (see billing/tracing.py). Spans are appended to TRACE_EXPORT_PATH as JSONL for
+# a TRACE_SAMPLE_RATE fraction of requests. Disabled unless the path is set.
+TRACE_EXPORT_PATH = os.environ.get("TRACE_EXPORT_PATH")
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0.01"))
+
+# Decision: How many reports are fetched at once when resolving the reports for a period, which is also the size of the
+# upstream connection pool.
+REPORT_FETCH_CONCURRENCY = int(os.environ.get("REPORT_FETCH_CONCURRENCY", "8"))
+
+# Decision: Every upstream call has a timeout, so a hung connection can't hold a request (or the refresh worker) forever.
+UPSTREAM_TIMEOUT_SECONDS = float(os.environ.get("UPSTREAM_TIMEOUT_SECONDS", "10"))
+
+# Decision: When set, a /usage request which can't be answered from the cache returns what it has after this many
+# seconds rather than waiting on slow reports. Messages whose report isn't resolved by then are marked pending (or, with
+# USAGE_BILL_PENDING_REPORTS, billed with the calculator and marked estimated) and the response has "complete": false.
+# Incomplete responses are never cached. Disabled unless set.
+USAGE_DEADLINE_SECONDS = (
+    float(os.environ["USAGE_DEADLINE_SECONDS"]) if os.environ.get("USAGE_DEADLINE_SECONDS") else None
+)
+USAGE_BILL_PENDING_REPORTS = os.environ.get("USAGE_BILL_PENDING_REPORTS", "false").lower() == "true"
+
+# Decision: When set, reports and usage responses are also cached in an SQLite database at this path, shared by every
+# worker on the host (put it on a tmpfs such as /dev/shm so it lives in memory). Each worker then only fetches and
+# computes what no other worker has yet. SHARED_CACHE_MAX_BYTES bounds its total size. Disabled unless set.
+SHARED_CACHE_PATH = os.environ.get("SHARED_CACHE_PATH")
+SHARED_CACHE_MAX_BYTES = int(os.environ.get("SHARED_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# With the shared cache, each worker only keeps responses up to this size in process as well (0 for none), larger ones
+# are read from the shared cache. Reports are cached in process up to REPORT_CACHE_MAX_ENTRIES either way.
+USAGE_CACHE_LOCAL_MAX_BYTES = int(os.environ.get("USAGE_CACHE_LOCAL_MAX_BYTES", str(4 * 1024 * 1024)))
+REPORT_CACHE_MAX_ENTRIES = int(os.environ.get("REPORT_CACHE_MAX_ENTRIES", "10000"))
+
+# Decision: When set, messages are pushed to POST /messages as they happen and priced in the background into a usage
+# store (an SQLite database) at this path, and /usage reads the stored usage instead of the upstream. Customers with
+# their own pricing are still computed from the upstream, as the stored credits use the default parameters. Disabled
+# unless set.
+USAGE_STORE_PATH = os.environ.get("USAGE_STORE_PATH")
+INGESTION_QUEUE_SIZE = int(os.environ.get("INGESTION_QUEUE_SIZE", "10000"))
+
+# Decision: At most USAGE_MAX_IN_FLIGHT /usage requests which can't be served from the cache compute the usage at once,
+# USAGE_MAX_QUEUED more wait up to USAGE_QUEUE_TIMEOUT_SECONDS for a slot and the rest get a 503 with Retry-After.
+# Requests served from the cache are never queued. Queued requests hold a thread of the server's threadpool (40 by
+# default), so in flight plus queued is kept well under it to leave threads for the cache hits.
+USAGE_MAX_IN_FLIGHT = int(os.environ.get("USAGE_MAX_IN_FLIGHT", "8"))
+USAGE_MAX_QUEUED = int(os.environ.get("USAGE_MAX_QUEUED", "16"))
+USAGE_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("USAGE_QUEUE_TIMEOUT_SECONDS", "2"))
+USAGE_RETRY_AFTER_SECONDS = int(os.environ.get("USAGE_RETRY_AFTER_SECONDS", "1"))
+
+# Decision: See billing/compression.py for how the level was chosen.
+COMPRESSION_LEVEL = int(os.environ.get("COMPRESSION_LEVEL", "5"))
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))
+
+# Decision: Memory profiling of a single /usage request (see billing/memory_profiling.py), asked for with an
+# `X-Memory-Profile: true` header. Off unless enabled, as a profiled request is several times slower and the report shows
+# source paths, so clients shouldn't be able to ask for one in production.
+MEMORY_PROFILING_ENABLED = os.environ.get("MEMORY_PROFILING_ENABLED", "false").lower() == "true"
+MEMORY_PROFILE_TOP_SITES = int(os.environ.get("MEMORY_PROFILE_TOP_SITES", "10"))
@@ -0,0 +1,137 @@
+from pathlib import Path
+from typing import Self
+
+from fastapi import Request
+
+from billing.admission import AdmissionController
+from billing.cache import ResponseCache
+from billing.constants import (
+    BILLING_PARAMETERS_PATH,
+    DEFAULT_BILLING_PARAMETERS,
+    INGESTION_QUEUE_SIZE,
+    REPORT_FETCH_CONCURRENCY,
+    SHADOW_SAMPLE_RATE,
+    SHARED_CACHE_MAX_BYTES,
+    SHARED_CACHE_PATH,
+    TRACE_EXPORT_PATH,
+    TRACE_SAMPLE_RATE,
+    USAGE_CACHE_LOCAL_MAX_BYTES,
+    USAGE_CACHE_MAX_BYTES,
+    USAGE_CACHE_STALE_SECONDS,
+    USAGE_CACHE_TTL_SECONDS,
+    USAGE_MAX_IN_FLIGHT,
+    USAGE_MAX_QUEUED,
+    USAGE_QUEUE_TIMEOUT_SECONDS,
+    USAGE_STORE_PATH,
+)
+from billing.services.billing_parameters_service import BillingParametersService
+from billing.services.ingestion_service import IngestionService
+from billing.services.messages_service import MessageService
+from billing.services.pricing_simulation_service import FeatureCreditsService, PricingSimulationService
+from billing.services.reports_service import ReportService
+from billing.services.usage_service import UsageService
+from billing.shared_cache import SharedCache
+from billing.snapshot import UsageSnapshot
+from billing.tracing import FileSpanExporter, Tracer
+from billing.transports import Transport, build_transport, close_transport
+from billing.usage_store import UsageStore
+
+
+class ServiceContainer:
+    """
+    The services shared by every request, built once in the app's lifespan and injected with `get_container`.
+
+    Decision #1: One instance of each service for the lifetime of the app, so that the report cache, the incremental
+    usage map, the compiled calculators and the cached responses survive between requests (and can be warmed up by the
+    refresh worker).
+
+    Decision #2: The container is fully built before the app serves a request and its services are never replaced
+    afterwards (only `usage_snapshot` is, by a single assignment), so sync endpoints in the threadpool and async code on
+    the event loop always see the same instances without locking here. Each service guards its own mutable state.
+
+    Decision #3: With a shared cache (see billing.shared_cache) the report cache and the cached responses are also
+    shared with the other workers on the host, the rest of the state is per process.
+
+    Decision #4: Tests swap in mocks by setting attributes on a container and overriding `get_container` with
+    `app.dependency_overrides`, rather than patching module globals.
+    """
+
+    def __init__(
+        self,
+        transport: Transport,
+        billing_parameters_service: BillingParametersService,
+        usage_response_cache: ResponseCache,
+        shadow_sample_rate: float = 0.0,
+        tracer: Tracer | None = None,
+        shared_cache: SharedCache | None = None,
+        usage_store: UsageStore | None = None,
+    ) -> None:
+        self.transport = transport
+        self.tracer = tracer or Tracer()
+        self.message_service = MessageService(transport=transport, tracer=self.tracer)
+        self.report_service = ReportService(
+            transport=transport,
+            tracer=self.tracer,
+            max_concurrency=REPORT_FETCH_CONCURRENCY,
+            shared_cache=shared_cache,
+        )
+        self.billing_parameters_service = billing_parameters_service
+        # The usage service's own calculator uses the default parameters, customers with their own pricing pass theirs
+        # in.
+        self.usage_service = UsageService(
+            self.message_service,
+            self.report_service,
+            billing_parameters_service.get_calculator(),
+            incremental=True,
+            shadow_calculate_credits_service=(
+                FeatureCreditsService(billing_parameters_service.get_parameters()) if shadow_sample_rate else None
+            ),
+            shadow_sample_rate=shadow_sample_rate,
+            tracer=self.tracer,
+        )
+        self.pricing_simulation_service = PricingSimulationService(self.message_service, self.report_service)
+        self.usage_response_cache = usage_response_cache
+        # Bounds the /usage requests computing the usage at once, see billing.router._cached_response.
+        self.usage_admission = AdmissionController(USAGE_MAX_IN_FLIGHT, USAGE_MAX_QUEUED, USAGE_QUEUE_TIMEOUT_SECONDS)
+        # With a usage store, /usage reads the usage ingested by the ingestion service (which the lifespan starts).
+        self.usage_store = usage_store
+        self.ingestion_service = (
+            IngestionService(self.usage_service, usage_store, self.message_service, INGESTION_QUEUE_SIZE)
+            if usage_store is not None
+            else None
+        )
+        # The latest usage snapshot written by the refresh worker (possibly by a previous process), see
+        # billing.router.load_usage_snapshot.
+        self.usage_snapshot: UsageSnapshot | None = None
+
+    def close(self) -> None:
+        """Releases the report fetch threads and the upstream connections, on shutdown."""
+        self.report_service.close()
+        close_transport(self.transport)
+
+    @classmethod
+    def from_config(cls) -> Self:
+        """The container configured by billing/constants.py (and so the environment)."""
+        shared_cache = SharedCache(Path(SHARED_CACHE_PATH), SHARED_CACHE_MAX_BYTES) if SHARED_CACHE_PATH else None
+        return cls(
+            transport=build_transport(),
+            billing_parameters_service=BillingParametersService(
+                DEFAULT_BILLING_PARAMETERS, Path(BILLING_PARAMETERS_PATH) if BILLING_PARAMETERS_PATH else None
+            ),
+            usage_response_cache=ResponseCache(
+                max_bytes=USAGE_CACHE_LOCAL_MAX_BYTES if shared_cache is not None else USAGE_CACHE_MAX_BYTES,
+                ttl_seconds=USAGE_CACHE_TTL_SECONDS,
+                stale_seconds=USAGE_CACHE_STALE_SECONDS,
+                shared=shared_cache,
+            ),
+            shadow_sample_rate=SHADOW_SAMPLE_RATE,
+            tracer=Tracer(FileSpanExporter(Path(TRACE_EXPORT_PATH)), TRACE_SAMPLE_RATE) if TRACE_EXPORT_PATH else None,
+            shared_cache=shared_cache,
+            usage_store=UsageStore(Path(USAGE_STORE_PATH)) if USAGE_STORE_PATH else None,
+        )
+
+
+def get_container(request: Request) -> ServiceContainer:
+    """FastAPI dependency for the app's container, see ServiceContainer."""
+    container: ServiceContainer = request.app.state.container
+    return container
@@ -1,3 +1,4 @@
+import hashlib
 from dataclasses import dataclass
 from decimal import Decimal
 from functools import total_ordering
@@ -126,3 +127,12 @@ class BillingParameters:
                 getattr(self, attr), Credit
             ):
                 raise TypeError(f"{attr} must be of type Credit")
+
+    def fingerprint(self) -> str:
+        """
+        Decision: hash() isn't stable across processes, so I'm using a digest of the parameter values instead. This lets
+        the fingerprint be used as a cache key for anything derived from the parameters (e.g. cached responses).
+        """
+        values = [f"{attr}={getattr(self, attr)!r}" for attr in self.__annotations__]
+        values.append(f"VOWELS={sorted(self.VOWELS)!r}")
+        return hashlib.blake2b("|".join(values).encode(), digest_size=16).hexdigest()
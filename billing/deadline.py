@@ -0,0 +1,45 @@
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Self
+
+from billing.constants import UPSTREAM_TIMEOUT_SECONDS
+
+
+@dataclass(frozen=True, slots=True)
+class Deadline:
+    """
+    The time by which a request has to be answered. It's passed down to every upstream call, so no call can wait past
+    it (see upstream_timeout), and work which isn't finished by then is reported as pending instead.
+    """
+
+    expires_at: float
+    clock: Callable[[], float] = time.monotonic
+
+    @classmethod
+    def after(cls, seconds: float, clock: Callable[[], float] = time.monotonic) -> Self:
+        return cls(expires_at=clock() + seconds, clock=clock)
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - self.clock())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() == 0
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def upstream_timeout(deadline: Deadline | None) -> float:
+    """
+    The timeout for an upstream call: the default, or less if the deadline is sooner. Raises DeadlineExceeded if the
+    deadline has already passed, rather than making a call which can't finish in time.
+    """
+    if deadline is None:
+        return UPSTREAM_TIMEOUT_SECONDS
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        raise DeadlineExceeded()
+    return min(UPSTREAM_TIMEOUT_SECONDS, remaining)
@@ -0,0 +1,161 @@
+"""
+Memory profiling of a single /usage request, to see how much it allocates and where, broken down by pipeline stage.
+
+Decision #1: tracemalloc, as it's in the standard library and can be switched on for one request in a running process.
+It's off the rest of the time, as tracing every allocation makes Python several times slower.
+
+Decision #2: The stages are the tracer's spans (see billing.tracing), plus any marked with `memory_stage`, so a profile
+breaks down the same way as a trace without instrumenting the pipeline twice. A stage's numbers include its children's.
+
+Decision #3: tracemalloc is process wide, so one profile runs at a time and the allocations of other threads in the
+meantime are counted in the current stage. Stages entered in other threads (e.g. the concurrent report fetches) are
+counted in the stage which started them rather than on their own, as their peaks would overlap. For clean numbers,
+profile on a worker which isn't serving other requests.
+"""
+
+import contextvars
+import threading
+import tracemalloc
+from collections.abc import Iterator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from dataclasses import dataclass, field
+
+from billing.constants import MEMORY_PROFILE_TOP_SITES
+from billing.schemas import AllocationSite, MemoryProfileReport, MemoryStage
+
+# The profiler's own snapshots aren't allocations of the pipeline.
+_SNAPSHOT_FILTERS = [tracemalloc.Filter(False, tracemalloc.__file__)]
+_NO_STAGE = nullcontext()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+@dataclass(slots=True)
+class _StageTotals:
+    calls: int = 0
+    allocated_bytes: int = 0
+    peak_bytes: int = 0
+    # location -> [size_bytes, count]
+    sites: dict[str, list[int]] = field(default_factory=dict)
+
+
+@dataclass(slots=True)
+class _OpenStage:
+    path: str
+    start_bytes: int
+    # The most traced memory seen so far. tracemalloc only keeps one peak, which each child stage resets.
+    peak_bytes: int
+    snapshot: tracemalloc.Snapshot
+
+
+def _take_snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+
+class MemoryProfile:
+    """The allocations of each stage of a profile, see `profile_memory`."""
+
+    def __init__(self, top_sites: int = MEMORY_PROFILE_TOP_SITES) -> None:
+        self._thread_id = threading.get_ident()
+        self._top_sites = top_sites
+        self._stack: list[_OpenStage] = []
+        self._totals: dict[str, _StageTotals] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        if threading.get_ident() != self._thread_id:
+            yield
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        parent = self._stack[-1] if self._stack else None
+        if parent is not None:
+            parent.peak_bytes = max(parent.peak_bytes, peak)
+        stage = _OpenStage(f"{parent.path}/{name}" if parent else name, current, current, _take_snapshot())
+        # Added on entry so the report lists the stages in the order they started.
+        self._totals.setdefault(stage.path, _StageTotals())
+        self._stack.append(stage)
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            self._end_stage(stage)
+
+    def report(self, view: str) -> MemoryProfileReport:
+        stages = [
+            MemoryStage(
+                stage=path,
+                calls=totals.calls,
+                allocated_bytes=totals.allocated_bytes,
+                peak_bytes=totals.peak_bytes,
+                top_allocations=[
+                    AllocationSite(location=location, size_bytes=size, count=count)
+                    for location, (size, count) in sorted(
+                        totals.sites.items(), key=lambda item: item[1][0], reverse=True
+                    )[: self._top_sites]
+                ],
+            )
+            for path, totals in self._totals.items()
+        ]
+        root = stages[0] if stages else None
+        return MemoryProfileReport(
+            view=view,
+            peak_bytes=root.peak_bytes if root else 0,
+            allocated_bytes=root.allocated_bytes if root else 0,
+            stages=stages,
+        )
+
+    def _end_stage(self, stage: _OpenStage) -> None:
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(stage.peak_bytes, peak)
+        totals = self._totals[stage.path]
+        totals.calls += 1
+        totals.allocated_bytes += current - stage.start_bytes
+        totals.peak_bytes = max(totals.peak_bytes, peak - stage.start_bytes)
+        for diff in _take_snapshot().compare_to(stage.snapshot, "lineno"):
+            if diff.size_diff <= 0:
+                continue
+            frame = diff.traceback[0]
+            site = totals.sites.setdefault(f"{frame.filename}:{frame.lineno}", [0, 0])
+            site[0] += diff.size_diff
+            site[1] += diff.count_diff
+        if self._stack:
+            self._stack[-1].peak_bytes = max(self._stack[-1].peak_bytes, peak)
+        tracemalloc.reset_peak()
+
+
+_current_profile: contextvars.ContextVar[MemoryProfile | None] = contextvars.ContextVar("memory_profile", default=None)
+_profile_lock = threading.Lock()
+
+
+@contextmanager
+def profile_memory(name: str, top_sites: int = MEMORY_PROFILE_TOP_SITES) -> Iterator[MemoryProfile]:
+    """
+    Profiles the enclosed block as a stage called `name`, with the stages inside it. Raises ProfilerBusy if another
+    profile is running.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy()
+    started = not tracemalloc.is_tracing()
+    try:
+        if started:
+            tracemalloc.start()
+        profile = MemoryProfile(top_sites)
+        token = _current_profile.set(profile)
+        try:
+            with profile.stage(name):
+                yield profile
+        finally:
+            _current_profile.reset(token)
+    finally:
+        if started:
+            tracemalloc.stop()
+        _profile_lock.release()
+
+
+def memory_stage(name: str) -> AbstractContextManager[None]:
+    """Marks the enclosed block as a stage of the current profile. Costs a context variable lookup without one."""
+    profile = _current_profile.get()
+    return profile.stage(name) if profile is not None else _NO_STAGE
@@ -1,13 +1,38 @@
 import logging
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import Annotated
 
-from fastapi import APIRouter
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Response
 
-from billing.constants import DEFAULT_BILLING_PARAMETERS
-from billing.schemas import UsageResponse
+from billing.admission import Overloaded
+from billing.cache import CachedResponse, CacheStatus
+from billing.compression import compress_body, negotiate_encoding
+from billing.constants import (
+    MEMORY_PROFILING_ENABLED,
+    USAGE_BILL_PENDING_REPORTS,
+    USAGE_DEADLINE_SECONDS,
+    USAGE_RETRY_AFTER_SECONDS,
+    USAGE_SNAPSHOT_PATH,
+)
+from billing.container import ServiceContainer, get_container
+from billing.deadline import Deadline
+from billing.memory_profiling import ProfilerBusy, memory_stage, profile_memory
+from billing.schemas import (
+    IngestionRequest,
+    IngestionResponse,
+    SimulationRequest,
+    SimulationResponse,
+    SimulationResult,
+    UsageResponse,
+    UsageSummary,
+)
 from billing.services.credit_calculation_service import CalculateCreditsService
-from billing.services.messages_service import MessageService
-from billing.services.reports_service import ReportService
-from billing.services.usage_service import UsageService
+from billing.services.usage_service import summarise_usage
+from billing.snapshot import UsageSnapshot, write_usage_snapshot
+from billing.tracing import Span
+from billing.usage_store import UsageStore
 
 logger = logging.getLogger(__name__)
 
@@ -15,17 +40,317 @@ router = APIRouter(
     tags=["billing"],
 )
 
+Container = Annotated[ServiceContainer, Depends(get_container)]
+
+
+def _stored_usage(container: ServiceContainer, calculator: CalculateCreditsService) -> UsageStore | None:
+    """
+    The usage store, if there is one and it has been backfilled with this pricing (i.e. the default pricing, as of this
+    deploy). Otherwise the usage is computed from the upstream.
+    """
+    store = container.usage_store
+    if store is None or not store.is_backfilled(calculator.fingerprint):
+        return None
+    return store
+
+
+def _build_usage(
+    container: ServiceContainer, calculator: CalculateCreditsService, deadline: Deadline | None
+) -> UsageResponse:
+    if (store := _stored_usage(container, calculator)) is not None:
+        return UsageResponse(usage=list(store.iter_entries(calculator.fingerprint)))
+    # NOTE: The customer only determines the pricing for now. In the real-world scenario we would also only return the
+    # usage for that customer's messages.
+    return container.usage_service.get_usage(calculator, deadline, USAGE_BILL_PENDING_REPORTS)
+
+
+def _build_usage_summary(
+    container: ServiceContainer, calculator: CalculateCreditsService, deadline: Deadline | None
+) -> UsageSummary:
+    if (store := _stored_usage(container, calculator)) is not None:
+        return summarise_usage(store.iter_entries(calculator.fingerprint))
+    return container.usage_service.get_usage_summary(calculator, deadline, USAGE_BILL_PENDING_REPORTS)
+
+
+def _fetch_version(
+    container: ServiceContainer, calculator: CalculateCreditsService, deadline: Deadline | None = None
+) -> str | None:
+    if (store := _stored_usage(container, calculator)) is not None:
+        return store.version()
+    return container.message_service.fetch_version(deadline)
+
+
+# Each cached view of the usage and how to compute it. The refresh worker keeps the default pricing's views warm.
+USAGE_VIEWS: dict[
+    str, Callable[[ServiceContainer, CalculateCreditsService, Deadline | None], UsageResponse | UsageSummary]
+] = {
+    "usage": _build_usage,
+    "usage-summary": _build_usage_summary,
+}
+# The same views served from a usage snapshot instead of the upstream.
+SNAPSHOT_VIEWS: dict[str, Callable[[UsageSnapshot], bytes]] = {
+    "usage": lambda snapshot: (
+        UsageResponse(usage=list(snapshot.iter_usage_entries())).model_dump_json(exclude_none=True).encode()
+    ),
+    "usage-summary": lambda snapshot: snapshot.summary().model_dump_json().encode(),
+}
+
+
+def _cache_key(view: str, calculator: CalculateCreditsService) -> str:
+    # Keyed on the pricing rather than the customer, so customers with the same parameters share cached responses.
+    return f"{view}:{calculator.fingerprint}"
+
+
+def _compute_response(
+    container: ServiceContainer,
+    view: str,
+    calculator: CalculateCreditsService,
+    version: str | None,
+    deadline: Deadline | None = None,
+) -> CachedResponse:
+    """Computes the view's response, caching it unless it's incomplete (which can only happen with a deadline)."""
+    with memory_stage("build_response"):
+        result = USAGE_VIEWS[view](container, calculator, deadline)
+    with container.tracer.span("encode_response"):
+        body = result.model_dump_json(exclude_none=True).encode()
+    with container.tracer.span("compress_response"):
+        encoded_bodies = compress_body(body)
+    if not result.complete:
+        return CachedResponse(
+            body=body, version=version, created_at=time.monotonic(), complete=False, encoded_bodies=encoded_bodies
+        )
+    return container.usage_response_cache.set(_cache_key(view, calculator), body, version, encoded_bodies)
+
+
+def refresh_usage_response(
+    container: ServiceContainer, view: str, calculator: CalculateCreditsService | None = None
+) -> None:
+    """
+    Brings the cached response for a view up to date, only recomputing it if the messages payload has changed. Used
+    both to revalidate stale responses and by the refresh worker.
+    """
+    calculator = calculator or container.billing_parameters_service.get_calculator()
+    cache_key = _cache_key(view, calculator)
+    with container.tracer.span("refresh_usage_response", view=view) as span:
+        cached, _ = container.usage_response_cache.lookup(cache_key)
+        # The version is fetched before the messages, so if the upstream changes in between we store the new usage
+        # under the old version and the next refresh recomputes it (rather than serving old usage under a new version).
+        version = _fetch_version(container, calculator)
+        recompute = cached is None or version is None or version != cached.version
+        if span:
+            span.set_attribute("recomputed", recompute)
+        if recompute:
+            _compute_response(container, view, calculator, version)
+        else:
+            container.usage_response_cache.touch(cache_key)
+
+
+def refresh_usage_responses(container: ServiceContainer) -> None:
+    for view in USAGE_VIEWS:
+        refresh_usage_response(container, view)
+    if USAGE_SNAPSHOT_PATH:
+        _refresh_usage_snapshot(container, Path(USAGE_SNAPSHOT_PATH))
+
+
+def load_usage_snapshot(container: ServiceContainer) -> None:
+    """Maps the snapshot left by a previous process (if there is one), so a cold process can serve it straight away."""
+    if not USAGE_SNAPSHOT_PATH or not Path(USAGE_SNAPSHOT_PATH).exists():
+        return
+    try:
+        container.usage_snapshot = UsageSnapshot.open(Path(USAGE_SNAPSHOT_PATH))
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable usage snapshot: {str(e)}")
+
+
+def _refresh_usage_snapshot(container: ServiceContainer, path: Path) -> None:
+    default_calculator = container.billing_parameters_service.get_calculator()
+    cached, _ = container.usage_response_cache.lookup(_cache_key("usage", default_calculator))
+    version = cached.version if cached is not None else None
+    snapshot = container.usage_snapshot
+    if (
+        snapshot is not None
+        and version is not None
+        and snapshot.version == version
+        and snapshot.fingerprint == default_calculator.fingerprint
+    ):
+        return
+    # NOTE: Without a usage store this fetches the messages again, but it only happens when the upstream has changed and
+    # with the incremental usage service nothing is recalculated.
+    store = _stored_usage(container, default_calculator)
+    entries = (
+        store.iter_entries(default_calculator.fingerprint)
+        if store is not None
+        else container.usage_service.iter_usage_entries()
+    )
+    try:
+        write_usage_snapshot(path, entries, default_calculator.fingerprint, version)
+    except ValueError as e:
+        # Skipped rather than failing the refresh, the snapshot is only a head start for cold processes.
+        logger.warning(f"Not writing a usage snapshot: {str(e)}")
+        return
+    # The previous mapping isn't closed as a request could still be reading from it, it's released once unreferenced.
+    container.usage_snapshot = UsageSnapshot.open(path)
+
 
-@router.get("/usage", response_model_exclude_none=True)
-def get_usage() -> UsageResponse:
+def _revalidate_usage_response(container: ServiceContainer, view: str, calculator: CalculateCreditsService) -> None:
+    try:
+        refresh_usage_response(container, view, calculator)
+    except Exception as e:
+        # The stale response has already been served, the next request will try again.
+        logger.error(f"Error revalidating {view} response: {str(e)}")
+    finally:
+        container.usage_response_cache.finish_revalidation(_cache_key(view, calculator))
+
+
+def _admitted_response(
+    container: ServiceContainer,
+    view: str,
+    calculator: CalculateCreditsService,
+    span: Span | None,
+    deadline: Deadline | None,
+) -> tuple[CachedResponse, CacheStatus]:
+    """
+    Computes the response for a cache miss once admitted by the admission controller, raising a 503 if the request is
+    shed. Only misses go through admission control, so requests served from the cache are never queued or shed. The
+    deadline (from the request's arrival) bounds both the wait to be admitted and the computation.
+    """
+    try:
+        with container.usage_admission.admit(deadline):
+            # A request which waited in the queue may find the response computed by one of the requests ahead of it.
+            cached, status = container.usage_response_cache.lookup(_cache_key(view, calculator))
+            if cached is not None:
+                return cached, status
+            version = _fetch_version(container, calculator, deadline)
+            return _compute_response(container, view, calculator, version, deadline), CacheStatus.MISS
+    except Overloaded:
+        if span:
+            span.set_attribute("cache", "shed")
+        raise _shed_error()
+
+
+def _shed_error() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Too many usage requests, retry later",
+        headers={"Retry-After": str(USAGE_RETRY_AFTER_SECONDS)},
+    )
+
+
+def _memory_profiled_response(container: ServiceContainer, view: str, customer_id: str | None) -> Response:
+    """
+    Computes the view with its memory profiled (see billing.memory_profiling) and returns the profile instead of the
+    usage. The view is always computed rather than served from the cache, as a cache hit allocates next to nothing, but
+    it's still admitted like any other computation.
+    """
+    calculator = container.billing_parameters_service.get_calculator(customer_id)
+    try:
+        with container.usage_admission.admit(), profile_memory(view) as profile:
+            _compute_response(container, view, calculator, _fetch_version(container, calculator))
+    except Overloaded:
+        raise _shed_error()
+    except ProfilerBusy:
+        raise HTTPException(status_code=409, detail="A memory profile is already running, retry later")
+    return Response(content=profile.report(view).model_dump_json(), media_type="application/json")
+
+
+def _cached_response(
+    container: ServiceContainer,
+    view: str,
+    customer_id: str | None,
+    background_tasks: BackgroundTasks,
+    accept_encoding: str | None,
+    memory_profile: bool = False,
+) -> Response:
+    # The header is ignored unless profiling is enabled, see billing/constants.py.
+    if memory_profile and MEMORY_PROFILING_ENABLED:
+        return _memory_profiled_response(container, view, customer_id)
+    cache = container.usage_response_cache
+    # Started on arrival, so time spent queued for admission counts against it.
+    deadline = Deadline.after(USAGE_DEADLINE_SECONDS) if USAGE_DEADLINE_SECONDS is not None else None
+    with container.tracer.span(view, customer_id=customer_id or "") as span:
+        calculator = container.billing_parameters_service.get_calculator(customer_id)
+        cache_key = _cache_key(view, calculator)
+        cached, status = cache.lookup(cache_key)
+        snapshot = container.usage_snapshot
+        # The snapshot is only served for the pricing it was computed with (the default pricing, as of when it was written).
+        if cached is None and snapshot is not None and calculator.fingerprint == snapshot.fingerprint:
+            # Serve the snapshot as a stale response, revalidation only recomputes it if the upstream has since changed.
+            body = SNAPSHOT_VIEWS[view](snapshot)
+            cached = cache.set(cache_key, body, snapshot.version, compress_body(body))
+            status = CacheStatus.STALE
+        if cached is None:
+            cached, status = _admitted_response(container, view, calculator, span, deadline)
+        # An incomplete response isn't cached, so the complete one is computed in the background for the next request.
+        revalidate = status is CacheStatus.STALE or not cached.complete
+        if revalidate and cache.start_revalidation(cache_key):
+            background_tasks.add_task(_revalidate_usage_response, container, view, calculator)
+        if span:
+            span.set_attribute("cache", str(status))
+
+    return _encoded_response(cached, status, accept_encoding)
+
+
+def _encoded_response(cached: CachedResponse, status: CacheStatus, accept_encoding: str | None) -> Response:
+    headers = {"X-Cache": str(status)}
+    body = cached.body
+    if cached.encoded_bodies:
+        headers["Vary"] = "Accept-Encoding"
+    encoding = negotiate_encoding(accept_encoding, cached.encoded_bodies)
+    if encoding is not None:
+        body = cached.encoded_bodies[encoding]
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@router.get("/usage", response_model=UsageResponse, response_model_exclude_none=True)
+def get_usage(
+    container: Container,
+    background_tasks: BackgroundTasks,
+    customer_id: str | None = None,
+    accept_encoding: Annotated[str | None, Header()] = None,
+    x_memory_profile: Annotated[bool, Header()] = False,
+) -> Response:
     """
     Decision: I'm not adding authentication for this endpoint but it should be added in a real-world scenario.
     """
-    reports_service = ReportService()
-    message_service = MessageService()
-    # NOTE: Could get parameters for a specific customer here if needed in real-world scenario.
-    credit_calculation_service = CalculateCreditsService(DEFAULT_BILLING_PARAMETERS)
-    usage_service = UsageService(message_service, reports_service, credit_calculation_service)
-    # NOTE: In the real-world scenario could pass a customerid to the get_usage method and only return usage for that
-    # customer.
-    return usage_service.get_usage()
+    return _cached_response(container, "usage", customer_id, background_tasks, accept_encoding, x_memory_profile)
+
+
+@router.get("/usage/summary", response_model=UsageSummary)
+def get_usage_summary(
+    container: Container,
+    background_tasks: BackgroundTasks,
+    customer_id: str | None = None,
+    accept_encoding: Annotated[str | None, Header()] = None,
+    x_memory_profile: Annotated[bool, Header()] = False,
+) -> Response:
+    """
+    Totals for the period, for consumers which don't need every entry. Computed in a single pass over the same
+    pipeline as /usage without building the list of entries.
+    """
+    return _cached_response(
+        container, "usage-summary", customer_id, background_tasks, accept_encoding, x_memory_profile
+    )
+
+
+@router.post("/messages", status_code=202)
+def ingest_messages(container: Container, request: IngestionRequest) -> IngestionResponse:
+    """
+    Push ingestion: the messages are priced in the background and appended to the stored usage (see IngestionService),
+    so they show up in /usage shortly after. Re-sending a message replaces its entry.
+    """
+    if container.ingestion_service is None:
+        raise HTTPException(status_code=404, detail="Message ingestion is not enabled")
+    if not container.ingestion_service.submit(request.messages):
+        raise HTTPException(status_code=503, detail="Ingestion queue is full", headers={"Retry-After": "1"})
+    return IngestionResponse(accepted=len(request.messages))
+
+
+@router.post("/usage/simulations")
+def simulate_pricing(container: Container, request: SimulationRequest) -> SimulationResponse:
+    """
+    What-if pricing: the total credits for the current period under each of the given parameter sets, in order.
+    """
+    parameter_sets = [parameters.to_billing_parameters() for parameters in request.parameter_sets]
+    totals = container.pricing_simulation_service.simulate(parameter_sets)
+    return SimulationResponse(results=[SimulationResult(total_credits=float(total.amount)) for total in totals])
@@ -1,4 +1,20 @@
-from pydantic import BaseModel
+from decimal import Decimal
+from enum import StrEnum
+from typing import Annotated
+
+from pydantic import BaseModel, Field
+
+from billing.dataclasses import BillingParameters, Credit
+from billing.models import Message
+
+FiniteDecimal = Annotated[Decimal, Field(allow_inf_nan=False)]
+
+
+class UsageEntryStatus(StrEnum):
+    # The message's report wasn't resolved by the request's deadline, credits_used is 0 until it is.
+    PENDING = "pending"
+    # The message's report wasn't resolved by the request's deadline, credits_used is calculated from the text instead.
+    ESTIMATED = "estimated"
 
 
 class UsageEntry(BaseModel):
@@ -6,7 +22,94 @@ class UsageEntry(BaseModel):
     timestamp: str
     report_name: str | None = None
     credits_used: float
+    # Only set for entries which aren't final, see UsageEntryStatus.
+    status: UsageEntryStatus | None = None
 
 
 class UsageResponse(BaseModel):
     usage: list[UsageEntry]
+    # False if any entry is pending or estimated, see USAGE_DEADLINE_SECONDS.
+    complete: bool = True
+
+
+class UsageSummary(BaseModel):
+    complete: bool = True
+    total_credits: float
+    message_count: int
+    credits_by_report: dict[str, float]
+    message_count_by_report: dict[str, int]
+    credits_by_day: dict[str, float]
+
+
+class BillingParametersSchema(BaseModel):
+    # Constrained like BillingParameters.__post_init__, so invalid parameters are rejected as a 422 rather than failing
+    # once they're converted.
+    base_credit_cost: FiniteDecimal
+    char_credit_cost: FiniteDecimal
+    length_penalty_threshold: int = Field(ge=0)
+    one_to_three_word_length_cost: FiniteDecimal
+    four_to_seven_word_length_cost: FiniteDecimal
+    eight_plus_word_length_cost: FiniteDecimal
+    length_penalty_credits: FiniteDecimal
+    unique_words_bonus: FiniteDecimal
+    palindrome_multiplier: int = Field(ge=0)
+    vowel_cost: FiniteDecimal
+
+    def to_billing_parameters(self) -> BillingParameters:
+        return BillingParameters(
+            BASE_CREDIT_COST=Credit(amount=self.base_credit_cost),
+            CHAR_CREDIT_COST=Credit(amount=self.char_credit_cost),
+            LENGTH_PENALTY_THRESHOLD=self.length_penalty_threshold,
+            ONE_TO_THREE_WORD_LENGTH_COST=Credit(amount=self.one_to_three_word_length_cost),
+            FOUR_TO_SEVEN_WORD_LENGTH_COST=Credit(amount=self.four_to_seven_word_length_cost),
+            EIGHT_PLUS_WORD_LENGTH_COST=Credit(amount=self.eight_plus_word_length_cost),
+            LENGTH_PENALTY_CREDITS=Credit(amount=self.length_penalty_credits),
+            UNIQUE_WORDS_BONUS=Credit(amount=self.unique_words_bonus),
+            PALINDROME_MULTIPLIER=self.palindrome_multiplier,
+            VOWEL_COST=Credit(amount=self.vowel_cost),
+        )
+
+
+class SimulationRequest(BaseModel):
+    # Bounded so a single request can't tie up a worker indefinitely.
+    parameter_sets: list[BillingParametersSchema] = Field(min_length=1, max_length=1000)
+
+
+class SimulationResult(BaseModel):
+    total_credits: float
+
+
+class SimulationResponse(BaseModel):
+    results: list[SimulationResult]
+
+
+class IngestionRequest(BaseModel):
+    # Bounded so a single request can't fill the ingestion queue.
+    messages: list[Message] = Field(min_length=1, max_length=1000)
+
+
+class IngestionResponse(BaseModel):
+    accepted: int
+
+
+class AllocationSite(BaseModel):
+    location: str
+    size_bytes: int
+    count: int
+
+
+class MemoryStage(BaseModel):
+    # The stage's path in the pipeline, e.g. "usage/build_response/fetch_messages". Each stage includes its children.
+    stage: str
+    calls: int
+    # Still allocated when the stage ended (summed over its calls), and the most allocated at once during a call.
+    allocated_bytes: int
+    peak_bytes: int
+    top_allocations: list[AllocationSite]
+
+
+class MemoryProfileReport(BaseModel):
+    view: str
+    peak_bytes: int
+    allocated_bytes: int
+    stages: list[MemoryStage]
@@ -0,0 +1,106 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from pathlib import Path
+
+from billing.dataclasses import BillingParameters
+from billing.schemas import BillingParametersSchema
+from billing.services.credit_calculation_service import CalculateCreditsService
+
+logger = logging.getLogger(__name__)
+
+
+class BillingParametersService:
+    """
+    Per-customer billing parameters, loaded from a JSON config file of the form
+    {"customers": {"<customer id>": {<BillingParametersSchema fields>}}}. Customers not in the file (or requests without
+    a customer) use the default parameters.
+
+    Decision #1: The file is hot-reloaded. At most every `reload_interval_seconds` its modification time is checked and
+    it's only re-read if it changed. If the new file is invalid the previous parameters are kept, so a bad edit can't
+    take billing down.
+
+    Decision #2: Calculators are cached by parameters fingerprint (bounded, least recently used evicted first), so
+    customers sharing pricing share a calculator and requests never pay for constructing or validating parameters. The
+    validation and fingerprinting happens once per reload instead.
+
+    Decision #3: A JSON file rather than a database, as that's all we need for now. Loading from SQLite (or anywhere
+    else) would only need a different _load.
+    """
+
+    def __init__(
+        self,
+        default_parameters: BillingParameters,
+        path: Path | None = None,
+        max_calculators: int = 1024,
+        reload_interval_seconds: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._default_parameters = default_parameters
+        self._default_fingerprint = default_parameters.fingerprint()
+        self._path = path
+        self._max_calculators = max_calculators
+        self._reload_interval_seconds = reload_interval_seconds
+        self._clock = clock
+        self._customer_parameters: dict[str, tuple[BillingParameters, str]] = {}
+        self._calculators: OrderedDict[str, CalculateCreditsService] = OrderedDict()
+        self._modified_at: int | None = None
+        self._next_reload_check = 0.0
+        self._lock = threading.Lock()
+        self._reload_if_changed()
+
+    def get_parameters(self, customer_id: str | None = None) -> BillingParameters:
+        return self._resolve(customer_id)[0]
+
+    def get_calculator(self, customer_id: str | None = None) -> CalculateCreditsService:
+        parameters, fingerprint = self._resolve(customer_id)
+        with self._lock:
+            calculator = self._calculators.get(fingerprint)
+            if calculator is not None:
+                self._calculators.move_to_end(fingerprint)
+                return calculator
+            calculator = CalculateCreditsService(parameters)
+            self._calculators[fingerprint] = calculator
+            if len(self._calculators) > self._max_calculators:
+                self._calculators.popitem(last=False)
+            return calculator
+
+    def _resolve(self, customer_id: str | None) -> tuple[BillingParameters, str]:
+        self._reload_if_changed()
+        if customer_id is not None and customer_id in self._customer_parameters:
+            return self._customer_parameters[customer_id]
+        return self._default_parameters, self._default_fingerprint
+
+    def _reload_if_changed(self) -> None:
+        if self._path is None or self._clock() < self._next_reload_check:
+            return
+        with self._lock:
+            self._next_reload_check = self._clock() + self._reload_interval_seconds
+            try:
+                modified_at: int | None = self._path.stat().st_mtime_ns
+            except FileNotFoundError:
+                modified_at = None
+            if modified_at == self._modified_at:
+                return
+            self._modified_at = modified_at
+
+        try:
+            customer_parameters = self._load(self._path) if modified_at is not None else {}
+        except Exception as e:
+            logger.error(f"Error loading billing parameters from {self._path}, keeping the previous ones: {str(e)}")
+            return
+        # Swapping the whole dict means readers see either the old or the new parameters, never a mix.
+        self._customer_parameters = customer_parameters
+        logger.info(f"Loaded billing parameters for {len(customer_parameters)} customers")
+
+    @staticmethod
+    def _load(path: Path) -> dict[str, tuple[BillingParameters, str]]:
+        data = json.loads(path.read_text(encoding="utf-8"))
+        customer_parameters = {}
+        for customer_id, raw_parameters in data["customers"].items():
+            parameters = BillingParametersSchema(**raw_parameters).to_billing_parameters()
+            customer_parameters[customer_id] = (parameters, parameters.fingerprint())
+        return customer_parameters
@@ -1,5 +1,113 @@
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from enum import StrEnum
+from functools import cached_property
+
 from billing.dataclasses import BillingParameters, Credit
-from billing.utils import get_valid_words
+from billing.utils import count_third_position_chars, is_alnum_palindrome, iter_valid_words
+
+# Remember to always return at least 1 credit
+MINIMUM_CREDITS = Credit.from_int(1)
+
+# Decision: Part of every calculator's fingerprint, bump it whenever a rule's pricing changes (rather than its
+# parameters), so prices kept with the fingerprint (e.g. the usage store, the shared cache) aren't served after a deploy.
+RULES_VERSION = 1
+
+
+@dataclass(frozen=True, slots=True)
+class WordStats:
+    """The valid words of a text as the word rules see them: counted by length, and whether any is repeated."""
+
+    one_to_three_letter_words: int
+    four_to_seven_letter_words: int
+    eight_plus_letter_words: int
+    has_unique_words: bool
+
+
+class TextFeatures:
+    """
+    The features of a text which the rules read. Each one is computed the first time a rule asks for it and then shared,
+    so e.g. the text is only split into words once however many rules look at the words.
+
+    Decision #1: The features the rules read are computed in a single pass without keeping a copy of the text (or a list
+    of its words). The exception is checking the words are unique, which has to remember the words seen so far until
+    the first repeated word. In real text that comes early, but in the worst case (every word unique) it's a set of
+    every word, i.e. memory proportional to the text.
+    """
+
+    def __init__(self, text: str, vowels: set[str] = BillingParameters.VOWELS) -> None:
+        self.text = text
+        self._vowels = vowels
+
+    @cached_property
+    def length(self) -> int:
+        return len(self.text)
+
+    @cached_property
+    def word_stats(self) -> WordStats:
+        # Assumption: Only consider valid words when checking for uniqueness, not the entire text.
+        short = medium = long = 0
+        # The words seen so far, dropped at the first repeat as the words can no longer be unique.
+        seen: set[str] | None = set()
+        has_words = False
+        for word in iter_valid_words(self.text):
+            has_words = True
+            if len(word) <= 3:
+                short += 1
+            elif len(word) <= 7:
+                medium += 1
+            else:
+                long += 1
+            if seen is not None:
+                if word in seen:
+                    seen = None
+                else:
+                    seen.add(word)
+        return WordStats(short, medium, long, has_unique_words=has_words and seen is not None)
+
+    @cached_property
+    def third_position_vowels(self) -> int:
+        return count_third_position_chars(self.text, self._vowels)
+
+    @cached_property
+    def is_palindrome(self) -> bool:
+        return is_alnum_palindrome(self.text)
+
+
+def _character_count_credits(features: TextFeatures, parameters: BillingParameters) -> Credit:
+    return parameters.CHAR_CREDIT_COST * features.length
+
+
+def _word_length_credits(features: TextFeatures, parameters: BillingParameters) -> Credit:
+    # Decimal arithmetic is exact, so pricing each length bucket at once gives the same result as pricing word by word.
+    stats = features.word_stats
+    return (
+        parameters.ONE_TO_THREE_WORD_LENGTH_COST * stats.one_to_three_letter_words
+        + parameters.FOUR_TO_SEVEN_WORD_LENGTH_COST * stats.four_to_seven_letter_words
+        + parameters.EIGHT_PLUS_WORD_LENGTH_COST * stats.eight_plus_letter_words
+    )
+
+
+def _length_penalty_credits(features: TextFeatures, parameters: BillingParameters) -> Credit:
+    if features.length > parameters.LENGTH_PENALTY_THRESHOLD:
+        return parameters.LENGTH_PENALTY_CREDITS
+    return Credit.zero()
+
+
+def _unique_words_credits(features: TextFeatures, parameters: BillingParameters) -> Credit:
+    if features.word_stats.has_unique_words:
+        return parameters.UNIQUE_WORDS_BONUS
+    return Credit.zero()
+
+
+def _vowels_credits(features: TextFeatures, parameters: BillingParameters) -> Credit:
+    return parameters.VOWEL_COST * features.third_position_vowels
+
+
+def _palindrome_multiplier(features: TextFeatures, parameters: BillingParameters) -> int:
+    if features.is_palindrome:
+        return parameters.PALINDROME_MULTIPLIER
+    return 1
 
 
 def character_count_rule(text: str, parameters: BillingParameters) -> Credit:
@@ -7,54 +115,106 @@ def character_count_rule(text: str, parameters: BillingParameters) -> Credit:
     Assumption: It says each "character", so I'm assuming it's counting spaces and punctuation as well. Same applies
     to the other rules that count characters.
     """
-    return parameters.CHAR_CREDIT_COST * len(text)
+    return _character_count_credits(TextFeatures(text, parameters.VOWELS), parameters)
 
 
 def word_length_multiplier_rule(text: str, parameters: BillingParameters) -> Credit:
-    credits = Credit.zero()
-    for word in get_valid_words(text):
-        if 1 <= len(word) <= 3:
-            credits += parameters.ONE_TO_THREE_WORD_LENGTH_COST
-        elif 4 <= len(word) <= 7:
-            credits += parameters.FOUR_TO_SEVEN_WORD_LENGTH_COST
-        else:
-            credits += parameters.EIGHT_PLUS_WORD_LENGTH_COST
-
-    return credits
+    return _word_length_credits(TextFeatures(text, parameters.VOWELS), parameters)
 
 
 def length_penalty_rule(text: str, parameters: BillingParameters) -> Credit:
-    if len(text) > parameters.LENGTH_PENALTY_THRESHOLD:
-        return parameters.LENGTH_PENALTY_CREDITS
-    return Credit.zero()
+    return _length_penalty_credits(TextFeatures(text, parameters.VOWELS), parameters)
 
 
 def unique_words_bonus_rule(text: str, parameters: BillingParameters) -> Credit:
-    # Assumption: Only consider valid words when checking for uniqueness, not the entire text.
-    words = get_valid_words(text)
-    if len(words) > 0 and len(words) == len(set(words)):
-        return parameters.UNIQUE_WORDS_BONUS
-    return Credit.zero()
+    return _unique_words_credits(TextFeatures(text, parameters.VOWELS), parameters)
 
 
 def vowels_bonus_rule(text: str, parameters: BillingParameters) -> Credit:
-    credits = Credit.zero()
-    for i, char in enumerate(text):
-        if char in parameters.VOWELS and (i + 1) % 3 == 0:
-            credits += parameters.VOWEL_COST
-    return credits
+    return _vowels_credits(TextFeatures(text, parameters.VOWELS), parameters)
 
 
 def palindrome_bonus_rule(text: str, parameters: BillingParameters) -> int:
-    # Assumption: empty string are not considered palindromes
-    cleaned_text = "".join(c for c in text if c.isalnum()).lower()
-    if cleaned_text and cleaned_text == cleaned_text[::-1]:
-        return parameters.PALINDROME_MULTIPLIER
-    return 1
+    return _palindrome_multiplier(TextFeatures(text, parameters.VOWELS), parameters)
+
+
+class RuleKind(StrEnum):
+    ADD = "add"
+    SUBTRACT = "subtract"
+    MULTIPLY = "multiply"
+
+
+@dataclass(frozen=True, slots=True)
+class CreditRule:
+    """
+    A pricing rule. `cost` is its relative cost, cheaper rules are evaluated first (so a zero multiplier skips the rules
+    dearer than it). `is_noop` returns True when the parameters make the rule irrelevant (e.g. a zero cost), in which
+    case it is never evaluated. Multiply rules return an int, the others return Credit.
+    """
+
+    name: str
+    kind: RuleKind
+    apply: Callable[[TextFeatures, BillingParameters], Credit | int]
+    cost: int
+    is_noop: Callable[[BillingParameters], bool] = lambda parameters: False
+
+
+# Relative costs: constant time rules < a single scan of the text < tokenizing the text into words.
+DEFAULT_RULES: tuple[CreditRule, ...] = (
+    CreditRule(
+        name="character_count",
+        kind=RuleKind.ADD,
+        apply=_character_count_credits,
+        cost=1,
+        is_noop=lambda parameters: parameters.CHAR_CREDIT_COST == Credit.zero(),
+    ),
+    CreditRule(
+        name="length_penalty",
+        kind=RuleKind.ADD,
+        apply=_length_penalty_credits,
+        cost=1,
+        is_noop=lambda parameters: parameters.LENGTH_PENALTY_CREDITS == Credit.zero(),
+    ),
+    CreditRule(
+        name="vowels_bonus",
+        kind=RuleKind.ADD,
+        apply=_vowels_credits,
+        cost=10,
+        is_noop=lambda parameters: parameters.VOWEL_COST == Credit.zero(),
+    ),
+    CreditRule(
+        name="word_length_multiplier",
+        kind=RuleKind.ADD,
+        apply=_word_length_credits,
+        cost=20,
+        is_noop=lambda parameters: all(
+            cost == Credit.zero()
+            for cost in (
+                parameters.ONE_TO_THREE_WORD_LENGTH_COST,
+                parameters.FOUR_TO_SEVEN_WORD_LENGTH_COST,
+                parameters.EIGHT_PLUS_WORD_LENGTH_COST,
+            )
+        ),
+    ),
+    CreditRule(
+        name="unique_words_bonus",
+        kind=RuleKind.SUBTRACT,
+        apply=_unique_words_credits,
+        cost=20,
+        is_noop=lambda parameters: parameters.UNIQUE_WORDS_BONUS == Credit.zero(),
+    ),
+    CreditRule(
+        name="palindrome_bonus",
+        kind=RuleKind.MULTIPLY,
+        apply=_palindrome_multiplier,
+        cost=10,
+        is_noop=lambda parameters: parameters.PALINDROME_MULTIPLIER == 1,
+    ),
+)
 
 
 class CalculateCreditsService:
-    def __init__(self, parameters: BillingParameters) -> None:
+    def __init__(self, parameters: BillingParameters, rules: Iterable[CreditRule] = DEFAULT_RULES) -> None:
         """
         Decision #1: pass billing parameters as an argument instead of using a global variable. This makes the code more
         flexible and easier to test. As well as allowing different parameters for different customers.
@@ -68,17 +228,46 @@ class CalculateCreditsService:
         separation of concerns. It makes the rules easier to test and also easier to understand. If the rules were private
         methods on the class, it would be harder to test them individually. Again something I think the team would need to
         decide on in a real-world scenario.
+
+        Decision #4: The rules are a registry (see CreditRule) rather than hard-wired, so adding a pricing rule is a
+        matter of registering it. Rules read shared, lazily computed TextFeatures, so a new rule over existing features
+        doesn't add another pass over the text.
         """
         self.parameters = parameters
+        # Computed once so callers (e.g. caches) can identify the pricing without re-hashing the parameters.
+        self.fingerprint = f"{parameters.fingerprint()}-{RULES_VERSION}"
+        self._rules: list[CreditRule] = []
+        for rule in rules:
+            self.register_rule(rule)
+
+    @property
+    def rules(self) -> list[CreditRule]:
+        return list(self._rules)
+
+    def register_rule(self, rule: CreditRule) -> None:
+        # Rules which can't affect the result for these parameters are dropped up front rather than checked per text.
+        if rule.is_noop(self.parameters):
+            return
+        self._rules.append(rule)
+        # Cheapest first. Sorting is stable so ties keep their order.
+        self._rules.sort(key=lambda r: r.cost)
 
     def calculate_credits(self, text: str) -> Credit:
+        features = TextFeatures(text, self.parameters.VOWELS)
         credits = self.parameters.BASE_CREDIT_COST
-        credits += character_count_rule(text, self.parameters)
-        credits += word_length_multiplier_rule(text, self.parameters)
-        credits += vowels_bonus_rule(text, self.parameters)
-        credits += length_penalty_rule(text, self.parameters)
-        credits -= unique_words_bonus_rule(text, self.parameters)
-        credits *= palindrome_bonus_rule(text, self.parameters)
-
-        # Remember to always return at least 1 credit
-        return max(credits, Credit.from_int(1))
+        multiplier = 1
+
+        for rule in self._rules:
+            result = rule.apply(features, self.parameters)
+            if isinstance(result, int):
+                multiplier *= result
+                # Short-circuit: with a zero multiplier the result is the minimum whatever the other rules add up to.
+                if multiplier == 0:
+                    return MINIMUM_CREDITS
+            elif rule.kind is RuleKind.SUBTRACT:
+                credits -= result
+            else:
+                credits += result
+
+        credits *= multiplier
+        return max(credits, MINIMUM_CREDITS)
@@ -0,0 +1,135 @@
+import logging
+import queue
+import threading
+from collections.abc import Sequence
+
+from billing.models import Message
+from billing.services.messages_service import MessageService
+from billing.services.usage_service import UsageService
+from billing.usage_store import UsageStore
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionService:
+    """
+    Accepts messages as they happen and prices them off the request path: a background thread resolves their reports,
+    calculates their credits and appends them to the usage store, which /usage then reads.
+
+    Decision #1: A bounded in-process queue rather than a message broker, as that's all a single host needs for now.
+    `submit` refuses messages when the queue is full rather than blocking the request, so the caller can retry later.
+    Messages still queued when the process stops are lost, the producer is expected to retry anything which wasn't
+    stored (re-ingesting a message is idempotent).
+
+    Decision #2: Messages are priced in batches of up to `batch_size`, so their reports are resolved with one
+    fetch_reports call. A batch which fails (e.g. the reports API is down) is retried every `retry_seconds`, rather than
+    storing usage billed without its report. After `max_attempts` it's dropped and its message ids logged, so a batch
+    which can never succeed (e.g. a report the API always fails for) doesn't hold up the queue. Dropped messages have to
+    be submitted again.
+
+    Decision #3: If the store hasn't been backfilled with the usage service's pricing when the service starts (e.g. it's
+    new, or the pricing has changed since), the period's messages are fetched once from the messages API and ingested
+    first, then the store is marked backfilled. /usage is served from the upstream
+    until then, rather than from a store which only has the messages ingested since. Without a message service the
+    store is marked backfilled straight away, i.e. it's only meant to hold the ingested messages. If the backfill's
+    messages are dropped it isn't marked, and is tried again the next time the service starts.
+    """
+
+    def __init__(
+        self,
+        usage_service: UsageService,
+        usage_store: UsageStore,
+        message_service: MessageService | None = None,
+        max_queue_size: int = 10_000,
+        batch_size: int = 100,
+        retry_seconds: float = 5.0,
+        max_attempts: int = 5,
+    ) -> None:
+        self._usage_service = usage_service
+        self._usage_store = usage_store
+        self._message_service = message_service
+        self._queue: queue.Queue[Message] = queue.Queue(maxsize=max_queue_size)
+        self._batch_size = batch_size
+        self._retry_seconds = retry_seconds
+        self._max_attempts = max_attempts
+        self._submit_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def submit(self, messages: Sequence[Message]) -> bool:
+        """Queues the messages to be priced and stored. Returns False (queuing none of them) if there isn't room."""
+        # Submitting is serialized so a request's messages are queued all or nothing, the consumer can only make room.
+        with self._submit_lock:
+            if self._queue.maxsize - self._queue.qsize() < len(messages):
+                return False
+            for message in messages:
+                self._queue.put_nowait(message)
+        return True
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="ingestion-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def join(self) -> None:
+        """Blocks until every submitted message has been stored, for tests."""
+        self._queue.join()
+
+    def _run(self) -> None:
+        self._backfill()
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            batch = [first]
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._ingest(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _backfill(self) -> None:
+        fingerprint = self._usage_service.fingerprint
+        if self._usage_store.is_backfilled(fingerprint):
+            return
+        if self._message_service is None:
+            self._usage_store.mark_backfilled(fingerprint)
+            return
+        messages: list[Message] | None = None
+        while messages is None and not self._stop.is_set():
+            try:
+                messages = self._message_service.fetch_messages()
+            except Exception as e:
+                logger.error(f"Error fetching messages to backfill the usage store, retrying: {str(e)}")
+                self._stop.wait(self._retry_seconds)
+        if messages is not None and self._ingest(messages):
+            self._usage_store.mark_backfilled(fingerprint)
+
+    def _ingest(self, messages: Sequence[Message]) -> bool:
+        """Prices and stores the messages, returns False if they were dropped (or the service stopped first)."""
+        for attempt in range(1, self._max_attempts + 1):
+            if self._stop.is_set():
+                return False
+            try:
+                self._usage_store.append(self._usage_service.price_messages(messages), self._usage_service.fingerprint)
+                return True
+            except Exception as e:
+                logger.error(
+                    f"Error ingesting {len(messages)} messages (attempt {attempt}/{self._max_attempts}): {str(e)}"
+                )
+            if attempt < self._max_attempts:
+                self._stop.wait(self._retry_seconds)
+        message_ids = ", ".join(str(message.id) for message in messages)
+        logger.error(f"Dropping {len(messages)} messages after {self._max_attempts} attempts: {message_ids}")
+        return False
@@ -1,10 +1,12 @@
 import logging
 
-import requests
 from fastapi import HTTPException
 
 from billing.constants import BASE_SERVICE_URL
+from billing.deadline import Deadline, upstream_timeout
 from billing.models import Message
+from billing.tracing import Tracer
+from billing.transports import Transport, default_transport
 
 logger = logging.getLogger(__name__)
 
@@ -16,15 +18,43 @@ class MessageService:
     addition, it also makes creating mocks for testing easier.
     """
 
-    def __init__(self, base_url: str = BASE_SERVICE_URL) -> None:
+    def __init__(
+        self,
+        base_url: str = BASE_SERVICE_URL,
+        transport: Transport | None = None,
+        tracer: Tracer | None = None,
+    ) -> None:
         self._base_url = base_url
+        self._transport = transport or default_transport()
+        self._tracer = tracer or Tracer()
 
-    def fetch_messages(self) -> list[Message]:
+    def fetch_messages(self, deadline: Deadline | None = None) -> list[Message]:
         try:
-            response = requests.get(f"{self._base_url}/messages/current-period")
-            response.raise_for_status()
-            data = response.json()
-            return [Message(**msg) for msg in data["messages"]]
+            with self._tracer.span("fetch_messages") as span:
+                response = self._transport.get(
+                    f"{self._base_url}/messages/current-period", timeout=upstream_timeout(deadline)
+                )
+                response.raise_for_status()
+                data = response.json()
+                messages = [Message(**msg) for msg in data["messages"]]
+                if span:
+                    span.set_attribute("message_count", len(messages))
+                return messages
         except Exception as e:
             logger.error(f"Error fetching messages: {str(e)}")
             raise HTTPException(status_code=500, detail="Failed to fetch messages")
+
+    def fetch_version(self, deadline: Deadline | None = None) -> str | None:
+        """
+        Returns an identifier for the current messages payload (the ETag, or Last-Modified if there isn't one) without
+        downloading it. Returns None if the version can't be determined, callers should then assume it has changed.
+        """
+        try:
+            response = self._transport.head(
+                f"{self._base_url}/messages/current-period", timeout=upstream_timeout(deadline)
+            )
+            response.raise_for_status()
+            return response.headers.get("ETag") or response.headers.get("Last-Modified")
+        except Exception as e:
+            logger.warning(f"Error fetching messages version: {str(e)}")
+            return None
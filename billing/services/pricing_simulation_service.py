@@ -0,0 +1,109 @@
+from collections import Counter
+from dataclasses import dataclass
+
+from billing.dataclasses import BillingParameters, Credit
+from billing.models import Report
+from billing.services.credit_calculation_service import CalculateCreditsService, TextFeatures
+from billing.services.messages_service import MessageService
+from billing.services.reports_service import ReportService
+
+
+@dataclass(frozen=True, slots=True)
+class MessageFeatures:
+    """
+    Everything the credit rules read from a message's text. None of it depends on the billing parameters (the vowels
+    are the same for every parameter set), so it only needs to be extracted once however many sets are priced.
+    """
+
+    character_count: int
+    one_to_three_letter_words: int
+    four_to_seven_letter_words: int
+    eight_plus_letter_words: int
+    third_position_vowels: int
+    has_unique_words: bool
+    is_palindrome: bool
+
+
+def extract_message_features(text: str, vowels: set[str] = BillingParameters.VOWELS) -> MessageFeatures:
+    text_features = TextFeatures(text, vowels)
+    word_stats = text_features.word_stats
+    return MessageFeatures(
+        character_count=text_features.length,
+        one_to_three_letter_words=word_stats.one_to_three_letter_words,
+        four_to_seven_letter_words=word_stats.four_to_seven_letter_words,
+        eight_plus_letter_words=word_stats.eight_plus_letter_words,
+        third_position_vowels=text_features.third_position_vowels,
+        has_unique_words=word_stats.has_unique_words,
+        is_palindrome=text_features.is_palindrome,
+    )
+
+
+def price_message_features(features: MessageFeatures, parameters: BillingParameters) -> Credit:
+    """
+    Gives exactly the same result as CalculateCreditsService.calculate_credits for the text the features were
+    extracted from. Decimal addition is exact, so summing per bucket instead of per word doesn't change the result.
+    """
+    credits = parameters.BASE_CREDIT_COST
+    credits += parameters.CHAR_CREDIT_COST * features.character_count
+    credits += parameters.ONE_TO_THREE_WORD_LENGTH_COST * features.one_to_three_letter_words
+    credits += parameters.FOUR_TO_SEVEN_WORD_LENGTH_COST * features.four_to_seven_letter_words
+    credits += parameters.EIGHT_PLUS_WORD_LENGTH_COST * features.eight_plus_letter_words
+    credits += parameters.VOWEL_COST * features.third_position_vowels
+    if features.character_count > parameters.LENGTH_PENALTY_THRESHOLD:
+        credits += parameters.LENGTH_PENALTY_CREDITS
+    if features.has_unique_words:
+        credits -= parameters.UNIQUE_WORDS_BONUS
+    if features.is_palindrome:
+        credits *= parameters.PALINDROME_MULTIPLIER
+
+    return max(credits, Credit.from_int(1))
+
+
+class FeatureCreditsService(CalculateCreditsService):
+    """
+    Calculates credits from the extracted features instead of running each rule over the text, so the text is only
+    tokenized once. Must give the same results as CalculateCreditsService, it's run as a shadow engine to check that.
+    """
+
+    def calculate_credits(self, text: str) -> Credit:
+        return price_message_features(extract_message_features(text), self.parameters)
+
+
+class PricingSimulationService:
+    """
+    Prices the current period under many candidate parameter sets at once, for evaluating pricing changes.
+
+    Decision #1: The expensive part of calculating credits is tokenizing the text, so features are extracted once per
+    message and every parameter set is priced from them.
+
+    Decision #2: Instead of a vectorized library (e.g. numpy, which we don't depend on), messages with identical
+    features are grouped together and each group is priced once per parameter set. Short messages collapse into few
+    groups, so the cost per parameter set depends on the number of distinct feature combinations rather than the number
+    of messages. Messages billed by a report cost the same under every parameter set, so they're summed once.
+    """
+
+    def __init__(self, message_service: MessageService, report_service: ReportService) -> None:
+        self._message_service = message_service
+        self._report_service = report_service
+
+    def simulate(self, parameter_sets: list[BillingParameters]) -> list[Credit]:
+        """Returns the total credits for the period under each parameter set, in the same order."""
+        report_credits = Credit.zero()
+        feature_counts: Counter[MessageFeatures] = Counter()
+
+        messages = self._message_service.fetch_messages()
+        reports = self._report_service.fetch_reports([message.report_id for message in messages if message.report_id])
+        for message in messages:
+            report = reports[message.report_id] if message.report_id else None
+            if isinstance(report, Report):
+                report_credits += Credit(amount=report.credit_cost)
+            else:
+                feature_counts[extract_message_features(message.text)] += 1
+
+        totals = []
+        for parameters in parameter_sets:
+            total = report_credits
+            for features, count in feature_counts.items():
+                total += price_message_features(features, parameters) * count
+            totals.append(total)
+        return totals
@@ -1,14 +1,40 @@
+import contextvars
 import logging
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
 
-import requests
 from fastapi import HTTPException
 
-from billing.constants import BASE_SERVICE_URL
+from billing.constants import BASE_SERVICE_URL, REPORT_CACHE_MAX_ENTRIES
+from billing.deadline import Deadline, upstream_timeout
 from billing.models import Report
+from billing.shared_cache import SharedCache
+from billing.tracing import Tracer
+from billing.transports import Transport, default_transport
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass(frozen=True, slots=True)
+class ReportNotFound:
+    """Marks a report id which the reports API doesn't know about, see ReportService.fetch_reports."""
+
+    report_id: int
+
+
+@dataclass(frozen=True, slots=True)
+class ReportPending:
+    """Marks a report which wasn't resolved before the deadline (or failed to fetch), see ReportService.fetch_reports."""
+
+    report_id: int
+
+
+ReportLookup = Report | ReportNotFound | ReportPending
+
+
 class ReportService:
     """
     Decision: Use class for fetching reports instead of a normal function. I've seen either approach used in real-world
@@ -16,12 +42,148 @@ class ReportService:
     addition, it also makes creating mocks for testing easier.
     """
 
-    def __init__(self, base_url: str = BASE_SERVICE_URL) -> None:
+    def __init__(
+        self,
+        base_url: str = BASE_SERVICE_URL,
+        transport: Transport | None = None,
+        tracer: Tracer | None = None,
+        max_concurrency: int = 8,
+        shared_cache: SharedCache | None = None,
+        max_cached_reports: int = REPORT_CACHE_MAX_ENTRIES,
+    ) -> None:
+        """
+        Decision #1: Reports are cached in memory once fetched. Assumption: a report doesn't change once it exists, so
+        entries never expire. Missing reports aren't cached as they could still be created. The cache keeps the
+        `max_cached_reports` most recently used reports, so memory per worker is bounded however many reports there
+        are. A report evicted here is looked up in the shared cache (if any) before being fetched again.
+
+        Decision #2: fetch_reports fetches up to `max_concurrency` reports at once on a thread pool kept for the
+        lifetime of the service (until `close`). Threads are only started when first needed. For the connections to be reused the
+        transport should be a pooled session (see billing.transports.build_transport) sized to the same concurrency.
+
+        Decision #3: With a `shared_cache`, reports fetched by any worker on the host are looked up there before calling
+        the reports API, so each report is fetched once per host rather than once per worker.
+        """
         self._base_url = base_url
+        self._transport = transport or default_transport()
+        self._tracer = tracer or Tracer()
+        self._cache: OrderedDict[int, Report] = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._max_cached_reports = max_cached_reports
+        self._shared_cache = shared_cache
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="report-fetch")
+
+    def close(self) -> None:
+        """Stops the fetch threads. Fetches which haven't started are cancelled."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def fetch_report(self, report_id: int, deadline: Deadline | None = None) -> Report | None:
+        # The lock is only held to read or update the cache, never during a fetch. The worst case is two threads
+        # fetching the same report at the same time.
+        with self._tracer.span("fetch_report", report_id=report_id) as span:
+            cached_report = self._get_cached(report_id)
+            if cached_report is None and self._shared_cache is not None:
+                cached_report = self._lookup_shared(self._shared_cache, report_id)
+            if span:
+                span.set_attribute("cache_hit", cached_report is not None)
+            if cached_report is not None:
+                return cached_report
+
+            report = self._fetch_report(report_id, deadline)
+            if report is not None:
+                self._cache_report(report_id, report)
+                if self._shared_cache is not None:
+                    self._shared_cache.set(f"report:{report_id}", report.model_dump_json().encode())
+            return report
+
+    def _lookup_shared(self, shared_cache: SharedCache, report_id: int) -> Report | None:
+        entry = shared_cache.get(f"report:{report_id}")
+        if entry is None:
+            return None
+        report = Report.model_validate_json(entry.value)
+        self._cache_report(report_id, report)
+        return report
+
+    def _get_cached(self, report_id: int) -> Report | None:
+        with self._cache_lock:
+            report = self._cache.get(report_id)
+            if report is not None:
+                self._cache.move_to_end(report_id)
+            return report
+
+    def _cache_report(self, report_id: int, report: Report) -> None:
+        with self._cache_lock:
+            self._cache[report_id] = report
+            self._cache.move_to_end(report_id)
+            while len(self._cache) > self._max_cached_reports:
+                self._cache.popitem(last=False)
+
+    def fetch_reports(self, report_ids: Iterable[int], deadline: Deadline | None = None) -> dict[int, ReportLookup]:
+        """
+        Looks up every report in one call: ids are deduplicated, cached reports are returned straight away and the rest
+        are fetched concurrently. Every requested id is in the result, ids the reports API doesn't know about map to
+        ReportNotFound.
+
+        Without a deadline this raises like fetch_report if any fetch fails. With one it returns by the deadline, and
+        reports which haven't been fetched by then (or failed) map to ReportPending rather than failing every report.
+        Fetches still in flight at the deadline carry on in the background and are cached for the next call.
+        """
+        unique_ids = list(dict.fromkeys(report_ids))
+        with self._tracer.span("fetch_reports", report_count=len(unique_ids)) as span:
+            results: dict[int, ReportLookup] = {}
+            missing_ids = []
+            for report_id in unique_ids:
+                cached_report = self._get_cached(report_id)
+                if cached_report is not None:
+                    results[report_id] = cached_report
+                else:
+                    missing_ids.append(report_id)
+            if span:
+                span.set_attribute("cache_misses", len(missing_ids))
+
+            results.update(self._fetch_missing_reports(missing_ids, deadline))
+            if span:
+                span.set_attribute("pending", sum(isinstance(result, ReportPending) for result in results.values()))
+            # Keep the requested order rather than cached reports first.
+            return {report_id: results[report_id] for report_id in unique_ids}
+
+    def _fetch_missing_reports(self, report_ids: list[int], deadline: Deadline | None) -> dict[int, ReportLookup]:
+        """
+        NOTE: The reports API only has a single report endpoint so each report is a request. If a bulk endpoint is added
+        this is the only method which needs to change.
+        """
+        if deadline is None and len(report_ids) <= 1:
+            return {report_id: self._to_lookup(report_id, self.fetch_report(report_id)) for report_id in report_ids}
+
+        # Each fetch runs in a copy of the caller's context (copied here, in the caller's thread), so its span is a
+        # child of the caller's span.
+        futures = {
+            report_id: self._executor.submit(contextvars.copy_context().run, self.fetch_report, report_id, deadline)
+            for report_id in report_ids
+        }
+        done, _ = wait(futures.values(), timeout=deadline.remaining() if deadline else None)
+        results: dict[int, ReportLookup] = {}
+        for report_id, future in futures.items():
+            if future not in done:
+                # Fetches which haven't started yet never will, the ones in flight time out by the deadline.
+                future.cancel()
+                results[report_id] = ReportPending(report_id)
+                continue
+            try:
+                results[report_id] = self._to_lookup(report_id, future.result())
+            except HTTPException:
+                if deadline is None:
+                    raise
+                results[report_id] = ReportPending(report_id)
+        return results
+
+    @staticmethod
+    def _to_lookup(report_id: int, report: Report | None) -> ReportLookup:
+        return report if report is not None else ReportNotFound(report_id)
 
-    def fetch_report(self, report_id: int) -> Report | None:
+    def _fetch_report(self, report_id: int, deadline: Deadline | None) -> Report | None:
         try:
-            response = requests.get(f"{self._base_url}/reports/{report_id}")
+            response = self._transport.get(f"{self._base_url}/reports/{report_id}", timeout=upstream_timeout(deadline))
             if response.status_code == 404:
                 return None
             response.raise_for_status()
@@ -1,8 +1,96 @@
+import hashlib
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+
 from billing.dataclasses import Credit
-from billing.schemas import UsageEntry, UsageResponse
+from billing.deadline import Deadline
+from billing.models import Message, Report
+from billing.schemas import UsageEntry, UsageEntryStatus, UsageResponse, UsageSummary
 from billing.services.credit_calculation_service import CalculateCreditsService
 from billing.services.messages_service import MessageService
-from billing.services.reports_service import ReportService
+from billing.services.reports_service import ReportLookup, ReportPending, ReportService
+from billing.tracing import AggregateSpan, Tracer
+
+logger = logging.getLogger(__name__)
+# Long texts are truncated in mismatch logs so a handful of huge messages can't flood the logs.
+SHADOW_LOG_TEXT_LIMIT = 500
+
+
+def summarise_usage(entries: Iterable[UsageEntry]) -> UsageSummary:
+    """
+    Aggregates the entries in a single pass, so callers can pass a generator and never hold the full list in memory.
+
+    Decision: Summing as Decimal rather than float to avoid accumulating floating point errors over a large period.
+    str() of the float gives back the Decimal it was created from for the precision credits are calculated at.
+    """
+    complete = True
+    total_credits = Decimal(0)
+    message_count = 0
+    credits_by_report: defaultdict[str, Decimal] = defaultdict(Decimal)
+    message_count_by_report: defaultdict[str, int] = defaultdict(int)
+    credits_by_day: defaultdict[str, Decimal] = defaultdict(Decimal)
+
+    for entry in entries:
+        credits_used = Decimal(str(entry.credits_used))
+        complete = complete and entry.status is None
+        total_credits += credits_used
+        message_count += 1
+        if entry.report_name is not None:
+            credits_by_report[entry.report_name] += credits_used
+            message_count_by_report[entry.report_name] += 1
+        # Assumption: Days are bucketed in the timezone of the message timestamp.
+        credits_by_day[datetime.fromisoformat(entry.timestamp).date().isoformat()] += credits_used
+
+    return UsageSummary(
+        complete=complete,
+        total_credits=float(total_credits),
+        message_count=message_count,
+        credits_by_report={name: float(amount) for name, amount in credits_by_report.items()},
+        message_count_by_report=dict(message_count_by_report),
+        credits_by_day={day: float(amount) for day, amount in sorted(credits_by_day.items())},
+    )
+
+
+def hash_message_text(text: str) -> str:
+    # Decision: blake2b is fast and a 16 byte digest is plenty to detect edited texts, we don't need a cryptographic
+    # guarantee here. Storing the hash rather than the text keeps the incremental cache small.
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+@dataclass(frozen=True, slots=True)
+class CachedUsageEntry:
+    text_hash: str
+    report_id: int | None
+    entry: UsageEntry
+
+    def matches(self, message: Message, text_hash: str) -> bool:
+        return (
+            self.text_hash == text_hash
+            and self.report_id == message.report_id
+            and self.entry.timestamp == message.timestamp
+        )
+
+
+@dataclass(slots=True)
+class ShadowStats:
+    samples: int = 0
+    mismatches: int = 0
+    reference_seconds: float = 0.0
+    candidate_seconds: float = 0.0
+
+    @property
+    def relative_latency(self) -> float | None:
+        """How long the candidate engine took relative to the reference one, e.g. 0.5 is twice as fast."""
+        if not self.reference_seconds:
+            return None
+        return self.candidate_seconds / self.reference_seconds
 
 
 class UsageService:
@@ -11,41 +99,211 @@ class UsageService:
         message_service: MessageService,
         report_service: ReportService,
         calculate_credits_service: CalculateCreditsService,
+        incremental: bool = False,
+        shadow_calculate_credits_service: CalculateCreditsService | None = None,
+        shadow_sample_rate: float = 0.0,
+        rng: random.Random | None = None,
+        tracer: Tracer | None = None,
     ) -> None:
+        """
+        Decision #1: incremental mode keeps the computed entry for every message id between calls, so only new or changed
+        messages are recalculated (and only their reports fetched). It's opt-in because it only pays off when the same
+        instance is reused across requests. Assumption: a report's credit cost doesn't change once it exists, so an
+        entry is only recomputed when the message text, report id or timestamp changes.
+
+        Decision #2: shadow mode runs a candidate credits engine alongside the reference one for a random sample of the
+        calculated messages. The response always uses the reference credits, mismatches are logged and latencies are
+        recorded in `shadow_stats`. This lets us roll out an optimised engine with evidence it bills the same.
+        """
+        if not 0 <= shadow_sample_rate <= 1:
+            raise ValueError("Shadow sample rate must be between 0 and 1")
         self._message_service = message_service
         self._report_service = report_service
         self._calculate_credits_service = calculate_credits_service
+        self._incremental = incremental
+        self._cached_entries: dict[int, CachedUsageEntry] = {}
+        self._shadow_calculate_credits_service = shadow_calculate_credits_service
+        self._shadow_sample_rate = shadow_sample_rate
+        self._rng = rng or random.Random()
+        self._shadow_lock = threading.Lock()
+        self.shadow_stats = ShadowStats()
+        self._tracer = tracer or Tracer()
+
+    def get_usage(
+        self,
+        calculate_credits_service: CalculateCreditsService | None = None,
+        deadline: Deadline | None = None,
+        bill_pending_reports: bool = False,
+    ) -> UsageResponse:
+        usage = list(self.iter_usage_entries(calculate_credits_service, deadline, bill_pending_reports))
+        return UsageResponse(usage=usage, complete=all(entry.status is None for entry in usage))
 
-    def get_usage(self) -> UsageResponse:
+    def get_usage_summary(
+        self,
+        calculate_credits_service: CalculateCreditsService | None = None,
+        deadline: Deadline | None = None,
+        bill_pending_reports: bool = False,
+    ) -> UsageSummary:
+        return summarise_usage(self.iter_usage_entries(calculate_credits_service, deadline, bill_pending_reports))
+
+    def iter_usage_entries(
+        self,
+        calculate_credits_service: CalculateCreditsService | None = None,
+        deadline: Deadline | None = None,
+        bill_pending_reports: bool = False,
+    ) -> Iterator[UsageEntry]:
+        """
+        `calculate_credits_service` overrides the service's own calculator, e.g. for a customer with different pricing.
+        The incremental map is only kept for the service's own calculator, as the cached credits depend on the pricing.
+
+        With a `deadline`, messages whose report isn't resolved by then are returned with a PENDING status (and 0
+        credits) rather than failing or waiting. With `bill_pending_reports` they're priced with the calculator instead
+        and marked ESTIMATED. Neither is kept in the incremental map, so they're resolved again on the next call.
+        """
         # Assumption #1: Ordering of response not mentioned so I'm returning the usage in the order of messages fetched.
         # Assumption #2: I'm assuming API call doesn't take too long so can do this synchronously inside the request. Could
         # approach the problem differently where we pre-calculate usage (e.g. once a day) and store it to speed up this
         # request if the API call is slow.
-        messages = self._message_service.fetch_messages()
-        usage_data = []
-
-        for message in messages:
-            report_name = None
-            if message.report_id:
-                # Decision #1: If I had more time exponential back-off and retries can be added here to handle API rate limits.
-                # Decision #2: If I had more time could also add parallel fetching of report data to save time using asyncio.gather, doing so outside this for loop. (NOTE: I didn't use async because of time constraints)
-                # Decision #3: If I had more time could also add caching here, either using a simple dictionary or a more sophisticated cache like Redis.
-                report = self._report_service.fetch_report(message.report_id)
-                if report:
-                    credits_used = Credit(amount=report.credit_cost)
-                    report_name = report.name
-                else:
-                    credits_used = self._calculate_credits_service.calculate_credits(message.text)
-            else:
-                credits_used = self._calculate_credits_service.calculate_credits(message.text)
-
-            usage_data.append(
-                UsageEntry(
-                    report_name=report_name,
-                    message_id=message.id,
-                    timestamp=message.timestamp,
-                    credits_used=float(credits_used.amount),
-                )
+        calculator = calculate_credits_service or self._calculate_credits_service
+        incremental = self._incremental and (
+            calculator is self._calculate_credits_service
+            or calculator.fingerprint == self._calculate_credits_service.fingerprint
+        )
+        messages = self._message_service.fetch_messages(deadline)
+        previous_entries = self._cached_entries if incremental else {}
+        text_hashes = [hash_message_text(message.text) if incremental else "" for message in messages]
+        reusable_entries: list[CachedUsageEntry | None] = []
+        for message, text_hash in zip(messages, text_hashes, strict=True):
+            cached = previous_entries.get(message.id)
+            reusable_entries.append(cached if cached is not None and cached.matches(message, text_hash) else None)
+        # All the reports needed for the period are resolved in one call (cached or fetched concurrently), rather than
+        # a round trip per message.
+        reports = self._report_service.fetch_reports(
+            [
+                message.report_id
+                for message, reusable in zip(messages, reusable_entries, strict=True)
+                if reusable is None and message.report_id
+            ],
+            deadline,
+        )
+        cached_entries: dict[int, CachedUsageEntry] = {}
+        # Traced as a single span, a span per message would cost more than most calculations.
+        calculations = AggregateSpan(self._tracer, "calculate_credits")
+
+        for message, text_hash, cached in zip(messages, text_hashes, reusable_entries, strict=True):
+            if cached is None:
+                entry = self._build_usage_entry(message, reports, calculator, calculations, bill_pending_reports)
+                if not incremental or entry.status is not None:
+                    yield entry
+                    continue
+                cached = CachedUsageEntry(text_hash=text_hash, report_id=message.report_id, entry=entry)
+            cached_entries[message.id] = cached
+            yield cached.entry
+
+        calculations.record()
+        if incremental:
+            # Replacing (rather than updating) the map drops messages which are no longer in the period.
+            self._cached_entries = cached_entries
+
+        if self._shadow_calculate_credits_service is not None:
+            stats = self.shadow_stats
+            logger.info(
+                f"Shadow credits: {stats.samples} samples, {stats.mismatches} mismatches, "
+                f"relative latency {stats.relative_latency}"
             )
 
-        return UsageResponse(usage=usage_data)
+    @property
+    def fingerprint(self) -> str:
+        """The fingerprint of the service's own calculator, i.e. of the pricing price_messages uses."""
+        return self._calculate_credits_service.fingerprint
+
+    def price_messages(self, messages: Sequence[Message]) -> list[UsageEntry]:
+        """
+        Prices the given messages (rather than the period's) with the service's own calculator, e.g. as they're
+        ingested. Raises like ReportService.fetch_reports if a report can't be fetched.
+        """
+        reports = self._report_service.fetch_reports([message.report_id for message in messages if message.report_id])
+        calculations = AggregateSpan(self._tracer, "calculate_credits")
+        entries = [
+            self._build_usage_entry(message, reports, self._calculate_credits_service, calculations)
+            for message in messages
+        ]
+        calculations.record()
+        return entries
+
+    def _build_usage_entry(
+        self,
+        message: Message,
+        reports: Mapping[int, ReportLookup],
+        calculator: CalculateCreditsService,
+        calculations: AggregateSpan,
+        bill_pending_reports: bool = False,
+    ) -> UsageEntry:
+        report_name = None
+        status = None
+        if message.report_id:
+            # Decision: If I had more time exponential back-off and retries can be added here to handle API rate limits.
+            report = reports[message.report_id]
+            if isinstance(report, Report):
+                credits_used = Credit(amount=report.credit_cost)
+                report_name = report.name
+            elif isinstance(report, ReportPending) and not bill_pending_reports:
+                credits_used = Credit.zero()
+                status = UsageEntryStatus.PENDING
+            else:
+                credits_used = self._calculate_credits(message, calculator, calculations)
+                if isinstance(report, ReportPending):
+                    status = UsageEntryStatus.ESTIMATED
+        else:
+            credits_used = self._calculate_credits(message, calculator, calculations)
+
+        return UsageEntry(
+            report_name=report_name,
+            message_id=message.id,
+            timestamp=message.timestamp,
+            credits_used=float(credits_used.amount),
+            status=status,
+        )
+
+    def _calculate_credits(
+        self, message: Message, calculator: CalculateCreditsService, calculations: AggregateSpan
+    ) -> Credit:
+        shadow_service = self._shadow_calculate_credits_service
+        # The candidate is built with the same parameters as the service's own calculator, so only compare with that
+        # pricing. Compared by fingerprint, as callers may pass an equivalent calculator rather than the same instance.
+        own_calculator = self._calculate_credits_service
+        if (
+            shadow_service is None
+            or (calculator is not own_calculator and calculator.fingerprint != own_calculator.fingerprint)
+            or self._rng.random() >= self._shadow_sample_rate
+        ):
+            # Only timed here for the shadow comparison, the aggregate span times itself when it's recorded.
+            with calculations:
+                return calculator.calculate_credits(message.text)
+
+        start = time.perf_counter()
+        with calculations:
+            credits = calculator.calculate_credits(message.text)
+        reference_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        try:
+            candidate_credits: Credit | None = shadow_service.calculate_credits(message.text)
+        except Exception as e:
+            # The candidate must never affect the response, a failure is recorded like a mismatch.
+            logger.error(f"Shadow credits engine failed for message {message.id}: {str(e)}")
+            candidate_credits = None
+        candidate_seconds = time.perf_counter() - start
+
+        mismatch = candidate_credits is None or candidate_credits != credits
+        if mismatch and candidate_credits is not None:
+            logger.warning(
+                f"Shadow credits mismatch for message {message.id}: reference {credits.amount}, "
+                f"candidate {candidate_credits.amount}, text {message.text[:SHADOW_LOG_TEXT_LIMIT]!r}"
+            )
+        with self._shadow_lock:
+            self.shadow_stats.samples += 1
+            self.shadow_stats.mismatches += mismatch
+            self.shadow_stats.reference_seconds += reference_seconds
+            self.shadow_stats.candidate_seconds += candidate_seconds
+        return credits
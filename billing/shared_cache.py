@@ -0,0 +1,146 @@
+"""
+A cache shared by every worker process on a host, for the fetched reports and the computed usage responses.
+
+Decision #1: An SQLite database rather than a hand-rolled shared memory segment. Put on a tmpfs (e.g. /dev/shm) it
+lives in shared memory, and reads are served from a memory mapping of it (see the mmap_size pragma). SQLite already
+gives us what a shared segment would need to be built by hand: locking between processes, atomic updates and recovery
+if a worker dies mid write. WAL mode lets readers carry on while a worker writes.
+
+Decision #2: Size is bounded by the total bytes of the values. Each write evicts the least recently written entries
+over the limit in the same transaction, so the bound holds however many workers write at once. Reads don't update
+anything, so they never take the write lock.
+
+Decision #3: The cache is an optimisation, so errors (e.g. a locked or corrupt database) are logged and treated as
+misses rather than failing the request.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class SharedCacheEntry:
+    value: bytes
+    version: str | None
+    written_at: float
+
+
+class SharedCache:
+    """
+    A bounded key/value store in the SQLite database at `path`, shared by every process which opens it. `written_at` is
+    from `clock`, which has to be comparable between processes (so wall clock rather than monotonic time).
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        max_bytes: int,
+        clock: Callable[[], float] = time.time,
+        busy_timeout_seconds: float = 1.0,
+    ) -> None:
+        self._max_bytes = max_bytes
+        self._clock = clock
+        self._connections = ThreadLocalConnections(path, busy_timeout_seconds, mmap_size=max_bytes * 2)
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, version TEXT, written_at REAL NOT NULL, "
+                "size INTEGER NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS entries_written_at ON entries (written_at)")
+
+    def get(self, key: str) -> SharedCacheEntry | None:
+        try:
+            row = (
+                self._connection()
+                .execute("SELECT value, version, written_at FROM entries WHERE key = ?", (key,))
+                .fetchone()
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Error reading {key} from the shared cache: {str(e)}")
+            return None
+        if row is None:
+            return None
+        return SharedCacheEntry(value=row[0], version=row[1], written_at=row[2])
+
+    def age(self, entry: SharedCacheEntry) -> float:
+        return self._clock() - entry.written_at
+
+    def set(self, key: str, value: bytes, version: str | None = None) -> None:
+        if len(value) > self._max_bytes:
+            # Not worth evicting everything else for a value which can't fit anyway.
+            return
+        try:
+            with self._connection() as connection:
+                connection.execute("BEGIN IMMEDIATE")
+                connection.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, version, written_at, size) VALUES (?, ?, ?, ?, ?)",
+                    (key, value, version, self._clock(), len(value)),
+                )
+                self._evict(connection)
+        except sqlite3.Error as e:
+            logger.warning(f"Error writing {key} to the shared cache: {str(e)}")
+
+    def touch(self, key: str) -> None:
+        """Marks an entry as written now, used when revalidation finds the upstream hasn't changed."""
+        try:
+            with self._connection() as connection:
+                connection.execute("UPDATE entries SET written_at = ? WHERE key = ?", (self._clock(), key))
+        except sqlite3.Error as e:
+            logger.warning(f"Error touching {key} in the shared cache: {str(e)}")
+
+    def clear(self) -> None:
+        with self._connection() as connection:
+            connection.execute("DELETE FROM entries")
+
+    @property
+    def size_bytes(self) -> int:
+        total: int = self._connection().execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        return total
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        excess = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0] - self._max_bytes
+        if excess <= 0:
+            return
+        evicted = []
+        for key, size in connection.execute("SELECT key, size FROM entries ORDER BY written_at"):
+            if excess <= 0:
+                break
+            evicted.append((key,))
+            excess -= size
+        connection.executemany("DELETE FROM entries WHERE key = ?", evicted)
+
+    def _connection(self) -> sqlite3.Connection:
+        return self._connections.get()
+
+
+class ThreadLocalConnections:
+    """
+    An SQLite connection per thread to the database at `path`, as sqlite3 connections can't be shared between threads.
+    Shared by every SQLite backed store of the app (see also billing.usage_store).
+    """
+
+    def __init__(self, path: Path, busy_timeout_seconds: float = 1.0, mmap_size: int = 0) -> None:
+        self._path = path
+        self._busy_timeout_seconds = busy_timeout_seconds
+        self._mmap_size = mmap_size
+        self._local = threading.local()
+
+    def get(self) -> sqlite3.Connection:
+        connection: sqlite3.Connection | None = getattr(self._local, "connection", None)
+        if connection is None:
+            # isolation_level=None so transactions are only the ones started explicitly (BEGIN IMMEDIATE takes the
+            # write lock up front, rather than failing to upgrade a read lock when another worker is writing).
+            connection = sqlite3.connect(self._path, timeout=self._busy_timeout_seconds, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(f"PRAGMA mmap_size={self._mmap_size}")
+            self._local.connection = connection
+        return connection
@@ -0,0 +1,235 @@
+"""
+A compact columnar on-disk format for computed usage, read with mmap so a new process can serve a period straight away
+without parsing (or recomputing) it.
+
+Layout (little-endian, every section 8 byte aligned):
+    header         magic, format version, row count, string count, length of the messages version, length of the
+                   pricing fingerprint
+    messages version (utf-8, the upstream version the usage was computed from)
+    pricing fingerprint (utf-8, of the calculator the usage was priced with)
+    message_id     int64[rows]
+    credits        int64[rows]  credits_used * CREDIT_SCALE
+    day            int32[rows]  the timestamp's date, in its own UTC offset, as days since 1970-01-01
+    report_code    int32[rows]  index into the string table, -1 for no report
+    string offsets int64[strings + 1]
+    timestamp text offsets int64[rows + 1]
+    string data    utf-8
+    timestamp text utf-8, each row's timestamp as it was written
+
+Decision #1: Credits are stored as scaled integers rather than floats so sums over the columns are exact. Writing fails
+if a credit can't be represented exactly, rather than silently rounding a bill (the caller skips the snapshot).
+
+Decision #2: Report names are dictionary encoded, there are few distinct reports compared to messages.
+
+Decision #3: Timestamps are stored twice: as the day they fall on for aggregating, bucketed like summarise_usage (in
+the timestamp's own offset) so a summary served from a snapshot is the one it stands in for, and as the original text,
+so the entries read back are exactly the ones written and a /usage response served from a snapshot is byte for byte
+the one it stands in for.
+
+Decision #4: The snapshot records the fingerprint of the pricing it was computed with, and is only served (or kept) for
+that pricing. A snapshot left by a deploy with other prices is otherwise indistinguishable from a current one, as the
+upstream version it was computed from is the same.
+"""
+
+import mmap
+import os
+import struct
+from array import array
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+from typing import Self
+
+from billing.schemas import UsageEntry, UsageSummary
+
+MAGIC = b"OWUSAGE\x00"
+FORMAT_VERSION = 4
+CREDIT_SCALE = 10**6
+_HEADER = struct.Struct("<8sIQQII")
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def _padding(size: int) -> bytes:
+    return b"\x00" * (-size % 8)
+
+
+def _to_day(timestamp: str) -> int:
+    return datetime.fromisoformat(timestamp).date().toordinal() - _EPOCH_ORDINAL
+
+
+def _to_scaled_credits(credits_used: float) -> int:
+    scaled = Decimal(str(credits_used)) * CREDIT_SCALE
+    if scaled != scaled.to_integral_value():
+        raise ValueError(f"Credits {credits_used} can't be stored exactly with a scale of {CREDIT_SCALE}")
+    return int(scaled)
+
+
+def write_usage_snapshot(
+    path: Path, entries: Iterable[UsageEntry], fingerprint: str, version: str | None = None
+) -> int:
+    """
+    Writes the entries to `path` and returns the number of rows. The file is written next to `path` and renamed into
+    place, so processes which already have the old snapshot mapped keep reading a consistent file.
+    """
+    message_ids = array("q")
+    credits = array("q")
+    days = array("i")
+    report_codes = array("i")
+    string_codes: dict[str, int] = {}
+    timestamp_offsets = array("q", [0])
+    timestamp_text = bytearray()
+
+    for entry in entries:
+        message_ids.append(entry.message_id)
+        days.append(_to_day(entry.timestamp))
+        timestamp_text += entry.timestamp.encode()
+        timestamp_offsets.append(len(timestamp_text))
+        credits.append(_to_scaled_credits(entry.credits_used))
+        if entry.report_name is None:
+            report_codes.append(-1)
+        else:
+            report_codes.append(string_codes.setdefault(entry.report_name, len(string_codes)))
+
+    encoded_strings = [name.encode() for name in string_codes]
+    string_offsets = array("q", [0])
+    for encoded in encoded_strings:
+        string_offsets.append(string_offsets[-1] + len(encoded))
+    encoded_version = (version or "").encode()
+    encoded_fingerprint = fingerprint.encode()
+
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    with tmp_path.open("wb") as file:
+        file.write(
+            _HEADER.pack(
+                MAGIC,
+                FORMAT_VERSION,
+                len(message_ids),
+                len(string_codes),
+                len(encoded_version),
+                len(encoded_fingerprint),
+            )
+        )
+        file.write(_padding(_HEADER.size))
+        sections = (
+            encoded_version,
+            encoded_fingerprint,
+            message_ids,
+            credits,
+            days,
+            report_codes,
+            string_offsets,
+            timestamp_offsets,
+            b"".join(encoded_strings),
+            bytes(timestamp_text),
+        )
+        for section in sections:
+            data = section if isinstance(section, bytes) else section.tobytes()
+            file.write(data)
+            file.write(_padding(len(data)))
+        # On disk before the rename, so a crash can't leave a truncated snapshot in place of the previous one.
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    return len(message_ids)
+
+
+class UsageSnapshot:
+    """
+    A read-only view over a snapshot file. The columns are memoryviews onto the mapped file, so opening a snapshot
+    doesn't read it, pages are loaded by the OS as they're accessed.
+    """
+
+    def __init__(self, buffer: mmap.mmap) -> None:
+        """Raises ValueError if the buffer isn't a snapshot, or is shorter than its header says (e.g. truncated)."""
+        self._mmap = buffer
+        if len(buffer) < _HEADER.size:
+            raise ValueError("Truncated usage snapshot")
+        magic, format_version, rows, strings, version_length, fingerprint_length = _HEADER.unpack_from(buffer)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError("Not a usage snapshot (or an unsupported version)")
+
+        view = memoryview(buffer)
+        offset = _HEADER.size + len(_padding(_HEADER.size))
+
+        def take(size: int) -> memoryview:
+            nonlocal offset
+            if size < 0 or offset + size > len(buffer):
+                raise ValueError("Truncated usage snapshot")
+            section = view[offset : offset + size]
+            offset += size + len(_padding(size))
+            return section
+
+        self.version = bytes(take(version_length)).decode() or None
+        self.fingerprint = bytes(take(fingerprint_length)).decode()
+        self.message_ids = take(rows * 8).cast("q")
+        self.credits = take(rows * 8).cast("q")
+        self.days = take(rows * 4).cast("i")
+        self.report_codes = take(rows * 4).cast("i")
+        string_offsets = take((strings + 1) * 8).cast("q")
+        self._timestamp_offsets = take((rows + 1) * 8).cast("q")
+        string_data = take(string_offsets[-1])
+        self.report_names = [
+            bytes(string_data[string_offsets[i] : string_offsets[i + 1]]).decode() for i in range(strings)
+        ]
+        self._timestamp_text = take(self._timestamp_offsets[-1])
+
+    @classmethod
+    def open(cls, path: Path) -> Self:
+        with path.open("rb") as file:
+            # The mapping stays valid after the file is closed (and after it's replaced by a newer snapshot).
+            return cls(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def __len__(self) -> int:
+        return len(self.message_ids)
+
+    def iter_usage_entries(self) -> Iterator[UsageEntry]:
+        for i in range(len(self)):
+            report_code = self.report_codes[i]
+            yield UsageEntry(
+                message_id=self.message_ids[i],
+                timestamp=bytes(
+                    self._timestamp_text[self._timestamp_offsets[i] : self._timestamp_offsets[i + 1]]
+                ).decode(),
+                report_name=self.report_names[report_code] if report_code >= 0 else None,
+                credits_used=float(Decimal(self.credits[i]) / CREDIT_SCALE),
+            )
+
+    def summary(self) -> UsageSummary:
+        """Aggregates straight from the columns, without creating an entry per row."""
+        credits_by_code: defaultdict[int, int] = defaultdict(int)
+        count_by_code: defaultdict[int, int] = defaultdict(int)
+        credits_by_day: defaultdict[int, int] = defaultdict(int)
+        for credits, report_code, day in zip(self.credits, self.report_codes, self.days, strict=True):
+            credits_by_code[report_code] += credits
+            count_by_code[report_code] += 1
+            credits_by_day[day] += credits
+
+        def to_float(scaled: int) -> float:
+            return float(Decimal(scaled) / CREDIT_SCALE)
+
+        return UsageSummary(
+            total_credits=to_float(sum(credits_by_code.values())),
+            message_count=len(self),
+            credits_by_report={
+                self.report_names[code]: to_float(c) for code, c in credits_by_code.items() if code >= 0
+            },
+            message_count_by_report={self.report_names[code]: n for code, n in count_by_code.items() if code >= 0},
+            credits_by_day={
+                date.fromordinal(day + _EPOCH_ORDINAL).isoformat(): to_float(c)
+                for day, c in sorted(credits_by_day.items())
+            },
+        )
+
+    def close(self) -> None:
+        for column in (
+            self.message_ids,
+            self.credits,
+            self.days,
+            self.report_codes,
+            self._timestamp_offsets,
+            self._timestamp_text,
+        ):
+            column.release()
+        self._mmap.close()
@@ -0,0 +1,224 @@
+"""
+Tracing for the /usage pipeline, to see how the time of a slow request splits between its stages.
+
+Decision #1: A small tracer following the OpenTelemetry data model (128 bit trace ids, 64 bit span ids, parent ids,
+unix nanosecond timestamps and attributes) rather than depending on the OpenTelemetry SDK. Exported spans use the OTLP
+JSON field names, so they can be loaded into OpenTelemetry tooling, and moving to the SDK later only means replacing
+Tracer.
+
+Decision #2: Sampling is decided once per trace, at the root span. Spans in an unsampled trace cost a context variable
+lookup and nothing is recorded, so tracing a small fraction of requests has a negligible overhead at full traffic.
+"""
+
+import contextvars
+import json
+import random
+import threading
+import time
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Protocol
+
+from billing.memory_profiling import memory_stage
+
+
+@dataclass(slots=True)
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: str | None
+    start_time_unix_nano: int
+    end_time_unix_nano: int = 0
+    attributes: dict[str, Any] = field(default_factory=dict)
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def to_otlp_json(self) -> dict[str, Any]:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id or "",
+            "name": self.name,
+            "startTimeUnixNano": str(self.start_time_unix_nano),
+            "endTimeUnixNano": str(self.end_time_unix_nano),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+        }
+
+
+def _otlp_value(value: Any) -> dict[str, Any]:
+    """An attribute value as an OTLP JSON AnyValue (64 bit ints are strings in the protobuf JSON mapping)."""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, list | tuple):
+        return {"arrayValue": {"values": [_otlp_value(item) for item in value]}}
+    return {"stringValue": str(value)}
+
+
+class SpanExporter(Protocol):
+    def export(self, spans: Sequence[Span]) -> None: ...
+
+
+class InMemorySpanExporter:
+    """Keeps exported spans in a list, for tests."""
+
+    def __init__(self) -> None:
+        self.spans: list[Span] = []
+        self._lock = threading.Lock()
+
+    def export(self, spans: Sequence[Span]) -> None:
+        with self._lock:
+            self.spans.extend(spans)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.spans.clear()
+
+
+class FileSpanExporter:
+    """Appends each span to a JSONL file, one OTLP JSON span per line."""
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: Sequence[Span]) -> None:
+        lines = "".join(json.dumps(span.to_otlp_json()) + "\n" for span in spans)
+        with self._lock, self._path.open("a", encoding="utf-8") as file:
+            file.write(lines)
+
+
+# The current span of this thread/task. _NOT_SAMPLED marks a trace which isn't being recorded, so the spans inside it
+# don't each make their own sampling decision.
+_NOT_SAMPLED = object()
+_current_span: contextvars.ContextVar[Span | object | None] = contextvars.ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """
+    Records spans into `exporter` for a `sample_rate` fraction of traces. Without an exporter nothing is recorded.
+    Spans are exported as they end.
+    """
+
+    def __init__(
+        self,
+        exporter: SpanExporter | None = None,
+        sample_rate: float = 1.0,
+        rng: random.Random | None = None,
+    ) -> None:
+        if not 0 <= sample_rate <= 1:
+            raise ValueError("Trace sample rate must be between 0 and 1")
+        self._exporter = exporter
+        self._sample_rate = sample_rate if exporter is not None else 0.0
+        self._rng = rng or random.Random()
+
+    def is_recording(self) -> bool:
+        return self._exporter is not None and self.current_span() is not None
+
+    def current_span(self) -> Span | None:
+        """The span being recorded in this context, None if there isn't one (or the trace isn't sampled)."""
+        span = _current_span.get()
+        return span if isinstance(span, Span) else None
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span | None]:
+        """
+        Records the enclosed block as a span, a child of the current span. Yields None if it isn't recorded. The block
+        is also a stage of the current memory profile, if there is one (see billing.memory_profiling).
+        """
+        with memory_stage(name):
+            if self._exporter is None:
+                yield None
+                return
+            parent = _current_span.get()
+            if parent is _NOT_SAMPLED or (parent is None and not self._sample()):
+                token = _current_span.set(_NOT_SAMPLED)
+                try:
+                    yield None
+                finally:
+                    _current_span.reset(token)
+                return
+
+            span = self._start_span(name, parent if isinstance(parent, Span) else None, time.time_ns(), attributes)
+            token = _current_span.set(span)
+            try:
+                yield span
+            except BaseException as e:
+                span.set_attribute("error", type(e).__name__)
+                raise
+            finally:
+                _current_span.reset(token)
+                self._end_span(span, time.time_ns())
+
+    def record_span(self, name: str, start_time_unix_nano: int, end_time_unix_nano: int, **attributes: Any) -> None:
+        """
+        Records an already timed span as a child of the current span, e.g. an aggregate of many small operations which
+        would be too numerous (and too expensive to time) as spans of their own. Does nothing outside a recorded span.
+        """
+        parent = self.current_span()
+        if parent is None or self._exporter is None:
+            return
+        self._end_span(self._start_span(name, parent, start_time_unix_nano, attributes), end_time_unix_nano)
+
+    def _sample(self) -> bool:
+        return self._sample_rate > 0 and self._rng.random() < self._sample_rate
+
+    def _start_span(self, name: str, parent: Span | None, start: int, attributes: dict[str, Any]) -> Span:
+        return Span(
+            name=name,
+            trace_id=parent.trace_id if parent else f"{self._rng.getrandbits(128):032x}",
+            span_id=f"{self._rng.getrandbits(64):016x}",
+            parent_span_id=parent.span_id if parent else None,
+            start_time_unix_nano=start,
+            attributes=attributes,
+        )
+
+    def _end_span(self, span: Span, end: int) -> None:
+        span.end_time_unix_nano = end
+        if self._exporter is not None:
+            self._exporter.export([span])
+
+
+class AggregateSpan:
+    """
+    Times many small operations (used as a context manager around each one) and records them as a single span with
+    `record`. The span starts with the first operation and its duration is the sum of the operations. Only times
+    anything if there was a recorded span when it was created.
+    """
+
+    def __init__(self, tracer: Tracer, name: str) -> None:
+        self._tracer = tracer
+        self._name = name
+        self._enabled = tracer.is_recording()
+        self._first_start_unix_nano: int | None = None
+        self._start = 0
+        self.calls = 0
+        self.duration_ns = 0
+
+    def __enter__(self) -> None:
+        if self._enabled:
+            if self._first_start_unix_nano is None:
+                self._first_start_unix_nano = time.time_ns()
+            self._start = time.perf_counter_ns()
+
+    def __exit__(self, *exc_info: object) -> None:
+        if self._enabled:
+            self.duration_ns += time.perf_counter_ns() - self._start
+            self.calls += 1
+
+    def record(self) -> None:
+        if self._first_start_unix_nano is None:
+            return
+        self._tracer.record_span(
+            self._name,
+            self._first_start_unix_nano,
+            self._first_start_unix_nano + self.duration_ns,
+            calls=self.calls,
+        )
@@ -0,0 +1,169 @@
+"""
+HTTP transports used by the services to call the upstream APIs.
+
+Decision: The services take a transport (anything with requests-style `get`/`head`) instead of calling requests
+directly. The app uses a pooled requests session (see build_transport), but it also lets us record real upstream
+responses once and replay them later with their original latencies, so the whole /usage pipeline can be performance
+tested offline and reproducibly. A transport holding connections also has a `close`, called on shutdown.
+
+- Record: UPSTREAM_RECORD_PATH=upstream.jsonl fastapi dev, then call the endpoints to capture.
+- Replay: UPSTREAM_REPLAY_PATH=upstream.jsonl fastapi dev (UPSTREAM_REPLAY_LATENCY_SCALE=0.5 to halve latencies).
+"""
+
+import base64
+import json
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Callable
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Protocol
+
+from billing.constants import (
+    REPORT_FETCH_CONCURRENCY,
+    UPSTREAM_RECORD_PATH,
+    UPSTREAM_REPLAY_LATENCY_SCALE,
+    UPSTREAM_REPLAY_PATH,
+)
+
+if TYPE_CHECKING:
+    import requests
+
+
+class Transport(Protocol):
+    def get(self, url: str, *, timeout: float | None = None) -> "requests.Response": ...
+
+    def head(self, url: str, *, timeout: float | None = None) -> "requests.Response": ...
+
+
+class RecordingTransport:
+    """Passes requests through to `inner` and appends each response (and how long it took) to a JSONL archive."""
+
+    def __init__(self, inner: Transport, archive_path: Path) -> None:
+        self._inner = inner
+        self._archive_path = archive_path
+        self._lock = threading.Lock()
+
+    def get(self, url: str, *, timeout: float | None = None) -> "requests.Response":
+        return self._record("GET", url, lambda: self._inner.get(url, timeout=timeout))
+
+    def head(self, url: str, *, timeout: float | None = None) -> "requests.Response":
+        return self._record("HEAD", url, lambda: self._inner.head(url, timeout=timeout))
+
+    def close(self) -> None:
+        close_transport(self._inner)
+
+    def _record(self, method: str, url: str, send: Callable[[], "requests.Response"]) -> "requests.Response":
+        start = time.perf_counter()
+        response = send()
+        elapsed_seconds = time.perf_counter() - start
+        record = {
+            "method": method,
+            "url": url,
+            "status_code": response.status_code,
+            "headers": dict(response.headers),
+            "body": base64.b64encode(response.content).decode(),
+            "elapsed_seconds": elapsed_seconds,
+        }
+        with self._lock, self._archive_path.open("a", encoding="utf-8") as archive:
+            archive.write(json.dumps(record) + "\n")
+        return response
+
+
+class ReplayTransport:
+    """
+    Serves responses from an archive written by RecordingTransport, sleeping for the recorded latency multiplied by
+    `latency_scale` (0 to replay as fast as possible), or raising Timeout if that's longer than the request's timeout.
+    If a url was recorded several times the responses are replayed in order, repeating the last one.
+    """
+
+    def __init__(
+        self,
+        archive_path: Path,
+        latency_scale: float = 1.0,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self._latency_scale = latency_scale
+        self._sleep = sleep
+        self._records: defaultdict[tuple[str, str], list[dict[str, Any]]] = defaultdict(list)
+        self._replayed: defaultdict[tuple[str, str], int] = defaultdict(int)
+        self._lock = threading.Lock()
+        with archive_path.open(encoding="utf-8") as archive:
+            for line in archive:
+                if line.strip():
+                    record = json.loads(line)
+                    self._records[(record["method"], record["url"])].append(record)
+
+    def get(self, url: str, *, timeout: float | None = None) -> "requests.Response":
+        return self._replay("GET", url, timeout)
+
+    def head(self, url: str, *, timeout: float | None = None) -> "requests.Response":
+        return self._replay("HEAD", url, timeout)
+
+    def _replay(self, method: str, url: str, timeout: float | None) -> "requests.Response":
+        import requests
+        from requests.structures import CaseInsensitiveDict
+
+        key = (method, url)
+        records = self._records.get(key)
+        if not records:
+            # Surfaces like a connection error would, the services turn it into their usual error handling.
+            raise requests.exceptions.ConnectionError(f"No recorded response for {method} {url}")
+        with self._lock:
+            record = records[min(self._replayed[key], len(records) - 1)]
+            self._replayed[key] += 1
+
+        latency = record["elapsed_seconds"] * self._latency_scale
+        if timeout is not None and latency > timeout:
+            # Times out like requests would, so deadlines can be tested against a recorded slow upstream.
+            self._sleep(timeout)
+            raise requests.exceptions.Timeout(f"Replayed {method} {url} took longer than {timeout}s")
+        self._sleep(latency)
+        response = requests.Response()
+        response.status_code = record["status_code"]
+        response.headers = CaseInsensitiveDict(record["headers"])
+        response._content = base64.b64decode(record["body"])
+        response.url = url
+        return response
+
+
+def default_transport() -> Transport:
+    """
+    The requests module. Decision: It's imported on first use rather than at the top of the module, it's one of the
+    slowest imports and isn't needed until the services are built during startup (see tests/test_startup.py).
+    """
+    import requests
+
+    return requests
+
+
+def pooled_transport(pool_size: int) -> Transport:
+    """
+    A requests session keeping up to `pool_size` connections per host open, so concurrent requests (e.g.
+    ReportService.fetch_reports) reuse connections rather than each opening their own.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def close_transport(transport: Transport) -> None:
+    """Closes the transport's connections, if it holds any (the requests module and replay transport don't)."""
+    close = getattr(transport, "close", None)
+    if close is not None:
+        close()
+
+
+def build_transport() -> Transport:
+    """The transport configured by the environment, see the module docstring."""
+    if UPSTREAM_REPLAY_PATH:
+        return ReplayTransport(Path(UPSTREAM_REPLAY_PATH), latency_scale=UPSTREAM_REPLAY_LATENCY_SCALE)
+    transport = pooled_transport(REPORT_FETCH_CONCURRENCY)
+    if UPSTREAM_RECORD_PATH:
+        return RecordingTransport(transport, Path(UPSTREAM_RECORD_PATH))
+    return transport
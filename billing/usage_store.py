@@ -0,0 +1,81 @@
+"""
+The stored usage of the period, appended to as messages are ingested (see billing.services.ingestion_service).
+
+Decision #1: Entries are stored already priced, so reading the usage costs neither an upstream call nor a credit
+calculation. The ingestion service prices each message once with the default billing parameters, and each entry records
+the fingerprint of the pricing it was priced with. Reads are for a pricing, so once the pricing changes (e.g. after a
+deploy) the old entries aren't served, the store is backfilled again under the new pricing instead.
+
+Decision #2: SQLite, like the shared cache, so every worker on the host reads the same usage whichever worker ingested
+a message, and the usage survives a restart. Entries are kept in the order they were first ingested, re-ingesting a
+message replaces its entry in place.
+
+Decision #3: `version` changes on every append, so the cached /usage responses are revalidated against it rather than
+against the upstream.
+
+Decision #4: The store only holds the whole period for a pricing once the ingestion service has backfilled it from the
+messages API with that pricing, which it records with `mark_backfilled`. Until then it only has the messages ingested
+so far, so /usage isn't read from it (see billing.router._stored_usage).
+"""
+
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+from billing.schemas import UsageEntry
+from billing.shared_cache import ThreadLocalConnections
+
+
+class UsageStore:
+    def __init__(self, path: Path, busy_timeout_seconds: float = 5.0) -> None:
+        self._connections = ThreadLocalConnections(path, busy_timeout_seconds)
+        with self._connections.get() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS usage ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, message_id INTEGER NOT NULL UNIQUE, entry TEXT NOT NULL, "
+                "fingerprint TEXT NOT NULL)"
+            )
+            connection.execute("CREATE TABLE IF NOT EXISTS usage_version (id INTEGER PRIMARY KEY, version INTEGER)")
+            connection.execute("INSERT OR IGNORE INTO usage_version (id, version) VALUES (0, 0)")
+            connection.execute("CREATE TABLE IF NOT EXISTS usage_markers (name TEXT PRIMARY KEY)")
+        # A pricing is never unmarked, so once seen it's no longer read from the database.
+        self._backfilled: set[str] = set()
+
+    def append(self, entries: Iterable[UsageEntry], fingerprint: str) -> None:
+        """Stores the entries priced with the pricing of `fingerprint`, replacing any entry of the same messages."""
+        rows = [(entry.message_id, entry.model_dump_json(exclude_none=True), fingerprint) for entry in entries]
+        if not rows:
+            return
+        with self._connections.get() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.executemany(
+                "INSERT INTO usage (message_id, entry, fingerprint) VALUES (?, ?, ?) "
+                "ON CONFLICT (message_id) DO UPDATE SET entry = excluded.entry, fingerprint = excluded.fingerprint",
+                rows,
+            )
+            connection.execute("UPDATE usage_version SET version = version + 1 WHERE id = 0")
+
+    def iter_entries(self, fingerprint: str) -> Iterator[UsageEntry]:
+        # fetchall so the read is a single consistent snapshot, rather than interleaved with another worker's append.
+        rows = (
+            self._connections.get()
+            .execute("SELECT entry FROM usage WHERE fingerprint = ? ORDER BY seq", (fingerprint,))
+            .fetchall()
+        )
+        for (entry,) in rows:
+            yield UsageEntry.model_validate_json(entry)
+
+    def version(self) -> str:
+        (version,) = self._connections.get().execute("SELECT version FROM usage_version WHERE id = 0").fetchone()
+        return f"store-{version}"
+
+    def mark_backfilled(self, fingerprint: str) -> None:
+        with self._connections.get() as connection:
+            connection.execute("INSERT OR IGNORE INTO usage_markers (name) VALUES (?)", (f"backfilled:{fingerprint}",))
+        self._backfilled.add(fingerprint)
+
+    def is_backfilled(self, fingerprint: str) -> bool:
+        if fingerprint not in self._backfilled:
+            marker = (f"backfilled:{fingerprint}",)
+            if self._connections.get().execute("SELECT 1 FROM usage_markers WHERE name = ?", marker).fetchone():
+                self._backfilled.add(fingerprint)
+        return fingerprint in self._backfilled
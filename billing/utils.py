@@ -1,3 +1,20 @@
+import re
+from collections.abc import Iterator
+
+# Texts longer than this are scanned a word or a chunk at a time, rather than with split() and slicing which copy the
+# whole text (several times over for split(), as each word is its own object in a list). Shorter texts take the faster
+# copying path.
+STREAMING_TEXT_THRESHOLD = 64 * 1024
+# A multiple of 3, so every chunk starts at a position which is a multiple of 3 (see count_third_position_chars).
+TEXT_CHUNK_SIZE = 3 * 16 * 1024
+
+# re's \s matches exactly the characters str.split() splits on, so this finds the same words.
+_WORD = re.compile(r"\S+")
+# The only character whose lowercase depends on its neighbours (a final sigma lowercases to ς rather than σ), so it's
+# the only one which can't be lowercased a character at a time.
+_CAPITAL_SIGMA = "Σ"
+
+
 def is_word(text: str) -> bool:
     """
     Assumptions: position of ' and - in a word is not important. Also, unicode letters are considered as normal characters.
@@ -17,5 +34,42 @@ def is_word(text: str) -> bool:
     return True
 
 
-def get_valid_words(text: str) -> list[str]:
-    return [word for word in text.split() if is_word(word)]
+def iter_words(text: str) -> Iterator[str]:
+    """The same words as text.split(), one at a time so a long text's words are never all held at once."""
+    if len(text) <= STREAMING_TEXT_THRESHOLD:
+        return iter(text.split())
+    return (match.group() for match in _WORD.finditer(text))
+
+
+def iter_valid_words(text: str) -> Iterator[str]:
+    return (word for word in iter_words(text) if is_word(word))
+
+
+def count_third_position_chars(text: str, chars: set[str]) -> int:
+    """How many of every 3rd character, i.e. (i + 1) % 3 == 0, are in `chars`. Copies at most a chunk at a time."""
+    count = 0
+    for start in range(0, len(text), TEXT_CHUNK_SIZE):
+        count += sum(1 for char in text[start + 2 : start + TEXT_CHUNK_SIZE : 3] if char in chars)
+    return count
+
+
+def is_alnum_palindrome(text: str) -> bool:
+    """
+    Whether the text's letters and digits, lowercased, read the same backwards.
+
+    Assumption: empty string are not considered palindromes.
+    """
+    if len(text) <= STREAMING_TEXT_THRESHOLD or _CAPITAL_SIGMA in text:
+        cleaned_text = "".join(c for c in text if c.isalnum()).lower()
+        return bool(cleaned_text) and cleaned_text == cleaned_text[::-1]
+
+    # Two pointers walking in from either end, without building the cleaned text. A character can lowercase to more
+    # than one (e.g. İ), so the pointers walk the lowercased characters to compare exactly what the copy would.
+    forwards = (lowered for char in text if char.isalnum() for lowered in char.lower())
+    backwards = (lowered for char in reversed(text) if char.isalnum() for lowered in reversed(char.lower()))
+    compared = False
+    for forward, backward in zip(forwards, backwards, strict=True):
+        if forward != backward:
+            return False
+        compared = True
+    return compared
@@ -0,0 +1,45 @@
+import logging
+import threading
+from collections.abc import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshWorker:
+    """
+    Runs `refresh` once straight away and then every `interval_seconds` in a background thread.
+
+    Decision #1: A thread instead of an asyncio task, since the services use blocking requests calls. Running them on
+    the event loop would block every other request while the upstream is being fetched.
+
+    Decision #2: `ready` is only set after the first successful refresh, so a readiness probe can keep traffic away from
+    a new replica until its caches are warm. A failed refresh is logged and retried on the next interval.
+    """
+
+    def __init__(self, refresh: Callable[[], None], interval_seconds: float) -> None:
+        self._refresh = refresh
+        self._interval_seconds = interval_seconds
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.ready = threading.Event()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="refresh-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._refresh()
+                self.ready.set()
+            except Exception as e:
+                logger.error(f"Error refreshing caches: {str(e)}")
+            self._stop.wait(self._interval_seconds)
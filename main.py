@@ -1,6 +1,57 @@
-from fastapi import FastAPI
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from functools import partial
 
-from billing.router import router
+from fastapi import FastAPI, Request, Response
 
-app = FastAPI()
+from billing.constants import USAGE_REFRESH_ENABLED, USAGE_REFRESH_INTERVAL_SECONDS
+from billing.container import ServiceContainer, get_container
+from billing.router import load_usage_snapshot, refresh_usage_responses, router
+from billing.worker import RefreshWorker
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # Decision: Warm the caches in the background rather than blocking startup, the /ready endpoint tells the load
+    # balancer when the warm-up has finished. When disabled the app is ready straight away.
+    container = ServiceContainer.from_config()
+    app.state.container = container
+    load_usage_snapshot(container)
+    worker = RefreshWorker(partial(refresh_usage_responses, container), USAGE_REFRESH_INTERVAL_SECONDS)
+    app.state.refresh_worker = worker
+    if USAGE_REFRESH_ENABLED:
+        worker.start()
+    else:
+        worker.ready.set()
+    if container.ingestion_service is not None:
+        container.ingestion_service.start()
+    yield
+    worker.stop(timeout=5)
+    if container.ingestion_service is not None:
+        container.ingestion_service.stop(timeout=5)
+    container.close()
+
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(router)
+
+
+@app.get("/ready", include_in_schema=False)
+def ready(request: Request) -> Response:
+    worker: RefreshWorker | None = getattr(request.app.state, "refresh_worker", None)
+    if worker is None or not worker.ready.is_set():
+        return Response(status_code=503)
+    return Response(status_code=200)
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics(request: Request) -> dict[str, float]:
+    """Admission control of /usage: the requests in flight and queued now, and those admitted and shed since startup."""
+    stats = get_container(request).usage_admission.stats
+    return {
+        "usage_in_flight": stats.in_flight,
+        "usage_queued": stats.queued,
+        "usage_admitted_total": stats.admitted,
+        "usage_shed_total": stats.shed,
+        "usage_shed_rate": stats.shed_rate,
+    }
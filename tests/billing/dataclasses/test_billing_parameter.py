@@ -1,5 +1,8 @@
+from dataclasses import replace
+
 import pytest
 
+from billing.constants import DEFAULT_BILLING_PARAMETERS
 from billing.dataclasses import BillingParameters, Credit
 
 
@@ -35,3 +38,12 @@ class TestInit:
             )
 
     # TODO If more time, add all tests for type checks, but if we used pydantic we would get this for free.
+
+
+class TestFingerprint:
+    def test_same_values__same_fingerprint(self) -> None:
+        assert DEFAULT_BILLING_PARAMETERS.fingerprint() == replace(DEFAULT_BILLING_PARAMETERS).fingerprint()
+
+    def test_different_values__different_fingerprint(self) -> None:
+        changed = replace(DEFAULT_BILLING_PARAMETERS, VOWEL_COST=Credit.from_float(0.4))
+        assert DEFAULT_BILLING_PARAMETERS.fingerprint() != changed.fingerprint()
@@ -1,26 +1,56 @@
+import time
 from collections.abc import Generator
+from pathlib import Path
+from typing import cast
 from unittest.mock import Mock, patch
 
 import pytest
 from fastapi import HTTPException
 from fastapi.testclient import TestClient
 
-from billing.schemas import UsageEntry, UsageResponse
+from billing.admission import AdmissionController
+from billing.constants import DEFAULT_BILLING_PARAMETERS, USAGE_CACHE_TTL_SECONDS, USAGE_RETRY_AFTER_SECONDS
+from billing.container import ServiceContainer, get_container
+from billing.dataclasses import Credit
+from billing.router import refresh_usage_response, refresh_usage_responses
+from billing.schemas import MemoryProfileReport, UsageEntry, UsageEntryStatus, UsageResponse, UsageSummary
+from billing.services.credit_calculation_service import CalculateCreditsService
+from billing.services.usage_service import summarise_usage
+from billing.snapshot import UsageSnapshot, write_usage_snapshot
+from billing.tracing import InMemorySpanExporter, Tracer
+from billing.usage_store import UsageStore
 from main import app
 
+DEFAULT_PRICING_FINGERPRINT = CalculateCreditsService(DEFAULT_BILLING_PARAMETERS).fingerprint
+
+
+@pytest.fixture
+def container() -> ServiceContainer:
+    container = ServiceContainer.from_config()
+    container.message_service = Mock()
+    container.message_service.fetch_version.return_value = "version-1"
+    container.usage_service = Mock()
+    container.pricing_simulation_service = Mock()
+    return container
+
 
 @pytest.fixture
-def client() -> TestClient:
-    return TestClient(app)
+def client(container: ServiceContainer) -> Generator[TestClient, None, None]:
+    app.dependency_overrides[get_container] = lambda: container
+    yield TestClient(app)
+    app.dependency_overrides.clear()
 
 
 class TestUsageEndpoint:
     endpoint = "/usage"
 
     @pytest.fixture
-    def mock_usage_service(self) -> Generator[Mock, None, None]:
-        with patch("billing.router.UsageService") as mock:
-            yield mock.return_value
+    def mock_message_service(self, container: ServiceContainer) -> Mock:
+        return cast(Mock, container.message_service)
+
+    @pytest.fixture
+    def mock_usage_service(self, container: ServiceContainer) -> Mock:
+        return cast(Mock, container.usage_service)
 
     def test_successful_request__returns_200_with_usage_data(
         self,
@@ -98,4 +128,449 @@ class TestUsageEndpoint:
 
         assert response.status_code == 500
 
+    def test_repeat_request__served_from_cache(
+        self,
+        client: TestClient,
+        mock_usage_service: Mock,
+    ) -> None:
+        mock_usage_service.get_usage.return_value = UsageResponse(usage=[])
+
+        first = client.get(self.endpoint)
+        second = client.get(self.endpoint)
+
+        assert first.headers["X-Cache"] == "miss"
+        assert second.headers["X-Cache"] == "hit"
+        assert first.content == second.content
+        mock_usage_service.get_usage.assert_called_once()
+
+    def test_stale_response__served_and_revalidated(
+        self,
+        client: TestClient,
+        mock_usage_service: Mock,
+        mock_message_service: Mock,
+        container: ServiceContainer,
+    ) -> None:
+        mock_usage_service.get_usage.return_value = UsageResponse(usage=[])
+        client.get(self.endpoint)
+        mock_message_service.fetch_version.return_value = "version-2"
+
+        with patch.object(
+            container.usage_response_cache, "_clock", return_value=time.monotonic() + USAGE_CACHE_TTL_SECONDS + 1
+        ):
+            response = client.get(self.endpoint)
+
+        assert response.headers["X-Cache"] == "stale"
+        assert mock_usage_service.get_usage.call_count == 2
+
+    def test_incomplete_response__not_cached_and_recomputed_in_background(
+        self,
+        client: TestClient,
+        mock_usage_service: Mock,
+    ) -> None:
+        pending = UsageEntry(
+            message_id=1, timestamp="2024-01-01T00:00:00", credits_used=0, status=UsageEntryStatus.PENDING
+        )
+        complete = UsageEntry(message_id=1, timestamp="2024-01-01T00:00:00", report_name="Report", credits_used=5)
+        mock_usage_service.get_usage.side_effect = [
+            UsageResponse(usage=[pending], complete=False),
+            UsageResponse(usage=[complete]),
+        ]
+
+        first = client.get(self.endpoint)
+        second = client.get(self.endpoint)
+
+        assert first.headers["X-Cache"] == "miss"
+        assert first.json() == {"usage": [pending.model_dump(exclude_none=True)], "complete": False}
+        # The complete usage was computed in the background (without a deadline) after the first response.
+        assert second.headers["X-Cache"] == "hit"
+        assert second.json()["complete"] is True
+        assert mock_usage_service.get_usage.call_args_list[1].args[1] is None
+
+    def test_overloaded__cache_misses_shed_and_hits_served(
+        self,
+        client: TestClient,
+        mock_usage_service: Mock,
+        container: ServiceContainer,
+    ) -> None:
+        mock_usage_service.get_usage.return_value = UsageResponse(usage=[])
+        client.get(self.endpoint)
+        container.usage_admission = AdmissionController(max_in_flight=0, max_queued=0, queue_timeout_seconds=0)
+
+        hit = client.get(self.endpoint)
+        container.usage_response_cache.clear()
+        miss = client.get(self.endpoint)
+
+        assert hit.status_code == 200
+        assert miss.status_code == 503
+        assert miss.headers["Retry-After"] == str(USAGE_RETRY_AFTER_SECONDS)
+        assert container.usage_admission.stats.shed == 1
+
+    def test_deadline__started_on_arrival_and_bounds_admission(
+        self,
+        client: TestClient,
+        mock_usage_service: Mock,
+        container: ServiceContainer,
+    ) -> None:
+        mock_usage_service.get_usage.return_value = UsageResponse(usage=[])
+        admission = Mock(wraps=container.usage_admission)
+        container.usage_admission = admission
+
+        with patch("billing.router.USAGE_DEADLINE_SECONDS", 5):
+            client.get(self.endpoint)
+
+        # The deadline the request waited for admission under is the one the usage is computed against.
+        (deadline,) = admission.admit.call_args.args
+        assert deadline is not None
+        assert mock_usage_service.get_usage.call_args.args[1] is deadline
+
+    def test_large_response__compressed_when_client_accepts_gzip(
+        self,
+        client: TestClient,
+        mock_usage_service: Mock,
+    ) -> None:
+        usage = [UsageEntry(message_id=i, timestamp="2024-01-01T00:00:00", credits_used=1.5) for i in range(100)]
+        mock_usage_service.get_usage.return_value = UsageResponse(usage=usage)
+
+        compressed = client.get(self.endpoint, headers={"Accept-Encoding": "gzip"})
+        uncompressed = client.get(self.endpoint, headers={"Accept-Encoding": "identity"})
+
+        assert compressed.headers["Content-Encoding"] == "gzip"
+        assert int(compressed.headers["Content-Length"]) < len(uncompressed.content)
+        assert "Content-Encoding" not in uncompressed.headers
+        assert compressed.headers["Vary"] == uncompressed.headers["Vary"] == "Accept-Encoding"
+        # The client decompresses transparently.
+        assert compressed.content == uncompressed.content
+        # Both were served from the one cached response, compressed once.
+        assert compressed.headers["X-Cache"] == "miss"
+        assert uncompressed.headers["X-Cache"] == "hit"
+
+    def test_memory_profile_header__returns_profile_of_computation(
+        self,
+        client: TestClient,
+        mock_usage_service: Mock,
+        container: ServiceContainer,
+    ) -> None:
+        mock_usage_service.get_usage.return_value = UsageResponse(usage=[])
+        client.get(self.endpoint)
+
+        with patch("billing.router.MEMORY_PROFILING_ENABLED", True):
+            response = client.get(self.endpoint, headers={"X-Memory-Profile": "true"})
+
+        report = MemoryProfileReport.model_validate_json(response.content)
+        assert response.status_code == 200
+        assert report.view == "usage"
+        assert [stage.stage for stage in report.stages] == [
+            "usage",
+            "usage/build_response",
+            "usage/encode_response",
+            "usage/compress_response",
+        ]
+        # Computed although the response was cached.
+        assert mock_usage_service.get_usage.call_count == 2
+        assert container.usage_admission.stats.admitted == 2
+
+    def test_memory_profile_header__ignored_unless_enabled(
+        self,
+        client: TestClient,
+        mock_usage_service: Mock,
+    ) -> None:
+        mock_usage_service.get_usage.return_value = UsageResponse(usage=[])
+
+        response = client.get(self.endpoint, headers={"X-Memory-Profile": "true"})
+
+        assert response.json() == {"usage": [], "complete": True}
+
+    def test_cold_cache_with_snapshot__served_from_snapshot(
+        self,
+        client: TestClient,
+        mock_usage_service: Mock,
+        container: ServiceContainer,
+        tmp_path: Path,
+    ) -> None:
+        entry = UsageEntry(message_id=1, timestamp="2024-01-01T00:00:00.5Z", credits_used=2.5)
+        write_usage_snapshot(tmp_path / "usage.snapshot", [entry], DEFAULT_PRICING_FINGERPRINT, version="version-1")
+        container.usage_snapshot = UsageSnapshot.open(tmp_path / "usage.snapshot")
+
+        response = client.get(self.endpoint)
+
+        assert response.status_code == 200
+        assert response.headers["X-Cache"] == "stale"
+        # The same bytes as the live response.
+        assert response.content == UsageResponse(usage=[entry]).model_dump_json(exclude_none=True).encode()
+        # The upstream version matches the snapshot, so revalidating doesn't recompute it.
+        mock_usage_service.get_usage.assert_not_called()
+
+    def test_snapshot_with_other_pricing__not_served(
+        self,
+        client: TestClient,
+        mock_usage_service: Mock,
+        container: ServiceContainer,
+        tmp_path: Path,
+    ) -> None:
+        old_entry = UsageEntry(message_id=1, timestamp="2024-01-01T00:00:00", credits_used=3.0)
+        write_usage_snapshot(tmp_path / "usage.snapshot", [old_entry], "old-pricing", version="version-1")
+        container.usage_snapshot = UsageSnapshot.open(tmp_path / "usage.snapshot")
+        entry = UsageEntry(message_id=1, timestamp="2024-01-01T00:00:00", credits_used=9.0)
+        mock_usage_service.get_usage.return_value = UsageResponse(usage=[entry])
+        mock_usage_service.get_usage_summary.return_value = summarise_usage([entry])
+        mock_usage_service.iter_usage_entries.return_value = iter([entry])
+
+        response = client.get(self.endpoint)
+        with patch("billing.router.USAGE_SNAPSHOT_PATH", str(tmp_path / "usage.snapshot")):
+            refresh_usage_responses(container)
+
+        assert response.headers["X-Cache"] == "miss"
+        assert response.json()["usage"][0]["credits_used"] == 9.0
+        # Rewritten with the current pricing, although the upstream version is the same.
+        assert container.usage_snapshot.fingerprint == DEFAULT_PRICING_FINGERPRINT
+        assert next(container.usage_snapshot.iter_usage_entries()) == entry
+
+    def test_credits_not_representable__snapshot_skipped(
+        self,
+        mock_usage_service: Mock,
+        container: ServiceContainer,
+        tmp_path: Path,
+    ) -> None:
+        entry = UsageEntry(message_id=1, timestamp="2024-01-01T00:00:00", credits_used=0.1234567)
+        mock_usage_service.get_usage.return_value = UsageResponse(usage=[entry])
+        mock_usage_service.get_usage_summary.return_value = summarise_usage([entry])
+        mock_usage_service.iter_usage_entries.return_value = iter([entry])
+
+        with patch("billing.router.USAGE_SNAPSHOT_PATH", str(tmp_path / "usage.snapshot")):
+            refresh_usage_responses(container)
+
+        assert not (tmp_path / "usage.snapshot").exists()
+        assert container.usage_snapshot is None
+        assert container.usage_response_cache.lookup("usage:" + DEFAULT_PRICING_FINGERPRINT)[0] is not None
+
+    def test_customer_id__uses_customer_calculator(
+        self,
+        client: TestClient,
+        mock_usage_service: Mock,
+        container: ServiceContainer,
+    ) -> None:
+        mock_usage_service.get_usage.return_value = UsageResponse(usage=[])
+        calculator = Mock(fingerprint="customer-pricing")
+        container.billing_parameters_service = Mock()
+        container.billing_parameters_service.get_calculator.return_value = calculator
+
+        response = client.get(self.endpoint, params={"customer_id": "acme"})
+
+        assert response.status_code == 200
+        container.billing_parameters_service.get_calculator.assert_called_with("acme")
+        mock_usage_service.get_usage.assert_called_once_with(calculator, None, False)
+
+    def test_traced_request__records_request_encoding_and_compression_spans(
+        self,
+        client: TestClient,
+        mock_usage_service: Mock,
+        container: ServiceContainer,
+    ) -> None:
+        mock_usage_service.get_usage.return_value = UsageResponse(usage=[])
+        exporter = InMemorySpanExporter()
+        container.tracer = Tracer(exporter, sample_rate=1.0)
+
+        client.get(self.endpoint)
+
+        encode, compress, request = exporter.spans
+        assert (request.name, encode.name, compress.name) == ("usage", "encode_response", "compress_response")
+        assert encode.parent_span_id == compress.parent_span_id == request.span_id
+        assert request.attributes["cache"] == "miss"
+
     # NOTE: Could add more tests for other error cases (e.g. report service error, calculate credits service error) etc, but omitted for brevity.
+
+
+class TestUsageSummaryEndpoint:
+    endpoint = "/usage/summary"
+
+    @pytest.fixture
+    def mock_usage_service(self, container: ServiceContainer) -> Mock:
+        return cast(Mock, container.usage_service)
+
+    def test_successful_request__returns_200_with_summary(
+        self,
+        client: TestClient,
+        mock_usage_service: Mock,
+    ) -> None:
+        mock_usage_service.get_usage_summary.return_value = UsageSummary(
+            total_credits=12.5,
+            message_count=2,
+            credits_by_report={"Test report": 10.0},
+            message_count_by_report={"Test report": 1},
+            credits_by_day={"2024-01-01": 12.5},
+        )
+
+        response = client.get(self.endpoint)
+
+        assert response.status_code == 200
+        assert response.json() == {
+            "complete": True,
+            "total_credits": 12.5,
+            "message_count": 2,
+            "credits_by_report": {"Test report": 10.0},
+            "message_count_by_report": {"Test report": 1},
+            "credits_by_day": {"2024-01-01": 12.5},
+        }
+        mock_usage_service.get_usage.assert_not_called()
+
+
+class TestSimulationsEndpoint:
+    endpoint = "/usage/simulations"
+
+    @pytest.fixture
+    def mock_simulation_service(self, container: ServiceContainer) -> Mock:
+        return cast(Mock, container.pricing_simulation_service)
+
+    @pytest.fixture
+    def parameters_payload(self) -> dict[str, str | int]:
+        return {
+            "base_credit_cost": "1",
+            "char_credit_cost": "0.05",
+            "length_penalty_threshold": 100,
+            "one_to_three_word_length_cost": "0.1",
+            "four_to_seven_word_length_cost": "0.2",
+            "eight_plus_word_length_cost": "0.3",
+            "length_penalty_credits": "5",
+            "unique_words_bonus": "2",
+            "palindrome_multiplier": 2,
+            "vowel_cost": "0.3",
+        }
+
+    def test_parameter_sets__returns_total_per_set(
+        self,
+        client: TestClient,
+        mock_simulation_service: Mock,
+        parameters_payload: dict[str, str | int],
+    ) -> None:
+        mock_simulation_service.simulate.return_value = [Credit.from_float(10.5), Credit.from_int(12)]
+
+        response = client.post(self.endpoint, json={"parameter_sets": [parameters_payload, parameters_payload]})
+
+        assert response.status_code == 200
+        assert response.json() == {"results": [{"total_credits": 10.5}, {"total_credits": 12.0}]}
+        (parameter_sets,) = mock_simulation_service.simulate.call_args.args
+        assert parameter_sets == [DEFAULT_BILLING_PARAMETERS, DEFAULT_BILLING_PARAMETERS]
+
+    @pytest.mark.parametrize(
+        "invalid",
+        [
+            {"length_penalty_threshold": -1},
+            {"palindrome_multiplier": -1},
+            {"vowel_cost": "NaN"},
+            {"base_credit_cost": "Infinity"},
+        ],
+    )
+    def test_invalid_parameters__returns_422(
+        self, client: TestClient, parameters_payload: dict[str, str | int], invalid: dict[str, str | int]
+    ) -> None:
+        response = client.post(self.endpoint, json={"parameter_sets": [parameters_payload | invalid]})
+
+        assert response.status_code == 422
+
+    def test_no_parameter_sets__returns_422(self, client: TestClient) -> None:
+        response = client.post(self.endpoint, json={"parameter_sets": []})
+
+        assert response.status_code == 422
+
+
+class TestIngestionEndpoint:
+    endpoint = "/messages"
+
+    @pytest.fixture
+    def usage_store(self, container: ServiceContainer, tmp_path: Path) -> UsageStore:
+        container.usage_store = UsageStore(tmp_path / "usage.sqlite")
+        container.usage_store.mark_backfilled(DEFAULT_PRICING_FINGERPRINT)
+        container.ingestion_service = Mock()
+        container.ingestion_service.submit.return_value = True
+        return container.usage_store
+
+    @pytest.fixture
+    def messages_payload(self) -> dict[str, list[dict[str, str | int]]]:
+        return {"messages": [{"id": 1, "timestamp": "2024-01-01T00:00:00", "text": "hello"}]}
+
+    def test_messages__accepted_for_ingestion(
+        self,
+        client: TestClient,
+        container: ServiceContainer,
+        usage_store: UsageStore,
+        messages_payload: dict[str, list[dict[str, str | int]]],
+    ) -> None:
+        response = client.post(self.endpoint, json=messages_payload)
+
+        assert response.status_code == 202
+        assert response.json() == {"accepted": 1}
+        (messages,) = cast(Mock, container.ingestion_service).submit.call_args.args
+        assert [message.id for message in messages] == [1]
+
+    def test_full_queue__returns_503_with_retry_after(
+        self,
+        client: TestClient,
+        container: ServiceContainer,
+        usage_store: UsageStore,
+        messages_payload: dict[str, list[dict[str, str | int]]],
+    ) -> None:
+        cast(Mock, container.ingestion_service).submit.return_value = False
+
+        response = client.post(self.endpoint, json=messages_payload)
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+    def test_ingestion_disabled__returns_404(
+        self,
+        client: TestClient,
+        messages_payload: dict[str, list[dict[str, str | int]]],
+    ) -> None:
+        assert client.post(self.endpoint, json=messages_payload).status_code == 404
+
+    def test_usage__read_from_store_without_upstream(
+        self,
+        client: TestClient,
+        container: ServiceContainer,
+        usage_store: UsageStore,
+    ) -> None:
+        entry = UsageEntry(message_id=1, timestamp="2024-01-01T00:00:00", credits_used=2.5)
+        usage_store.append([entry], DEFAULT_PRICING_FINGERPRINT)
+
+        usage = client.get("/usage")
+        summary = client.get("/usage/summary")
+
+        assert usage.json() == {"usage": [entry.model_dump(exclude_none=True)], "complete": True}
+        assert summary.json()["total_credits"] == 2.5
+        cast(Mock, container.usage_service).get_usage.assert_not_called()
+        cast(Mock, container.message_service).fetch_version.assert_not_called()
+
+    def test_store_not_backfilled__usage_read_from_upstream(
+        self,
+        client: TestClient,
+        container: ServiceContainer,
+        tmp_path: Path,
+    ) -> None:
+        container.usage_store = UsageStore(tmp_path / "unfilled.sqlite")
+        container.usage_store.append(
+            [UsageEntry(message_id=1, timestamp="2024-01-01T00:00:00", credits_used=2.5)], DEFAULT_PRICING_FINGERPRINT
+        )
+        upstream_entry = UsageEntry(message_id=2, timestamp="2024-01-01T00:00:00", credits_used=1)
+        cast(Mock, container.usage_service).get_usage.return_value = UsageResponse(usage=[upstream_entry])
+
+        usage = client.get("/usage")
+
+        assert usage.json()["usage"] == [upstream_entry.model_dump(exclude_none=True)]
+
+    def test_new_usage__invalidates_cached_response(
+        self,
+        client: TestClient,
+        container: ServiceContainer,
+        usage_store: UsageStore,
+    ) -> None:
+        usage_store.append(
+            [UsageEntry(message_id=1, timestamp="2024-01-01T00:00:00", credits_used=2.5)], DEFAULT_PRICING_FINGERPRINT
+        )
+        client.get("/usage")
+        usage_store.append(
+            [UsageEntry(message_id=2, timestamp="2024-01-01T00:00:00", credits_used=1)], DEFAULT_PRICING_FINGERPRINT
+        )
+
+        refresh_usage_response(container, "usage")
+
+        assert [entry["message_id"] for entry in client.get("/usage").json()["usage"]] == [1, 2]
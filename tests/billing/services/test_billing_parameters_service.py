@@ -0,0 +1,100 @@
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+from billing.constants import DEFAULT_BILLING_PARAMETERS
+from billing.dataclasses import Credit
+from billing.services.billing_parameters_service import BillingParametersService
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def customer_parameters(char_credit_cost: str = "0.1") -> dict[str, str | int]:
+    return {
+        "base_credit_cost": "1",
+        "char_credit_cost": char_credit_cost,
+        "length_penalty_threshold": 100,
+        "one_to_three_word_length_cost": "0.1",
+        "four_to_seven_word_length_cost": "0.2",
+        "eight_plus_word_length_cost": "0.3",
+        "length_penalty_credits": "5",
+        "unique_words_bonus": "2",
+        "palindrome_multiplier": 2,
+        "vowel_cost": "0.3",
+    }
+
+
+def write_config(path: Path, customers: dict[str, dict[str, str | int]], modified_at: int) -> None:
+    path.write_text(json.dumps({"customers": customers}))
+    # Explicit modification times, so reloads don't depend on the filesystem's timestamp resolution.
+    os.utime(path, ns=(modified_at, modified_at))
+
+
+class TestBillingParametersService:
+    @pytest.fixture
+    def clock(self) -> FakeClock:
+        return FakeClock()
+
+    @pytest.fixture
+    def config_path(self, tmp_path: Path) -> Path:
+        path = tmp_path / "billing_parameters.json"
+        write_config(path, {"acme": customer_parameters()}, modified_at=1)
+        return path
+
+    def test_no_config__uses_default_parameters(self) -> None:
+        service = BillingParametersService(DEFAULT_BILLING_PARAMETERS)
+
+        assert service.get_parameters() is DEFAULT_BILLING_PARAMETERS
+        assert service.get_parameters("acme") is DEFAULT_BILLING_PARAMETERS
+
+    def test_configured_customer__uses_customer_parameters(self, config_path: Path) -> None:
+        service = BillingParametersService(DEFAULT_BILLING_PARAMETERS, config_path)
+
+        assert service.get_parameters("acme").CHAR_CREDIT_COST == Credit.from_float(0.1)
+        assert service.get_parameters("other") is DEFAULT_BILLING_PARAMETERS
+
+    def test_config_changed__reloaded_after_interval(self, config_path: Path, clock: FakeClock) -> None:
+        service = BillingParametersService(DEFAULT_BILLING_PARAMETERS, config_path, clock=clock)
+        write_config(config_path, {"acme": customer_parameters("0.2")}, modified_at=2)
+
+        assert service.get_parameters("acme").CHAR_CREDIT_COST == Credit.from_float(0.1)
+        clock.now = 10
+        assert service.get_parameters("acme").CHAR_CREDIT_COST == Credit.from_float(0.2)
+
+    def test_invalid_config__keeps_previous_parameters(self, config_path: Path, clock: FakeClock) -> None:
+        service = BillingParametersService(DEFAULT_BILLING_PARAMETERS, config_path, clock=clock)
+        config_path.write_text("{not json")
+        os.utime(config_path, ns=(2, 2))
+
+        clock.now = 10
+
+        assert service.get_parameters("acme").CHAR_CREDIT_COST == Credit.from_float(0.1)
+
+    def test_same_parameters__share_calculator(self, tmp_path: Path) -> None:
+        path = tmp_path / "billing_parameters.json"
+        write_config(path, {"acme": customer_parameters(), "globex": customer_parameters()}, modified_at=1)
+        service = BillingParametersService(DEFAULT_BILLING_PARAMETERS, path)
+
+        assert service.get_calculator("acme") is service.get_calculator("globex")
+        assert service.get_calculator("acme") is not service.get_calculator()
+
+    def test_more_pricings_than_max__evicts_least_recently_used(self, tmp_path: Path) -> None:
+        path = tmp_path / "billing_parameters.json"
+        write_config(path, {"acme": customer_parameters("0.1"), "globex": customer_parameters("0.2")}, modified_at=1)
+        service = BillingParametersService(DEFAULT_BILLING_PARAMETERS, path, max_calculators=2)
+        default_calculator = service.get_calculator()
+        acme_calculator = service.get_calculator("acme")
+
+        service.get_calculator()
+        service.get_calculator("globex")
+
+        assert service.get_calculator() is default_calculator
+        assert service.get_calculator("acme") is not acme_calculator
@@ -1,11 +1,18 @@
+from dataclasses import replace
 from decimal import Decimal
+from unittest.mock import Mock, patch
 
 import pytest
 
 from billing.constants import DEFAULT_BILLING_PARAMETERS
 from billing.dataclasses import BillingParameters, Credit
 from billing.services.credit_calculation_service import (
+    DEFAULT_RULES,
     CalculateCreditsService,
+    CreditRule,
+    RuleKind,
+    TextFeatures,
+    WordStats,
     character_count_rule,
     length_penalty_rule,
     palindrome_bonus_rule,
@@ -13,6 +20,7 @@ from billing.services.credit_calculation_service import (
     vowels_bonus_rule,
     word_length_multiplier_rule,
 )
+from billing.utils import STREAMING_TEXT_THRESHOLD, TEXT_CHUNK_SIZE, is_word
 
 
 @pytest.fixture
@@ -143,3 +151,117 @@ class TestCalculateCredits:
         text = "wow wow"
         result = CalculateCreditsService(default_parameters).calculate_credits(text)
         assert result == Credit.from_float(3.7)
+
+
+class TestRuleRegistry:
+    def test_registered_rule__applied_to_credits(self, default_parameters: BillingParameters) -> None:
+        service = CalculateCreditsService(default_parameters)
+        service.register_rule(
+            CreditRule(
+                name="exclamation_surcharge",
+                kind=RuleKind.ADD,
+                apply=lambda features, parameters: Credit.from_int(10) if "!" in features.text else Credit.zero(),
+                cost=1,
+            )
+        )
+
+        without_surcharge = CalculateCreditsService(default_parameters).calculate_credits("hello there")
+        assert service.calculate_credits("hello there") == without_surcharge
+        assert service.calculate_credits("hello there!") > without_surcharge
+
+    def test_zero_cost_rules__not_registered(self, default_parameters: BillingParameters) -> None:
+        parameters = replace(default_parameters, VOWEL_COST=Credit.zero(), PALINDROME_MULTIPLIER=1)
+
+        names = [rule.name for rule in CalculateCreditsService(parameters).rules]
+
+        assert "vowels_bonus" not in names
+        assert "palindrome_bonus" not in names
+        assert len(names) == len(DEFAULT_RULES) - 2
+
+    def test_rules__cheapest_first(self, default_parameters: BillingParameters) -> None:
+        rules = CalculateCreditsService(default_parameters).rules
+
+        assert [rule.cost for rule in rules] == sorted(rule.cost for rule in rules)
+        assert rules[0].name == "character_count"
+
+    def test_zero_multiplier__short_circuits_other_rules(self, default_parameters: BillingParameters) -> None:
+        expensive_rule = Mock(return_value=Credit.from_int(100))
+        service = CalculateCreditsService(replace(default_parameters, PALINDROME_MULTIPLIER=0))
+        service.register_rule(CreditRule(name="expensive", kind=RuleKind.ADD, apply=expensive_rule, cost=100))
+
+        assert service.calculate_credits("radar") == Credit.from_int(1)
+        expensive_rule.assert_not_called()
+
+    def test_word_rules__tokenize_text_once(self, default_parameters: BillingParameters) -> None:
+        with patch(
+            "billing.services.credit_calculation_service.iter_valid_words", return_value=iter(["hello"])
+        ) as mock:
+            CalculateCreditsService(default_parameters).calculate_credits("hello")
+
+        mock.assert_called_once_with("hello")
+
+
+class TestTextFeatures:
+    def test_features__match_rule_definitions(self) -> None:
+        features = TextFeatures("abedfI man")
+
+        assert features.length == 10
+        assert features.third_position_vowels == 3
+        assert features.is_palindrome is False
+        assert features.word_stats == WordStats(1, 1, 0, has_unique_words=True)
+
+
+def _in_memory_credits(text: str, parameters: BillingParameters) -> Credit:
+    """The credits computed the straightforward way, from a list of the words and copies of the text."""
+    words = [word for word in text.split() if is_word(word)]
+    credits = parameters.BASE_CREDIT_COST + parameters.CHAR_CREDIT_COST * len(text)
+    for word in words:
+        if len(word) <= 3:
+            credits += parameters.ONE_TO_THREE_WORD_LENGTH_COST
+        elif len(word) <= 7:
+            credits += parameters.FOUR_TO_SEVEN_WORD_LENGTH_COST
+        else:
+            credits += parameters.EIGHT_PLUS_WORD_LENGTH_COST
+    if len(text) > parameters.LENGTH_PENALTY_THRESHOLD:
+        credits += parameters.LENGTH_PENALTY_CREDITS
+    if words and len(words) == len(set(words)):
+        credits -= parameters.UNIQUE_WORDS_BONUS
+    credits += parameters.VOWEL_COST * sum(1 for char in text[2::3] if char in parameters.VOWELS)
+    cleaned_text = "".join(c for c in text if c.isalnum()).lower()
+    if cleaned_text and cleaned_text == cleaned_text[::-1]:
+        credits *= parameters.PALINDROME_MULTIPLIER
+    return max(credits, Credit.from_int(1))
+
+
+class TestLargeTexts:
+    @pytest.mark.parametrize(
+        "text",
+        [
+            # Words straddling every chunk boundary.
+            "abcdefghij " * (STREAMING_TEXT_THRESHOLD // 5),
+            "x" * (TEXT_CHUNK_SIZE - 1) + " aeiou " * 20_000,
+            " ".join(f"word{'a' * (i % 13)}" for i in range(20_000)) + "\t\n\u00a0 unique-words don't",
+            " ".join("".join(chr(97 + (i // 26**j) % 26) for j in range(4)) for i in range(30_000)),
+        ],
+        ids=["repeated_words", "chunk_boundary_vowels", "mixed_whitespace", "unique_words"],
+    )
+    def test_credits__match_in_memory_calculation(self, default_parameters: BillingParameters, text: str) -> None:
+        assert len(text) > STREAMING_TEXT_THRESHOLD
+        assert CalculateCreditsService(default_parameters).calculate_credits(text) == _in_memory_credits(
+            text, default_parameters
+        )
+
+    @pytest.mark.parametrize(
+        "half",
+        ["ab1 Cd," * 20_000, "İx" * 40_000, "Σa" * 40_000],
+        ids=["ascii", "multi_char_lowercase", "final_sigma"],
+    )
+    def test_palindromes__match_in_memory_check(self, default_parameters: BillingParameters, half: str) -> None:
+        for text in (half + half[::-1], half + "z" + half[::-1], half + "!" + half[::-1]):
+            cleaned_text = "".join(c for c in text if c.isalnum()).lower()
+            expected = bool(cleaned_text) and cleaned_text == cleaned_text[::-1]
+
+            assert TextFeatures(text).is_palindrome is expected
+
+    def test_no_letters_or_digits__is_not_palindrome(self) -> None:
+        assert TextFeatures("!" * (STREAMING_TEXT_THRESHOLD + 1)).is_palindrome is False
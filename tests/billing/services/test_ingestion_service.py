@@ -0,0 +1,160 @@
+from collections.abc import Generator
+from pathlib import Path
+from unittest.mock import Mock
+
+import pytest
+from fastapi import HTTPException
+
+from billing.models import Message
+from billing.schemas import UsageEntry
+from billing.services.ingestion_service import IngestionService
+from billing.services.messages_service import MessageService
+from billing.services.usage_service import UsageService
+from billing.usage_store import UsageStore
+
+PRICING = "pricing-1"
+
+
+def price(messages: list[Message]) -> list[UsageEntry]:
+    return [
+        UsageEntry(message_id=message.id, timestamp=message.timestamp, credits_used=len(message.text))
+        for message in messages
+    ]
+
+
+def make_message(message_id: int, text: str = "text") -> Message:
+    return Message(id=message_id, timestamp="2024-01-01T00:00:00", text=text)
+
+
+@pytest.fixture
+def mock_usage_service() -> Mock:
+    mock = Mock(spec=UsageService)
+    mock.price_messages.side_effect = price
+    mock.fingerprint = PRICING
+    return mock
+
+
+@pytest.fixture
+def usage_store(tmp_path: Path) -> UsageStore:
+    return UsageStore(tmp_path / "usage.sqlite")
+
+
+@pytest.fixture
+def ingestion_service(mock_usage_service: Mock, usage_store: UsageStore) -> Generator[IngestionService, None, None]:
+    service = IngestionService(mock_usage_service, usage_store, max_queue_size=3, retry_seconds=0)
+    yield service
+    service.stop(timeout=5)
+
+
+class TestIngestionService:
+    def test_submitted_messages__priced_and_stored(
+        self,
+        ingestion_service: IngestionService,
+        usage_store: UsageStore,
+    ) -> None:
+        ingestion_service.start()
+
+        assert ingestion_service.submit([make_message(1, "hello"), make_message(2, "hi")])
+        ingestion_service.join()
+
+        assert [(entry.message_id, entry.credits_used) for entry in usage_store.iter_entries(PRICING)] == [
+            (1, 5),
+            (2, 2),
+        ]
+
+    def test_full_queue__rejects_all_of_the_messages(self, ingestion_service: IngestionService) -> None:
+        assert ingestion_service.submit([make_message(1), make_message(2)])
+
+        assert not ingestion_service.submit([make_message(3), make_message(4)])
+        assert ingestion_service.submit([make_message(3)])
+
+    def test_failed_batch__retried_until_stored(
+        self,
+        ingestion_service: IngestionService,
+        mock_usage_service: Mock,
+        usage_store: UsageStore,
+    ) -> None:
+        mock_usage_service.price_messages.side_effect = [HTTPException(status_code=500), price([make_message(1)])]
+        ingestion_service.start()
+
+        ingestion_service.submit([make_message(1)])
+        ingestion_service.join()
+
+        assert [entry.message_id for entry in usage_store.iter_entries(PRICING)] == [1]
+        assert mock_usage_service.price_messages.call_count == 2
+
+    def test_batch_failing_every_attempt__dropped(
+        self,
+        mock_usage_service: Mock,
+        usage_store: UsageStore,
+    ) -> None:
+        service = IngestionService(mock_usage_service, usage_store, retry_seconds=0, max_attempts=3)
+        mock_usage_service.price_messages.side_effect = [HTTPException(status_code=500)] * 3 + [
+            price([make_message(2)])
+        ]
+        service.start()
+
+        service.submit([make_message(1)])
+        service.join()
+        service.submit([make_message(2)])
+        service.join()
+        service.stop(timeout=5)
+
+        assert [entry.message_id for entry in usage_store.iter_entries(PRICING)] == [2]
+        assert mock_usage_service.price_messages.call_count == 4
+
+    def test_empty_store__backfilled_from_messages_api(
+        self,
+        mock_usage_service: Mock,
+        usage_store: UsageStore,
+    ) -> None:
+        mock_message_service = Mock(spec=MessageService)
+        mock_message_service.fetch_messages.return_value = [make_message(1), make_message(2)]
+        service = IngestionService(mock_usage_service, usage_store, mock_message_service, retry_seconds=0)
+        service.start()
+
+        service.submit([make_message(3)])
+        service.join()
+        service.stop(timeout=5)
+
+        assert [entry.message_id for entry in usage_store.iter_entries(PRICING)] == [1, 2, 3]
+        assert usage_store.is_backfilled(PRICING)
+
+    def test_store_backfilled_with_other_pricing__backfilled_again(
+        self,
+        mock_usage_service: Mock,
+        usage_store: UsageStore,
+    ) -> None:
+        usage_store.append(price([make_message(1, "old")]), "old-pricing")
+        usage_store.mark_backfilled("old-pricing")
+        mock_message_service = Mock(spec=MessageService)
+        mock_message_service.fetch_messages.return_value = [make_message(1)]
+        service = IngestionService(mock_usage_service, usage_store, mock_message_service, retry_seconds=0)
+        service.start()
+
+        service.submit([make_message(2)])
+        service.join()
+        service.stop(timeout=5)
+
+        assert usage_store.is_backfilled(PRICING)
+        assert [(entry.message_id, entry.credits_used) for entry in usage_store.iter_entries(PRICING)] == [
+            (1, 4),
+            (2, 4),
+        ]
+
+    def test_backfilled_store__not_backfilled_again(
+        self,
+        mock_usage_service: Mock,
+        usage_store: UsageStore,
+    ) -> None:
+        usage_store.mark_backfilled(PRICING)
+        mock_message_service = Mock(spec=MessageService)
+        service = IngestionService(mock_usage_service, usage_store, mock_message_service, retry_seconds=0)
+        service.start()
+
+        service.submit([make_message(3)])
+        service.join()
+        service.stop(timeout=5)
+
+        mock_message_service.fetch_messages.assert_not_called()
+        assert [entry.message_id for entry in usage_store.iter_entries(PRICING)] == [3]
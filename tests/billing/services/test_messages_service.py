@@ -4,6 +4,7 @@ import pytest
 import requests
 from fastapi import HTTPException
 
+from billing.constants import UPSTREAM_TIMEOUT_SECONDS
 from billing.models import Message
 from billing.services.messages_service import MessageService
 
@@ -58,7 +59,9 @@ class TestMessageService:
             assert result[0].report_id is None
             assert result[1].report_id is None
             assert result[2].report_id == 123
-            mock_get.assert_called_once_with("http://test-service.com/messages/current-period")
+            mock_get.assert_called_once_with(
+                "http://test-service.com/messages/current-period", timeout=UPSTREAM_TIMEOUT_SECONDS
+            )
 
     def test_server_error__raises_http_exception(
         self,
@@ -75,4 +78,25 @@ class TestMessageService:
             assert exc_info.value.status_code == 500
             assert "Failed to fetch messages" in str(exc_info.value.detail)
 
+    def test_fetch_version__returns_etag(
+        self,
+        message_service: MessageService,
+    ) -> None:
+        with patch("requests.head") as mock_head:
+            mock_head.return_value.headers = {"ETag": '"0x8DC"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"}
+
+            assert message_service.fetch_version() == '"0x8DC"'
+            mock_head.assert_called_once_with(
+                "http://test-service.com/messages/current-period", timeout=UPSTREAM_TIMEOUT_SECONDS
+            )
+
+    def test_fetch_version_error__returns_none(
+        self,
+        message_service: MessageService,
+    ) -> None:
+        with patch("requests.head") as mock_head:
+            mock_head.side_effect = requests.exceptions.ConnectionError()
+
+            assert message_service.fetch_version() is None
+
     # NOTE: Could have added more tests e.g. missing keys etc. but omitted for brevity.
@@ -0,0 +1,84 @@
+from dataclasses import replace
+from decimal import Decimal
+from unittest.mock import Mock
+
+import pytest
+
+from billing.constants import DEFAULT_BILLING_PARAMETERS
+from billing.dataclasses import BillingParameters, Credit
+from billing.models import Message, Report
+from billing.services.credit_calculation_service import CalculateCreditsService
+from billing.services.messages_service import MessageService
+from billing.services.pricing_simulation_service import (
+    FeatureCreditsService,
+    PricingSimulationService,
+    extract_message_features,
+    price_message_features,
+)
+from billing.services.reports_service import ReportService
+
+TEXTS = [
+    "",
+    "hi",
+    "wow wow",
+    "A man a plan a canal Panama",
+    "The quick brown fox jumps over the lazy dog, extraordinarily!",
+    "hello hello world 123",
+    "x" * 150,
+    "Réunion naïve café-au-lait don't",
+]
+
+PARAMETER_SETS = [
+    DEFAULT_BILLING_PARAMETERS,
+    replace(DEFAULT_BILLING_PARAMETERS, CHAR_CREDIT_COST=Credit.from_float(0.07), LENGTH_PENALTY_THRESHOLD=20),
+    replace(DEFAULT_BILLING_PARAMETERS, PALINDROME_MULTIPLIER=0, UNIQUE_WORDS_BONUS=Credit.from_int(0)),
+    replace(DEFAULT_BILLING_PARAMETERS, VOWEL_COST=Credit.from_float(1.5), EIGHT_PLUS_WORD_LENGTH_COST=Credit.zero()),
+]
+
+
+class TestPriceMessageFeatures:
+    @pytest.mark.parametrize("text", TEXTS)
+    @pytest.mark.parametrize("parameters", PARAMETER_SETS)
+    def test_any_text__matches_calculate_credits(self, text: str, parameters: BillingParameters) -> None:
+        expected = CalculateCreditsService(parameters).calculate_credits(text)
+
+        assert price_message_features(extract_message_features(text), parameters) == expected
+
+
+class TestFeatureCreditsService:
+    @pytest.mark.parametrize("text", TEXTS)
+    def test_any_text__matches_calculate_credits_service(self, text: str) -> None:
+        expected = CalculateCreditsService(DEFAULT_BILLING_PARAMETERS).calculate_credits(text)
+
+        assert FeatureCreditsService(DEFAULT_BILLING_PARAMETERS).calculate_credits(text) == expected
+
+
+class TestSimulate:
+    @pytest.fixture
+    def mock_message_service(self) -> Mock:
+        return Mock(spec=MessageService)
+
+    @pytest.fixture
+    def mock_report_service(self) -> Mock:
+        return Mock(spec=ReportService)
+
+    def test_many_parameter_sets__totals_match_calculator_per_set(
+        self,
+        mock_message_service: Mock,
+        mock_report_service: Mock,
+    ) -> None:
+        messages = [Message(id=i, timestamp="2024-01-01T00:00:00", text=text) for i, text in enumerate(TEXTS)]
+        messages.append(Message(id=100, timestamp="2024-01-01T00:00:00", text="billed by report", report_id=1))
+        mock_message_service.fetch_messages.return_value = messages
+        mock_report_service.fetch_reports.return_value = {1: Report(id=1, name="Report", credit_cost=Decimal("7.5"))}
+
+        totals = PricingSimulationService(mock_message_service, mock_report_service).simulate(PARAMETER_SETS)
+
+        for parameters, total in zip(PARAMETER_SETS, totals, strict=True):
+            calculator = CalculateCreditsService(parameters)
+            expected = Credit(amount=Decimal("7.5"))
+            for text in TEXTS:
+                expected += calculator.calculate_credits(text)
+            assert total == expected
+        mock_message_service.fetch_messages.assert_called_once()
+        mock_report_service.fetch_reports.assert_called_once_with([1])
@@ -1,12 +1,19 @@
+import threading
 from decimal import Decimal
+from pathlib import Path
+from typing import cast
 from unittest.mock import Mock, patch
 
 import pytest
 import requests
 from fastapi import HTTPException
 
+from billing.constants import UPSTREAM_TIMEOUT_SECONDS
+from billing.deadline import Deadline
 from billing.models import Report
-from billing.services.reports_service import ReportService
+from billing.services.reports_service import ReportNotFound, ReportPending, ReportService
+from billing.shared_cache import SharedCache
+from billing.tracing import InMemorySpanExporter, Span, Tracer
 
 
 class TestReportService:
@@ -39,7 +46,7 @@ class TestReportService:
             assert result.id == sample_report_data["id"]
             assert result.name == sample_report_data["name"]
             assert result.credit_cost == Decimal(sample_report_data["credit_cost"])
-            mock_get.assert_called_once_with("http://test-service.com/reports/123")
+            mock_get.assert_called_once_with("http://test-service.com/reports/123", timeout=UPSTREAM_TIMEOUT_SECONDS)
 
     def test_nonexistent_report_id__returns_none(
         self,
@@ -53,7 +60,7 @@ class TestReportService:
             result = report_service.fetch_report(999)
 
             assert result is None
-            mock_get.assert_called_once_with("http://test-service.com/reports/999")
+            mock_get.assert_called_once_with("http://test-service.com/reports/999", timeout=UPSTREAM_TIMEOUT_SECONDS)
 
     def test_server_error__raises_http_exception(
         self,
@@ -69,6 +76,192 @@ class TestReportService:
                 report_service.fetch_report(123)
 
             assert exc_info.type == HTTPException
-            mock_get.assert_called_once_with("http://test-service.com/reports/123")
+            mock_get.assert_called_once_with("http://test-service.com/reports/123", timeout=UPSTREAM_TIMEOUT_SECONDS)
+
+    def test_repeat_fetch__served_from_cache(
+        self,
+        report_service: ReportService,
+        sample_report_data: dict[str, str | int],
+    ) -> None:
+        with patch("requests.get") as mock_get:
+            mock_get.return_value.status_code = 200
+            mock_get.return_value.json.return_value = sample_report_data
+
+            first = report_service.fetch_report(123)
+            second = report_service.fetch_report(123)
+
+            assert first == second
+            mock_get.assert_called_once_with("http://test-service.com/reports/123", timeout=UPSTREAM_TIMEOUT_SECONDS)
+
+    def test_missing_report__not_cached(
+        self,
+        report_service: ReportService,
+    ) -> None:
+        with patch("requests.get") as mock_get:
+            mock_get.return_value.status_code = 404
+
+            report_service.fetch_report(999)
+            report_service.fetch_report(999)
+
+            assert mock_get.call_count == 2
+
+    def test_traced_fetch__records_span_per_report(
+        self,
+        sample_report_data: dict[str, str | int],
+    ) -> None:
+        exporter = InMemorySpanExporter()
+        tracer = Tracer(exporter, sample_rate=1.0)
+        transport = Mock()
+        transport.get.return_value.status_code = 200
+        transport.get.return_value.json.return_value = sample_report_data
+        report_service = ReportService("http://test-service.com", transport=transport, tracer=tracer)
+
+        with tracer.span("request"):
+            report_service.fetch_report(123)
+            report_service.fetch_report(123)
+
+        first, second, _ = exporter.spans
+        assert first.name == second.name == "fetch_report"
+        assert first.attributes == {"report_id": 123, "cache_hit": False}
+        assert second.attributes == {"report_id": 123, "cache_hit": True}
+
+    def test_over_max_cached_reports__least_recently_used_refetched(
+        self,
+        sample_report_data: dict[str, str | int],
+    ) -> None:
+        transport = Mock()
+        transport.get.return_value.status_code = 200
+        transport.get.return_value.json.return_value = sample_report_data
+        report_service = ReportService("http://test-service.com", transport=transport, max_cached_reports=2)
+
+        for report_id in (1, 2, 1, 3, 1, 2):
+            report_service.fetch_report(report_id)
+
+        fetched = [call.args[0].rsplit("/", 1)[1] for call in transport.get.call_args_list]
+        assert fetched == ["1", "2", "3", "2"]
 
     # NOTE: Could have added more tests e.g. missing keys etc. but omitted for brevity.
+
+
+class TestFetchReports:
+    @pytest.fixture
+    def transport(self) -> Mock:
+        def get(url: str, timeout: float | None = None) -> Mock:  # noqa: ARG001
+            report_id = int(url.rsplit("/", 1)[1])
+            response = Mock()
+            response.status_code = 404 if report_id >= 900 else 200
+            response.json.return_value = {"id": report_id, "name": f"Report {report_id}", "credit_cost": "1.5"}
+            return response
+
+        transport = Mock()
+        transport.get.side_effect = get
+        return transport
+
+    @pytest.fixture
+    def report_service(self, transport: Mock) -> ReportService:
+        return ReportService("http://test-service.com", transport=transport)
+
+    def test_duplicate_ids__fetched_once_in_requested_order(
+        self,
+        report_service: ReportService,
+        transport: Mock,
+    ) -> None:
+        result = report_service.fetch_reports([3, 1, 3, 2, 1])
+
+        assert list(result) == [3, 1, 2]
+        assert all(isinstance(report, Report) and report.id == report_id for report_id, report in result.items())
+        assert transport.get.call_count == 3
+
+    def test_unknown_ids__returned_as_not_found(self, report_service: ReportService) -> None:
+        result = report_service.fetch_reports([1, 999])
+
+        assert isinstance(result[1], Report)
+        assert result[999] == ReportNotFound(999)
+
+    def test_cached_reports__not_fetched_again(
+        self,
+        report_service: ReportService,
+        transport: Mock,
+    ) -> None:
+        report_service.fetch_report(1)
+
+        report_service.fetch_reports([1, 2])
+
+        assert [call.args[0] for call in transport.get.call_args_list] == [
+            "http://test-service.com/reports/1",
+            "http://test-service.com/reports/2",
+        ]
+
+    def test_fetch_error__raises_http_exception(
+        self,
+        report_service: ReportService,
+        transport: Mock,
+    ) -> None:
+        transport.get.side_effect = requests.exceptions.ConnectionError()
+
+        with pytest.raises(HTTPException):
+            report_service.fetch_reports([1, 2])
+
+    def test_deadline__unfinished_and_failed_fetches_returned_as_pending(
+        self,
+        report_service: ReportService,
+        transport: Mock,
+    ) -> None:
+        respond = transport.get.side_effect
+        release = threading.Event()
+
+        def get(url: str, timeout: float | None = None) -> Mock:
+            if url.endswith("/2"):
+                release.wait(5)
+            if url.endswith("/3"):
+                raise requests.exceptions.Timeout()
+            return cast(Mock, respond(url, timeout))
+
+        transport.get.side_effect = get
+
+        try:
+            result = report_service.fetch_reports([1, 2, 3], Deadline.after(0.2))
+        finally:
+            release.set()
+
+        assert isinstance(result[1], Report)
+        assert result[2] == ReportPending(2)
+        assert result[3] == ReportPending(3)
+        # Every upstream call is bounded by the deadline.
+        assert all(call.kwargs["timeout"] <= 0.2 for call in transport.get.call_args_list)
+
+    def test_shared_cache__report_fetched_once_across_workers(self, transport: Mock, tmp_path: Path) -> None:
+        shared_cache = SharedCache(tmp_path / "cache.sqlite", max_bytes=1024)
+        worker = ReportService("http://test-service.com", transport=transport, shared_cache=shared_cache)
+        other_worker = ReportService("http://test-service.com", transport=transport, shared_cache=shared_cache)
+
+        fetched = worker.fetch_reports([1, 2])
+        shared = other_worker.fetch_reports([1, 2])
+
+        assert shared == fetched
+        assert transport.get.call_count == 2
+
+    def test_no_ids__returns_empty_mapping(
+        self,
+        report_service: ReportService,
+        transport: Mock,
+    ) -> None:
+        assert report_service.fetch_reports([]) == {}
+        transport.get.assert_not_called()
+
+    def test_traced_fetch__report_spans_are_children_of_caller(self, transport: Mock) -> None:
+        exporter = InMemorySpanExporter()
+        tracer = Tracer(exporter, sample_rate=1.0)
+        report_service = ReportService("http://test-service.com", transport=transport, tracer=tracer)
+
+        with tracer.span("request"):
+            report_service.fetch_reports([1, 2, 3])
+
+        spans_by_name: dict[str, list[Span]] = {}
+        for span in exporter.spans:
+            spans_by_name.setdefault(span.name, []).append(span)
+        (request,) = spans_by_name["request"]
+        (fetch_reports,) = spans_by_name["fetch_reports"]
+        assert fetch_reports.parent_span_id == request.span_id
+        assert len(spans_by_name["fetch_report"]) == 3
+        assert all(span.parent_span_id == fetch_reports.span_id for span in spans_by_name["fetch_report"])
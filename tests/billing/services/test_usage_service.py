@@ -1,3 +1,6 @@
+import logging
+import random
+from collections.abc import Callable
 from datetime import datetime
 from decimal import Decimal
 from unittest.mock import Mock
@@ -5,13 +8,16 @@ from unittest.mock import Mock
 import pytest
 from fastapi import HTTPException
 
+from billing.constants import DEFAULT_BILLING_PARAMETERS
 from billing.dataclasses import Credit
+from billing.deadline import Deadline
 from billing.models import Message, Report
-from billing.schemas import UsageResponse
+from billing.schemas import UsageEntry, UsageEntryStatus, UsageResponse
 from billing.services.credit_calculation_service import CalculateCreditsService
 from billing.services.messages_service import MessageService
-from billing.services.reports_service import ReportService
-from billing.services.usage_service import UsageService
+from billing.services.reports_service import ReportLookup, ReportNotFound, ReportPending, ReportService
+from billing.services.usage_service import UsageService, summarise_usage
+from billing.tracing import InMemorySpanExporter, Tracer
 
 
 @pytest.fixture
@@ -19,9 +25,21 @@ def mock_message_service() -> Mock:
     return Mock(spec=MessageService)
 
 
+def lookup_reports(*reports: Report) -> Callable[[list[int], Deadline | None], dict[int, ReportLookup]]:
+    """A fetch_reports side effect which knows about `reports` only."""
+    reports_by_id = {report.id: report for report in reports}
+
+    def fetch_reports(report_ids: list[int], deadline: Deadline | None = None) -> dict[int, ReportLookup]:  # noqa: ARG001
+        return {report_id: reports_by_id.get(report_id, ReportNotFound(report_id)) for report_id in report_ids}
+
+    return fetch_reports
+
+
 @pytest.fixture
 def mock_report_service() -> Mock:
-    return Mock(spec=ReportService)
+    mock = Mock(spec=ReportService)
+    mock.fetch_reports.side_effect = lookup_reports()
+    return mock
 
 
 @pytest.fixture
@@ -106,7 +124,7 @@ class TestGetUsage:
         )
         test_report = Report(id=report_id, name="Test Report", credit_cost=Decimal("15.5"))
         mock_message_service.fetch_messages.return_value = [test_message]
-        mock_report_service.fetch_report.return_value = test_report
+        mock_report_service.fetch_reports.side_effect = lookup_reports(test_report)
 
         result = usage_service.get_usage()
 
@@ -115,7 +133,7 @@ class TestGetUsage:
         assert result.usage[0].timestamp == test_message.timestamp
         assert result.usage[0].report_name == test_report.name
         assert result.usage[0].credits_used == test_report.credit_cost
-        mock_report_service.fetch_report.assert_called_once_with(test_message.report_id)
+        mock_report_service.fetch_reports.assert_called_once_with([test_message.report_id], None)
 
     def test_message_with_missing_report__returns_calculated_credits(
         self,
@@ -132,7 +150,6 @@ class TestGetUsage:
         )
         expected_credits = Credit.from_int(10)
         mock_message_service.fetch_messages.return_value = [test_message]
-        mock_report_service.fetch_report.return_value = None
         mock_calculate_credits_service.calculate_credits.return_value = expected_credits
 
         result = usage_service.get_usage()
@@ -142,7 +159,7 @@ class TestGetUsage:
         assert result.usage[0].timestamp == test_message.timestamp
         assert result.usage[0].report_name is None
         assert result.usage[0].credits_used == expected_credits.amount
-        mock_report_service.fetch_report.assert_called_once_with(test_message.report_id)
+        mock_report_service.fetch_reports.assert_called_once_with([test_message.report_id], None)
         mock_calculate_credits_service.calculate_credits.assert_called_once_with(test_message.text)
 
     def test_report_service_error__raises_http_exception(
@@ -158,7 +175,336 @@ class TestGetUsage:
             report_id=123,
         )
         mock_message_service.fetch_messages.return_value = [test_message]
-        mock_report_service.fetch_report.side_effect = HTTPException(status_code=500, detail="Error")
+        mock_report_service.fetch_reports.side_effect = HTTPException(status_code=500, detail="Error")
 
         with pytest.raises(HTTPException):
             usage_service.get_usage()
+
+
+class TestGetUsageIncremental:
+    @pytest.fixture
+    def incremental_usage_service(
+        self,
+        mock_message_service: Mock,
+        mock_report_service: Mock,
+        mock_calculate_credits_service: Mock,
+    ) -> UsageService:
+        return UsageService(
+            message_service=mock_message_service,
+            report_service=mock_report_service,
+            calculate_credits_service=mock_calculate_credits_service,
+            incremental=True,
+        )
+
+    def test_unchanged_messages__are_not_recalculated(
+        self,
+        incremental_usage_service: UsageService,
+        mock_message_service: Mock,
+        mock_calculate_credits_service: Mock,
+    ) -> None:
+        test_message = Message(id=1, timestamp="2024-01-01T00:00:00", text="test message")
+        mock_message_service.fetch_messages.return_value = [test_message]
+        mock_calculate_credits_service.calculate_credits.return_value = Credit.from_int(10)
+
+        first = incremental_usage_service.get_usage()
+        second = incremental_usage_service.get_usage()
+
+        assert first == second
+        mock_calculate_credits_service.calculate_credits.assert_called_once_with(test_message.text)
+
+    def test_new_and_changed_messages__only_delta_is_recalculated(
+        self,
+        incremental_usage_service: UsageService,
+        mock_message_service: Mock,
+        mock_calculate_credits_service: Mock,
+    ) -> None:
+        unchanged = Message(id=1, timestamp="2024-01-01T00:00:00", text="unchanged")
+        original = Message(id=2, timestamp="2024-01-01T00:00:00", text="original")
+        mock_calculate_credits_service.calculate_credits.return_value = Credit.from_int(10)
+        mock_message_service.fetch_messages.return_value = [unchanged, original]
+        incremental_usage_service.get_usage()
+        mock_calculate_credits_service.calculate_credits.reset_mock()
+
+        edited = Message(id=2, timestamp="2024-01-01T00:00:00", text="edited")
+        new = Message(id=3, timestamp="2024-01-02T00:00:00", text="new")
+        mock_message_service.fetch_messages.return_value = [unchanged, edited, new]
+        result = incremental_usage_service.get_usage()
+
+        assert [entry.message_id for entry in result.usage] == [1, 2, 3]
+        assert [call.args[0] for call in mock_calculate_credits_service.calculate_credits.call_args_list] == [
+            "edited",
+            "new",
+        ]
+
+    def test_report_id_change__refetches_report(
+        self,
+        incremental_usage_service: UsageService,
+        mock_message_service: Mock,
+        mock_report_service: Mock,
+    ) -> None:
+        mock_report_service.fetch_reports.side_effect = lookup_reports(
+            Report(id=1, name="Report", credit_cost=Decimal("5")), Report(id=2, name="Report", credit_cost=Decimal("5"))
+        )
+        mock_message_service.fetch_messages.return_value = [
+            Message(id=1, timestamp="2024-01-01T00:00:00", text="text", report_id=1)
+        ]
+        incremental_usage_service.get_usage()
+        mock_message_service.fetch_messages.return_value = [
+            Message(id=1, timestamp="2024-01-01T00:00:00", text="text", report_id=2)
+        ]
+        incremental_usage_service.get_usage()
+
+        assert [call.args[0] for call in mock_report_service.fetch_reports.call_args_list] == [[1], [2]]
+
+
+class TestGetUsageDeadline:
+    @pytest.fixture
+    def pending_report_message(self, mock_message_service: Mock, mock_report_service: Mock) -> Message:
+        message = Message(id=1, timestamp="2024-01-01T00:00:00", text="text", report_id=7)
+        mock_message_service.fetch_messages.return_value = [
+            message,
+            Message(id=2, timestamp="2024-01-01T00:00:00", text="other"),
+        ]
+        mock_report_service.fetch_reports.side_effect = lambda report_ids, deadline: {7: ReportPending(7)}
+        return message
+
+    def test_pending_report__entry_marked_pending_and_response_incomplete(
+        self,
+        usage_service: UsageService,
+        mock_message_service: Mock,
+        mock_calculate_credits_service: Mock,
+        pending_report_message: Message,
+    ) -> None:
+        mock_calculate_credits_service.calculate_credits.return_value = Credit.from_int(3)
+        deadline = Deadline.after(1)
+
+        result = usage_service.get_usage(deadline=deadline)
+
+        assert not result.complete
+        assert [(entry.status, entry.credits_used) for entry in result.usage] == [
+            (UsageEntryStatus.PENDING, 0),
+            (None, 3),
+        ]
+        mock_message_service.fetch_messages.assert_called_once_with(deadline)
+        mock_calculate_credits_service.calculate_credits.assert_called_once_with("other")
+
+    def test_bill_pending_reports__entry_estimated_with_calculator(
+        self,
+        usage_service: UsageService,
+        mock_calculate_credits_service: Mock,
+        pending_report_message: Message,
+    ) -> None:
+        mock_calculate_credits_service.calculate_credits.return_value = Credit.from_int(3)
+
+        result = usage_service.get_usage_summary(deadline=Deadline.after(1), bill_pending_reports=True)
+
+        assert not result.complete
+        assert result.total_credits == 6
+
+    def test_pending_entry__not_kept_by_incremental_service(
+        self,
+        mock_message_service: Mock,
+        mock_report_service: Mock,
+        mock_calculate_credits_service: Mock,
+        pending_report_message: Message,
+    ) -> None:
+        mock_calculate_credits_service.calculate_credits.return_value = Credit.from_int(3)
+        usage_service = UsageService(
+            mock_message_service, mock_report_service, mock_calculate_credits_service, incremental=True
+        )
+        usage_service.get_usage(deadline=Deadline.after(1))
+        mock_report_service.fetch_reports.side_effect = lookup_reports(
+            Report(id=7, name="Report", credit_cost=Decimal("5"))
+        )
+
+        result = usage_service.get_usage()
+
+        assert result.complete
+        assert result.usage[0].credits_used == 5
+        assert mock_report_service.fetch_reports.call_args.args[0] == [7]
+
+
+class TestGetUsageTracing:
+    def test_traced_request__records_calculations_as_one_span(
+        self,
+        mock_message_service: Mock,
+        mock_report_service: Mock,
+        mock_calculate_credits_service: Mock,
+    ) -> None:
+        exporter = InMemorySpanExporter()
+        tracer = Tracer(exporter, sample_rate=1.0)
+        usage_service = UsageService(
+            mock_message_service, mock_report_service, mock_calculate_credits_service, tracer=tracer
+        )
+        mock_message_service.fetch_messages.return_value = [
+            Message(id=i, timestamp="2024-01-01T00:00:00", text=f"message {i}") for i in range(3)
+        ]
+        mock_calculate_credits_service.calculate_credits.return_value = Credit.from_int(1)
+
+        with tracer.span("request"):
+            usage_service.get_usage()
+
+        calculations, root = exporter.spans
+        assert calculations.name == "calculate_credits"
+        assert calculations.attributes == {"calls": 3}
+        assert calculations.parent_span_id == root.span_id
+
+
+class TestGetUsageSummary:
+    def test_messages__summary_matches_usage(
+        self,
+        usage_service: UsageService,
+        mock_message_service: Mock,
+        mock_report_service: Mock,
+        mock_calculate_credits_service: Mock,
+    ) -> None:
+        mock_message_service.fetch_messages.return_value = [
+            Message(id=1, timestamp="2024-01-01T10:00:00", text="first"),
+            Message(id=2, timestamp="2024-01-01T11:00:00", text="second", report_id=1),
+            Message(id=3, timestamp="2024-01-02T10:00:00", text="third"),
+        ]
+        mock_report_service.fetch_reports.side_effect = lookup_reports(
+            Report(id=1, name="Report", credit_cost=Decimal("5.5"))
+        )
+        mock_calculate_credits_service.calculate_credits.return_value = Credit.from_float(1.1)
+
+        result = usage_service.get_usage_summary()
+
+        assert result.total_credits == 7.7
+        assert result.message_count == 3
+        assert result.credits_by_report == {"Report": 5.5}
+        assert result.message_count_by_report == {"Report": 1}
+        assert result.credits_by_day == {"2024-01-01": 6.6, "2024-01-02": 1.1}
+
+
+class TestSummariseUsage:
+    def test_no_entries__returns_zero_totals(self) -> None:
+        result = summarise_usage([])
+
+        assert result.total_credits == 0
+        assert result.message_count == 0
+        assert result.credits_by_day == {}
+
+    def test_many_small_credits__summed_without_float_error(self) -> None:
+        entries = (UsageEntry(message_id=i, timestamp="2024-01-01T00:00:00+00:00", credits_used=0.1) for i in range(10))
+
+        assert summarise_usage(entries).total_credits == 1.0
+
+
+class TestGetUsageShadow:
+    @pytest.fixture
+    def mock_shadow_service(self) -> Mock:
+        return Mock(spec=CalculateCreditsService)
+
+    def make_usage_service(
+        self,
+        mock_message_service: Mock,
+        mock_report_service: Mock,
+        mock_calculate_credits_service: Mock,
+        mock_shadow_service: Mock,
+        sample_rate: float,
+    ) -> UsageService:
+        return UsageService(
+            message_service=mock_message_service,
+            report_service=mock_report_service,
+            calculate_credits_service=mock_calculate_credits_service,
+            shadow_calculate_credits_service=mock_shadow_service,
+            shadow_sample_rate=sample_rate,
+            rng=random.Random(0),
+        )
+
+    def test_mismatch__returns_reference_credits_and_logs(
+        self,
+        mock_message_service: Mock,
+        mock_report_service: Mock,
+        mock_calculate_credits_service: Mock,
+        mock_shadow_service: Mock,
+        caplog: pytest.LogCaptureFixture,
+    ) -> None:
+        usage_service = self.make_usage_service(
+            mock_message_service, mock_report_service, mock_calculate_credits_service, mock_shadow_service, 1.0
+        )
+        mock_message_service.fetch_messages.return_value = [
+            Message(id=1, timestamp="2024-01-01T00:00:00", text="same"),
+            Message(id=2, timestamp="2024-01-01T00:00:00", text="different"),
+        ]
+        mock_calculate_credits_service.calculate_credits.return_value = Credit.from_int(3)
+        mock_shadow_service.calculate_credits.side_effect = [Credit.from_int(3), Credit.from_int(4)]
+
+        with caplog.at_level(logging.WARNING):
+            result = usage_service.get_usage()
+
+        assert [entry.credits_used for entry in result.usage] == [3, 3]
+        assert usage_service.shadow_stats.samples == 2
+        assert usage_service.shadow_stats.mismatches == 1
+        assert usage_service.shadow_stats.relative_latency is not None
+        assert "message 2" in caplog.text and "'different'" in caplog.text
+
+    def test_candidate_error__does_not_affect_response(
+        self,
+        mock_message_service: Mock,
+        mock_report_service: Mock,
+        mock_calculate_credits_service: Mock,
+        mock_shadow_service: Mock,
+    ) -> None:
+        usage_service = self.make_usage_service(
+            mock_message_service, mock_report_service, mock_calculate_credits_service, mock_shadow_service, 1.0
+        )
+        mock_message_service.fetch_messages.return_value = [Message(id=1, timestamp="2024-01-01T00:00:00", text="a")]
+        mock_calculate_credits_service.calculate_credits.return_value = Credit.from_int(3)
+        mock_shadow_service.calculate_credits.side_effect = RuntimeError("boom")
+
+        result = usage_service.get_usage()
+
+        assert result.usage[0].credits_used == 3
+        assert usage_service.shadow_stats.mismatches == 1
+
+    def test_zero_sample_rate__candidate_never_called(
+        self,
+        mock_message_service: Mock,
+        mock_report_service: Mock,
+        mock_calculate_credits_service: Mock,
+        mock_shadow_service: Mock,
+    ) -> None:
+        usage_service = self.make_usage_service(
+            mock_message_service, mock_report_service, mock_calculate_credits_service, mock_shadow_service, 0.0
+        )
+        mock_message_service.fetch_messages.return_value = [Message(id=1, timestamp="2024-01-01T00:00:00", text="a")]
+        mock_calculate_credits_service.calculate_credits.return_value = Credit.from_int(3)
+
+        usage_service.get_usage()
+
+        mock_shadow_service.calculate_credits.assert_not_called()
+
+    def test_equivalent_calculator__still_sampled(
+        self,
+        mock_message_service: Mock,
+        mock_report_service: Mock,
+        mock_shadow_service: Mock,
+    ) -> None:
+        usage_service = UsageService(
+            message_service=mock_message_service,
+            report_service=mock_report_service,
+            calculate_credits_service=CalculateCreditsService(DEFAULT_BILLING_PARAMETERS),
+            shadow_calculate_credits_service=mock_shadow_service,
+            shadow_sample_rate=1.0,
+        )
+        mock_message_service.fetch_messages.return_value = [Message(id=1, timestamp="2024-01-01T00:00:00", text="a")]
+        mock_shadow_service.calculate_credits.return_value = Credit.from_int(1)
+
+        # e.g. the default calculator rebuilt after being evicted from BillingParametersService's cache.
+        usage_service.get_usage(CalculateCreditsService(DEFAULT_BILLING_PARAMETERS))
+
+        assert usage_service.shadow_stats.samples == 1
+
+    def test_invalid_sample_rate__raises_value_error(
+        self,
+        mock_message_service: Mock,
+        mock_report_service: Mock,
+        mock_calculate_credits_service: Mock,
+        mock_shadow_service: Mock,
+    ) -> None:
+        with pytest.raises(ValueError):
+            self.make_usage_service(
+                mock_message_service, mock_report_service, mock_calculate_credits_service, mock_shadow_service, 1.5
+            )
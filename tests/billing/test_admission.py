@@ -0,0 +1,67 @@
+import threading
+import time
+
+import pytest
+
+from billing.admission import AdmissionController, Overloaded
+from billing.deadline import Deadline
+
+
+class TestAdmissionController:
+    def test_under_limit__admitted(self) -> None:
+        controller = AdmissionController(max_in_flight=2, max_queued=0, queue_timeout_seconds=0)
+
+        with controller.admit(), controller.admit():
+            assert controller.stats.in_flight == 2
+
+        assert controller.stats.in_flight == 0
+        assert controller.stats.admitted == 2
+
+    def test_full_queue__shed_straight_away(self) -> None:
+        controller = AdmissionController(max_in_flight=1, max_queued=0, queue_timeout_seconds=5)
+
+        with controller.admit(), pytest.raises(Overloaded):
+            with controller.admit():
+                pass
+
+        assert controller.stats.shed == 1
+        assert controller.stats.shed_rate == 0.5
+
+    def test_queued__shed_after_timeout(self) -> None:
+        controller = AdmissionController(max_in_flight=1, max_queued=1, queue_timeout_seconds=0.01)
+
+        with controller.admit(), pytest.raises(Overloaded):
+            with controller.admit():
+                pass
+
+        assert controller.stats.queued == 0
+        assert controller.stats.shed == 1
+
+    def test_queued_with_deadline__shed_by_the_deadline(self) -> None:
+        controller = AdmissionController(max_in_flight=1, max_queued=1, queue_timeout_seconds=5)
+
+        started = time.monotonic()
+        with controller.admit(), pytest.raises(Overloaded):
+            with controller.admit(Deadline.after(0.01)):
+                pass
+
+        assert time.monotonic() - started < 1
+        assert controller.stats.shed == 1
+
+    def test_queued__admitted_when_a_slot_frees_up(self) -> None:
+        controller = AdmissionController(max_in_flight=1, max_queued=1, queue_timeout_seconds=5)
+        admitted = threading.Event()
+
+        def wait_for_admission() -> None:
+            with controller.admit():
+                admitted.set()
+
+        with controller.admit():
+            waiter = threading.Thread(target=wait_for_admission)
+            waiter.start()
+            assert not admitted.wait(0.05)
+            assert controller.stats.queued == 1
+        waiter.join(timeout=5)
+
+        assert admitted.is_set()
+        assert controller.stats.admitted == 2
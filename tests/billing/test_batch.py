@@ -0,0 +1,146 @@
+import csv
+import json
+from dataclasses import replace
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from billing.batch import BatchRun, Checkpoint, CheckpointMismatch, main, run_batch
+from billing.constants import DEFAULT_BILLING_PARAMETERS
+from billing.services.credit_calculation_service import RULES_VERSION, CalculateCreditsService
+
+MESSAGES = [
+    {"id": 1, "timestamp": "2024-01-01T00:00:00", "text": "hello world"},
+    {"id": 2, "timestamp": "2024-01-01T00:00:01", "text": "billed by report", "report_id": 10},
+    {"id": 3, "timestamp": "2024-01-01T00:00:02", "text": "missing report", "report_id": 11},
+    {"id": 4, "timestamp": "2024-01-01T00:00:03", "text": "wow wow"},
+    {"id": 5, "timestamp": "2024-01-01T00:00:04", "text": "The quick brown fox"},
+]
+
+
+@pytest.fixture
+def messages_path(tmp_path: Path) -> Path:
+    path = tmp_path / "messages.jsonl"
+    path.write_text("".join(json.dumps(message) + "\n" for message in MESSAGES))
+    return path
+
+
+@pytest.fixture
+def reports_path(tmp_path: Path) -> Path:
+    path = tmp_path / "reports.json"
+    path.write_text(json.dumps({"reports": [{"id": 10, "name": "Report", "credit_cost": "7.5"}]}))
+    return path
+
+
+def expected_rows() -> list[dict[str, object]]:
+    calculator = CalculateCreditsService(DEFAULT_BILLING_PARAMETERS)
+    rows: list[dict[str, object]] = []
+    for message in MESSAGES:
+        row: dict[str, object] = {"message_id": message["id"], "timestamp": message["timestamp"]}
+        if message.get("report_id") == 10:
+            row["report_name"] = "Report"
+            row["credits_used"] = 7.5
+        else:
+            row["credits_used"] = float(calculator.calculate_credits(str(message["text"])).amount)
+        rows.append(row)
+    return rows
+
+
+def read_jsonl(path: Path) -> list[dict[str, object]]:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+class TestRunBatch:
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_jsonl_output__matches_calculator(
+        self, tmp_path: Path, messages_path: Path, reports_path: Path, workers: int
+    ) -> None:
+        output_path = tmp_path / "usage.jsonl"
+
+        billed = run_batch([messages_path], output_path, reports_path, chunk_size=2, workers=workers)
+
+        assert billed == len(MESSAGES)
+        assert read_jsonl(output_path) == expected_rows()
+
+    def test_csv_output__has_header_and_rows(self, tmp_path: Path, messages_path: Path, reports_path: Path) -> None:
+        output_path = tmp_path / "usage.csv"
+
+        run_batch([messages_path], output_path, reports_path, chunk_size=2)
+
+        with output_path.open() as file:
+            rows = list(csv.DictReader(file))
+        assert [int(row["message_id"]) for row in rows] == [1, 2, 3, 4, 5]
+        assert rows[1]["report_name"] == "Report"
+        assert rows[0]["report_name"] == ""
+
+    def test_resume__skips_checkpointed_messages_and_drops_partial_output(
+        self, tmp_path: Path, messages_path: Path, reports_path: Path
+    ) -> None:
+        output_path = tmp_path / "usage.jsonl"
+        checkpoint_path = tmp_path / "usage.jsonl.checkpoint"
+        run_batch([messages_path], output_path, reports_path, chunk_size=2)
+        lines = output_path.read_bytes().splitlines(keepends=True)
+        # Simulate a crash after the first chunk was checkpointed and part of the second was written.
+        output_path.write_bytes(b"".join(lines[:3]))
+        run = BatchRun.describe([messages_path, reports_path], 2, DEFAULT_BILLING_PARAMETERS)
+        Checkpoint(run=run, messages_processed=2, output_bytes=len(b"".join(lines[:2]))).save(checkpoint_path)
+
+        billed = run_batch([messages_path], output_path, reports_path, chunk_size=2)
+
+        assert billed == len(MESSAGES)
+        assert read_jsonl(output_path) == expected_rows()
+        assert not checkpoint_path.exists()
+
+    @pytest.mark.parametrize(
+        "change",
+        ["messages", "chunk_size", "parameters", "rules"],
+    )
+    def test_resume_with_different_run__refuses(
+        self, tmp_path: Path, messages_path: Path, reports_path: Path, change: str
+    ) -> None:
+        output_path = tmp_path / "usage.jsonl"
+        output_path.write_bytes(b"")
+        run = BatchRun.describe([messages_path, reports_path], 2, DEFAULT_BILLING_PARAMETERS)
+        Checkpoint(run=run, messages_processed=2, output_bytes=0).save(tmp_path / "usage.jsonl.checkpoint")
+        if change == "messages":
+            messages_path.write_text(messages_path.read_text() + json.dumps(MESSAGES[0]) + "\n")
+
+        rules_version = RULES_VERSION + 1 if change == "rules" else RULES_VERSION
+
+        with (
+            patch("billing.services.credit_calculation_service.RULES_VERSION", rules_version),
+            pytest.raises(CheckpointMismatch),
+        ):
+            run_batch(
+                [messages_path],
+                output_path,
+                reports_path,
+                parameters=(
+                    replace(DEFAULT_BILLING_PARAMETERS, PALINDROME_MULTIPLIER=3)
+                    if change == "parameters"
+                    else DEFAULT_BILLING_PARAMETERS
+                ),
+                chunk_size=3 if change == "chunk_size" else 2,
+            )
+
+    def test_completed_run__rerun_bills_again(self, tmp_path: Path, messages_path: Path) -> None:
+        output_path = tmp_path / "usage.jsonl"
+        run_batch([messages_path], output_path)
+
+        billed = run_batch([messages_path], output_path)
+
+        assert billed == len(MESSAGES)
+        assert len(read_jsonl(output_path)) == len(MESSAGES)
+
+
+class TestMain:
+    def test_json_dump__writes_output(self, tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+        messages_path = tmp_path / "messages.json"
+        messages_path.write_text(json.dumps({"messages": MESSAGES}))
+        output_path = tmp_path / "usage.jsonl"
+
+        main([str(messages_path), "--output", str(output_path), "--workers", "1"])
+
+        assert len(read_jsonl(output_path)) == len(MESSAGES)
+        assert "Billed 5 messages" in capsys.readouterr().out
@@ -0,0 +1,156 @@
+from pathlib import Path
+
+import pytest
+
+from billing.cache import CacheStatus, ResponseCache
+from billing.shared_cache import SharedCache
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
+
+
+@pytest.fixture
+def cache(clock: FakeClock) -> ResponseCache:
+    return ResponseCache(max_bytes=10, ttl_seconds=30, stale_seconds=60, clock=clock)
+
+
+class TestLookup:
+    def test_missing_key__returns_miss(self, cache: ResponseCache) -> None:
+        assert cache.lookup("key") == (None, CacheStatus.MISS)
+
+    def test_within_ttl__returns_hit(self, cache: ResponseCache, clock: FakeClock) -> None:
+        entry = cache.set("key", b"body", "v1")
+        clock.now = 30
+
+        assert cache.lookup("key") == (entry, CacheStatus.HIT)
+
+    def test_after_ttl__returns_stale(self, cache: ResponseCache, clock: FakeClock) -> None:
+        entry = cache.set("key", b"body", "v1")
+        clock.now = 31
+
+        assert cache.lookup("key") == (entry, CacheStatus.STALE)
+
+    def test_after_stale_window__returns_miss_and_evicts(self, cache: ResponseCache, clock: FakeClock) -> None:
+        cache.set("key", b"body", "v1")
+        clock.now = 91
+
+        assert cache.lookup("key") == (None, CacheStatus.MISS)
+        assert cache.size_bytes == 0
+
+    def test_touch__makes_entry_fresh_again(self, cache: ResponseCache, clock: FakeClock) -> None:
+        cache.set("key", b"body", "v1")
+        clock.now = 31
+        cache.touch("key")
+
+        entry, status = cache.lookup("key")
+        assert status == CacheStatus.HIT
+        assert entry is not None and entry.body == b"body"
+
+
+class TestSet:
+    def test_over_max_bytes__evicts_least_recently_used(self, cache: ResponseCache) -> None:
+        cache.set("a", b"aaaa", None)
+        cache.set("b", b"bbbb", None)
+        cache.lookup("a")
+        cache.set("c", b"cccc", None)
+
+        assert cache.lookup("b") == (None, CacheStatus.MISS)
+        assert cache.lookup("a")[1] == CacheStatus.HIT
+        assert cache.size_bytes == 8
+
+    def test_touched_entry__evicted_after_untouched(self, cache: ResponseCache) -> None:
+        cache.set("a", b"aaaa", None)
+        cache.set("b", b"bbbb", None)
+        cache.touch("a")
+        cache.set("c", b"cccc", None)
+
+        assert cache.lookup("b") == (None, CacheStatus.MISS)
+        assert cache.lookup("a")[1] == CacheStatus.HIT
+
+    def test_body_larger_than_cache__is_not_stored(self, cache: ResponseCache) -> None:
+        cache.set("a", b"aaaa", None)
+        cache.set("big", b"x" * 11, None)
+
+        assert cache.lookup("big") == (None, CacheStatus.MISS)
+        assert cache.lookup("a")[1] == CacheStatus.HIT
+
+
+class TestRevalidation:
+    def test_concurrent_revalidation__only_first_starts(self, cache: ResponseCache) -> None:
+        assert cache.start_revalidation("key") is True
+        assert cache.start_revalidation("key") is False
+        cache.finish_revalidation("key")
+        assert cache.start_revalidation("key") is True
+
+
+class TestSharedTier:
+    @pytest.fixture
+    def shared(self, tmp_path: Path) -> SharedCache:
+        return SharedCache(tmp_path / "cache.sqlite", max_bytes=100)
+
+    def test_response_set_by_another_worker__served_from_shared_cache(self, shared: SharedCache) -> None:
+        worker = ResponseCache(max_bytes=10, ttl_seconds=30, stale_seconds=60, shared=shared)
+        other_worker = ResponseCache(max_bytes=10, ttl_seconds=30, stale_seconds=60, shared=shared)
+        worker.set("key", b"body", "v1")
+
+        entry, status = other_worker.lookup("key")
+
+        assert status == CacheStatus.HIT
+        assert entry is not None and (entry.body, entry.version) == (b"body", "v1")
+        assert other_worker.size_bytes == 4
+
+    def test_stale_local_entry__replaced_by_newer_shared_entry(self, shared: SharedCache, clock: FakeClock) -> None:
+        worker = ResponseCache(max_bytes=10, ttl_seconds=30, stale_seconds=60, clock=clock, shared=shared)
+        other_worker = ResponseCache(max_bytes=10, ttl_seconds=30, stale_seconds=60, shared=shared)
+        worker.set("key", b"old", "v1")
+        clock.now = 31
+        other_worker.set("key", b"new", "v2")
+
+        entry, status = worker.lookup("key")
+
+        assert status == CacheStatus.HIT
+        assert entry is not None and entry.body == b"new"
+
+    def test_encoded_bodies__shared_with_the_response(self, shared: SharedCache) -> None:
+        worker = ResponseCache(max_bytes=100, ttl_seconds=30, stale_seconds=60, shared=shared)
+        other_worker = ResponseCache(max_bytes=100, ttl_seconds=30, stale_seconds=60, shared=shared)
+        worker.set("key", b"body", "v1", {"gzip": b"gz"})
+
+        entry, _ = other_worker.lookup("key")
+
+        assert entry is not None and entry.encoded_bodies == {"gzip": b"gz"}
+        assert other_worker.size_bytes == 6
+
+    @pytest.mark.parametrize("version", [None, "v1"])
+    def test_encoded_bodies_of_previous_body__not_served(self, shared: SharedCache, version: str | None) -> None:
+        worker = ResponseCache(max_bytes=100, ttl_seconds=30, stale_seconds=60, shared=shared)
+        other_worker = ResponseCache(max_bytes=100, ttl_seconds=30, stale_seconds=60, shared=shared)
+        worker.set("key", b"old body", version, {"gzip": b"old gz"})
+        # e.g. under the compression threshold, so no encoded body.
+        worker.set("key", b"new", version)
+
+        entry, _ = other_worker.lookup("key")
+
+        assert entry is not None and entry.body == b"new"
+        assert entry.encoded_bodies == {}
+
+    def test_response_larger_than_local_tier__served_from_shared_cache(self, shared: SharedCache) -> None:
+        worker = ResponseCache(max_bytes=100, ttl_seconds=30, stale_seconds=60, shared=shared)
+        other_worker = ResponseCache(max_bytes=2, ttl_seconds=30, stale_seconds=60, shared=shared)
+        worker.set("key", b"body", "v1")
+
+        entry, status = other_worker.lookup("key")
+
+        assert status == CacheStatus.HIT
+        assert entry is not None and entry.body == b"body"
+        assert other_worker.size_bytes == 0
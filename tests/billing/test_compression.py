@@ -0,0 +1,44 @@
+import gzip
+
+import pytest
+
+from billing.compression import compress_body, negotiate_encoding
+from billing.constants import COMPRESSION_MIN_BYTES
+
+
+class TestCompressBody:
+    def test_large_body__compressed_in_every_encoding(self) -> None:
+        body = b'{"message_id": 1, "credits_used": 1.5}' * 100
+
+        encoded = compress_body(body)
+
+        assert set(encoded) == {"gzip"}
+        assert gzip.decompress(encoded["gzip"]) == body
+        assert len(encoded["gzip"]) < len(body)
+
+    def test_small_body__not_compressed(self) -> None:
+        assert compress_body(b"x" * (COMPRESSION_MIN_BYTES - 1)) == {}
+
+
+class TestNegotiateEncoding:
+    @pytest.mark.parametrize(
+        ("accept_encoding", "expected"),
+        [
+            (None, None),
+            ("", None),
+            ("gzip", "gzip"),
+            ("deflate, gzip;q=0.5", "gzip"),
+            ("GZIP", "gzip"),
+            ("*", "gzip"),
+            ("br", None),
+            ("gzip;q=0", None),
+            ("gzip;q=0, *", None),
+            ("identity", None),
+            ("gzip;q=invalid", None),
+        ],
+    )
+    def test_accept_encoding__negotiated(self, accept_encoding: str | None, expected: str | None) -> None:
+        assert negotiate_encoding(accept_encoding, {"gzip"}) == expected
+
+    def test_no_encodings_available__returns_none(self) -> None:
+        assert negotiate_encoding("gzip", set()) is None
@@ -0,0 +1,63 @@
+from typing import Annotated, cast
+from unittest.mock import Mock
+
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from billing.cache import ResponseCache
+from billing.constants import DEFAULT_BILLING_PARAMETERS
+from billing.container import ServiceContainer, get_container
+from billing.services.billing_parameters_service import BillingParametersService
+
+
+def build_container(shadow_sample_rate: float = 0.0) -> ServiceContainer:
+    return ServiceContainer(
+        transport=Mock(),
+        billing_parameters_service=BillingParametersService(DEFAULT_BILLING_PARAMETERS),
+        usage_response_cache=ResponseCache(max_bytes=1024, ttl_seconds=30, stale_seconds=300),
+        shadow_sample_rate=shadow_sample_rate,
+    )
+
+
+class TestServiceContainer:
+    def test_services__share_transport(self) -> None:
+        container = build_container()
+
+        assert container.message_service._transport is container.transport
+        assert container.report_service._transport is container.transport
+
+    def test_usage_service__uses_default_calculator(self) -> None:
+        container = build_container()
+
+        assert container.usage_service._calculate_credits_service is (
+            container.billing_parameters_service.get_calculator()
+        )
+
+    def test_shadow_sample_rate__builds_shadow_engine(self) -> None:
+        assert build_container().usage_service._shadow_calculate_credits_service is None
+        assert build_container(shadow_sample_rate=0.5).usage_service._shadow_calculate_credits_service is not None
+
+    def test_close__releases_report_threads_and_transport(self) -> None:
+        container = build_container()
+
+        container.close()
+
+        assert container.report_service._executor._shutdown
+        cast(Mock, container.transport).close.assert_called_once_with()
+
+
+class TestGetContainer:
+    def test_requests__receive_app_container(self) -> None:
+        app = FastAPI()
+        app.state.container = build_container()
+        seen: list[ServiceContainer] = []
+
+        @app.get("/")
+        def endpoint(container: Annotated[ServiceContainer, Depends(get_container)]) -> None:
+            seen.append(container)
+
+        client = TestClient(app)
+        client.get("/")
+        client.get("/")
+
+        assert seen == [app.state.container, app.state.container]
@@ -0,0 +1,48 @@
+import pytest
+
+from billing.constants import UPSTREAM_TIMEOUT_SECONDS
+from billing.deadline import Deadline, DeadlineExceeded, upstream_timeout
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
+
+
+class TestDeadline:
+    def test_remaining__counts_down_to_zero(self, clock: FakeClock) -> None:
+        deadline = Deadline.after(2, clock)
+
+        clock.now = 0.5
+        assert deadline.remaining() == 1.5
+        assert not deadline.expired
+
+        clock.now = 3
+        assert deadline.remaining() == 0
+        assert deadline.expired
+
+
+class TestUpstreamTimeout:
+    def test_no_deadline__returns_default_timeout(self) -> None:
+        assert upstream_timeout(None) == UPSTREAM_TIMEOUT_SECONDS
+
+    def test_sooner_deadline__returns_remaining_time(self, clock: FakeClock) -> None:
+        assert upstream_timeout(Deadline.after(0.25, clock)) == 0.25
+
+    def test_later_deadline__returns_default_timeout(self, clock: FakeClock) -> None:
+        assert upstream_timeout(Deadline.after(UPSTREAM_TIMEOUT_SECONDS + 5, clock)) == UPSTREAM_TIMEOUT_SECONDS
+
+    def test_expired_deadline__raises(self, clock: FakeClock) -> None:
+        deadline = Deadline.after(1, clock)
+        clock.now = 1
+
+        with pytest.raises(DeadlineExceeded):
+            upstream_timeout(deadline)
@@ -0,0 +1,87 @@
+import contextvars
+import threading
+import tracemalloc
+
+import pytest
+
+from billing.memory_profiling import ProfilerBusy, memory_stage, profile_memory
+from billing.tracing import Tracer
+
+
+class TestProfileMemory:
+    def test_stages__report_allocations_by_path(self) -> None:
+        with profile_memory("usage") as profile:
+            with memory_stage("build_response"):
+                kept = [bytearray(1024) for _ in range(100)]
+            with memory_stage("encode_response"):
+                pass
+
+        report = profile.report("usage")
+
+        assert [stage.stage for stage in report.stages] == ["usage", "usage/build_response", "usage/encode_response"]
+        build = report.stages[1]
+        assert build.calls == 1
+        assert build.allocated_bytes >= 100 * 1024
+        assert build.top_allocations[0].location == f"{__file__}:{self._line_of('bytearray(1024)')}"
+        assert report.peak_bytes >= build.peak_bytes >= build.allocated_bytes
+        assert len(kept) == 100
+
+    def test_freed_allocations__count_towards_peak_only(self) -> None:
+        with profile_memory("usage") as profile, memory_stage("build_response"):
+            data = bytearray(1024 * 1024)
+            del data
+
+        root, build = profile.report("usage").stages
+
+        assert build.allocated_bytes < 1024 * 1024 <= build.peak_bytes
+        # The child's peak counts towards its parent's, although the child resets tracemalloc's peak.
+        assert root.peak_bytes >= build.peak_bytes
+
+    def test_repeated_stage__aggregated(self) -> None:
+        with profile_memory("usage") as profile:
+            for _ in range(3):
+                with memory_stage("fetch_report"):
+                    pass
+
+        assert profile.report("usage").stages[1].calls == 3
+
+    def test_tracer_spans__are_stages(self) -> None:
+        tracer = Tracer()
+
+        with profile_memory("usage") as profile, tracer.span("fetch_messages"):
+            pass
+
+        assert [stage.stage for stage in profile.report("usage").stages] == ["usage", "usage/fetch_messages"]
+
+    def test_stage_in_other_thread__counted_in_current_stage(self) -> None:
+        with profile_memory("usage") as profile:
+            # Run in a copy of the context like the report fetches, so the thread sees the profile.
+            thread = threading.Thread(target=contextvars.copy_context().run, args=(self._fetch_report,))
+            thread.start()
+            thread.join()
+
+        assert [stage.stage for stage in profile.report("usage").stages] == ["usage"]
+
+    def test_concurrent_profile__raises_busy(self) -> None:
+        with profile_memory("usage"), pytest.raises(ProfilerBusy), profile_memory("usage"):
+            pass
+
+    def test_tracing__stopped_after_profile(self) -> None:
+        with profile_memory("usage"):
+            assert tracemalloc.is_tracing()
+
+        assert not tracemalloc.is_tracing()
+
+    def test_no_profile__stage_does_nothing(self) -> None:
+        with memory_stage("build_response"):
+            assert not tracemalloc.is_tracing()
+
+    @staticmethod
+    def _fetch_report() -> None:
+        with memory_stage("fetch_report"):
+            pass
+
+    @staticmethod
+    def _line_of(code: str) -> int:
+        with open(__file__) as file:
+            return next(number for number, line in enumerate(file, 1) if code in line)
@@ -0,0 +1,98 @@
+import sqlite3
+import threading
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from billing.shared_cache import SharedCache
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
+
+
+@pytest.fixture
+def path(tmp_path: Path) -> Path:
+    return tmp_path / "cache.sqlite"
+
+
+@pytest.fixture
+def cache(path: Path, clock: FakeClock) -> SharedCache:
+    return SharedCache(path, max_bytes=10, clock=clock)
+
+
+class TestSharedCache:
+    def test_set__visible_to_other_instances_on_the_same_path(self, cache: SharedCache, path: Path) -> None:
+        cache.set("key", b"body", "v1")
+
+        entry = SharedCache(path, max_bytes=10).get("key")
+
+        assert entry is not None
+        assert (entry.value, entry.version) == (b"body", "v1")
+
+    def test_missing_key__returns_none(self, cache: SharedCache) -> None:
+        assert cache.get("key") is None
+
+    def test_age__time_since_last_written(self, cache: SharedCache, clock: FakeClock) -> None:
+        cache.set("key", b"body")
+        clock.now += 5
+        entry = cache.get("key")
+
+        assert entry is not None and cache.age(entry) == 5
+
+        cache.touch("key")
+        entry = cache.get("key")
+        assert entry is not None and cache.age(entry) == 0
+
+    def test_over_max_bytes__evicts_least_recently_written(self, cache: SharedCache, clock: FakeClock) -> None:
+        cache.set("a", b"aaaa")
+        clock.now += 1
+        cache.set("b", b"bbbb")
+        clock.now += 1
+        cache.set("c", b"cccc")
+
+        assert cache.get("a") is None
+        assert cache.get("b") is not None and cache.get("c") is not None
+        assert cache.size_bytes == 8
+
+    def test_value_larger_than_cache__is_not_stored(self, cache: SharedCache) -> None:
+        cache.set("a", b"aaaa")
+        cache.set("big", b"x" * 11)
+
+        assert cache.get("big") is None
+        assert cache.get("a") is not None
+
+    def test_concurrent_writers__stay_within_max_bytes(self, path: Path) -> None:
+        # A cache per thread, like one per worker process, all writing to the same database.
+        caches = [SharedCache(path, max_bytes=100) for _ in range(4)]
+
+        def write(cache: SharedCache, worker: int) -> None:
+            for i in range(50):
+                cache.set(f"{worker}:{i}", b"x" * 10)
+
+        threads = [threading.Thread(target=write, args=(cache, worker)) for worker, cache in enumerate(caches)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert 0 < caches[0].size_bytes <= 100
+
+    def test_database_error__treated_as_miss(self, cache: SharedCache) -> None:
+        cache.set("key", b"body")
+
+        with patch.object(SharedCache, "_connection", side_effect=sqlite3.OperationalError("database is locked")):
+            cache.set("other", b"body")
+            assert cache.get("key") is None
+
+        assert cache.get("other") is None
@@ -0,0 +1,90 @@
+from collections.abc import Generator
+from pathlib import Path
+
+import pytest
+
+from billing.schemas import UsageEntry
+from billing.services.usage_service import summarise_usage
+from billing.snapshot import UsageSnapshot, write_usage_snapshot
+
+PRICING = "pricing-1"
+ENTRIES = [
+    UsageEntry(message_id=1, timestamp="2024-01-01T10:00:00+00:00", report_name="Report", credits_used=7.5),
+    UsageEntry(message_id=2, timestamp="2024-01-01T11:00:00.250000+00:00", credits_used=1.35),
+    UsageEntry(message_id=3, timestamp="2024-01-02T09:00:00+00:00", report_name="Other", credits_used=2.0),
+    UsageEntry(message_id=4, timestamp="2024-01-02T12:00:00+00:00", report_name="Report", credits_used=7.5),
+]
+
+
+@pytest.fixture
+def snapshot(tmp_path: Path) -> Generator[UsageSnapshot, None, None]:
+    path = tmp_path / "usage.snapshot"
+    write_usage_snapshot(path, iter(ENTRIES), PRICING, version="etag-1")
+    snapshot = UsageSnapshot.open(path)
+    yield snapshot
+    snapshot.close()
+
+
+class TestUsageSnapshot:
+    def test_round_trip__returns_same_entries(self, snapshot: UsageSnapshot) -> None:
+        assert len(snapshot) == len(ENTRIES)
+        assert list(snapshot.iter_usage_entries()) == ENTRIES
+        assert snapshot.version == "etag-1"
+        assert snapshot.fingerprint == PRICING
+
+    def test_summary__matches_summary_of_entries(self, snapshot: UsageSnapshot) -> None:
+        assert snapshot.summary() == summarise_usage(ENTRIES)
+
+    @pytest.mark.parametrize(
+        "timestamp", ["2024-01-01T23:30:00-05:00", "2024-01-02T00:30:00+02:00", "2024-01-01T23:59:59.999999"]
+    )
+    def test_summary_days__bucketed_in_timestamp_offset(self, tmp_path: Path, timestamp: str) -> None:
+        path = tmp_path / "usage.snapshot"
+        entries = [UsageEntry(message_id=1, timestamp=timestamp, credits_used=1.0)]
+        write_usage_snapshot(path, entries, PRICING)
+
+        snapshot = UsageSnapshot.open(path)
+
+        assert snapshot.summary() == summarise_usage(entries)
+        snapshot.close()
+
+    def test_report_names__stored_once(self, snapshot: UsageSnapshot) -> None:
+        assert snapshot.report_names == ["Report", "Other"]
+        assert list(snapshot.report_codes) == [0, -1, 1, 0]
+
+    @pytest.mark.parametrize(
+        "timestamp", ["2024-01-01T00:00:00", "2024-01-01T00:00:00.5Z", "2024-01-01T02:00:00+02:00"]
+    )
+    def test_timestamp__read_back_verbatim(self, tmp_path: Path, timestamp: str) -> None:
+        path = tmp_path / "usage.snapshot"
+        entry = UsageEntry(message_id=1, timestamp=timestamp, credits_used=1.0)
+        write_usage_snapshot(path, [entry], PRICING)
+
+        snapshot = UsageSnapshot.open(path)
+
+        assert next(snapshot.iter_usage_entries()).model_dump_json() == entry.model_dump_json()
+        assert snapshot.version is None
+        snapshot.close()
+
+    def test_truncated_file__raises_value_error(self, snapshot: UsageSnapshot, tmp_path: Path) -> None:
+        data = (tmp_path / "usage.snapshot").read_bytes()
+        path = tmp_path / "truncated.snapshot"
+        # Any cut before the end of the last section, i.e. the trailing padding.
+        for length in range(1, len(data.rstrip(b"\x00"))):
+            path.write_bytes(data[:length])
+
+            with pytest.raises(ValueError):
+                UsageSnapshot.open(path)
+
+    def test_credits_beyond_scale__raises_value_error(self, tmp_path: Path) -> None:
+        entry = UsageEntry(message_id=1, timestamp="2024-01-01T00:00:00", credits_used=0.1234567)
+
+        with pytest.raises(ValueError):
+            write_usage_snapshot(tmp_path / "usage.snapshot", [entry], PRICING)
+
+    def test_not_a_snapshot__raises_value_error(self, tmp_path: Path) -> None:
+        path = tmp_path / "usage.snapshot"
+        path.write_bytes(b"x" * 64)
+
+        with pytest.raises(ValueError):
+            UsageSnapshot.open(path)
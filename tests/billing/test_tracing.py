@@ -0,0 +1,126 @@
+import json
+import random
+from pathlib import Path
+
+import pytest
+
+from billing.tracing import AggregateSpan, FileSpanExporter, InMemorySpanExporter, Tracer
+
+
+@pytest.fixture
+def exporter() -> InMemorySpanExporter:
+    return InMemorySpanExporter()
+
+
+@pytest.fixture
+def tracer(exporter: InMemorySpanExporter) -> Tracer:
+    return Tracer(exporter, sample_rate=1.0, rng=random.Random(0))
+
+
+class TestTracer:
+    def test_nested_spans__share_trace_and_link_parent(self, tracer: Tracer, exporter: InMemorySpanExporter) -> None:
+        with tracer.span("request"), tracer.span("fetch_messages"):
+            pass
+
+        child, root = exporter.spans
+        assert child.trace_id == root.trace_id
+        assert child.parent_span_id == root.span_id
+        assert root.parent_span_id is None
+        assert root.start_time_unix_nano <= child.start_time_unix_nano <= child.end_time_unix_nano
+
+    def test_unsampled_trace__records_nothing(self, exporter: InMemorySpanExporter) -> None:
+        tracer = Tracer(exporter, sample_rate=0.0)
+
+        with tracer.span("request") as root, tracer.span("fetch_messages") as child:
+            assert root is None
+            assert child is None
+
+        assert exporter.spans == []
+
+    def test_sample_rate__samples_whole_traces(self, exporter: InMemorySpanExporter) -> None:
+        tracer = Tracer(exporter, sample_rate=0.5, rng=random.Random(0))
+
+        for _ in range(1000):
+            with tracer.span("request"), tracer.span("fetch_messages"):
+                pass
+
+        roots = [span for span in exporter.spans if span.name == "request"]
+        assert 400 < len(roots) < 600
+        assert len(exporter.spans) == 2 * len(roots)
+
+    def test_no_exporter__records_nothing(self) -> None:
+        tracer = Tracer()
+
+        with tracer.span("request") as span:
+            assert span is None
+            assert not tracer.is_recording()
+
+    def test_exception__recorded_on_span(self, tracer: Tracer, exporter: InMemorySpanExporter) -> None:
+        with pytest.raises(ValueError), tracer.span("request"):
+            raise ValueError("boom")
+
+        assert exporter.spans[0].attributes["error"] == "ValueError"
+
+    def test_invalid_sample_rate__raises_value_error(self) -> None:
+        with pytest.raises(ValueError):
+            Tracer(InMemorySpanExporter(), sample_rate=2)
+
+
+class TestAggregateSpan:
+    def test_operations__recorded_as_one_child_span(self, tracer: Tracer, exporter: InMemorySpanExporter) -> None:
+        with tracer.span("request"):
+            calculations = AggregateSpan(tracer, "calculate_credits")
+            for _ in range(3):
+                with calculations:
+                    pass
+            calculations.record()
+
+        aggregate, root = exporter.spans
+        assert aggregate.name == "calculate_credits"
+        assert aggregate.parent_span_id == root.span_id
+        assert aggregate.attributes == {"calls": 3}
+        assert aggregate.end_time_unix_nano - aggregate.start_time_unix_nano == calculations.duration_ns
+
+    def test_outside_recorded_span__records_nothing(self, tracer: Tracer, exporter: InMemorySpanExporter) -> None:
+        calculations = AggregateSpan(tracer, "calculate_credits")
+        with calculations:
+            pass
+        calculations.record()
+
+        assert calculations.calls == 0
+        assert exporter.spans == []
+
+
+class TestSpan:
+    def test_attributes__encoded_as_otlp_key_values(self, tracer: Tracer, exporter: InMemorySpanExporter) -> None:
+        with tracer.span("request", view="usage", cache_hit=True, report_count=3, ratio=0.5, ids=[1, 2]):
+            pass
+
+        assert exporter.spans[0].to_otlp_json()["attributes"] == [
+            {"key": "view", "value": {"stringValue": "usage"}},
+            {"key": "cache_hit", "value": {"boolValue": True}},
+            {"key": "report_count", "value": {"intValue": "3"}},
+            {"key": "ratio", "value": {"doubleValue": 0.5}},
+            {"key": "ids", "value": {"arrayValue": {"values": [{"intValue": "1"}, {"intValue": "2"}]}}},
+        ]
+
+
+class TestFileSpanExporter:
+    def test_spans__appended_as_otlp_json_lines(self, tmp_path: Path) -> None:
+        path = tmp_path / "spans.jsonl"
+        tracer = Tracer(FileSpanExporter(path), sample_rate=1.0)
+
+        with tracer.span("request", view="usage"):
+            pass
+        with tracer.span("request", view="usage-summary"):
+            pass
+
+        records = [json.loads(line) for line in path.read_text().splitlines()]
+        assert [record["attributes"] for record in records] == [
+            [{"key": "view", "value": {"stringValue": "usage"}}],
+            [{"key": "view", "value": {"stringValue": "usage-summary"}}],
+        ]
+        assert len(records[0]["traceId"]) == 32
+        assert len(records[0]["spanId"]) == 16
+        assert records[0]["parentSpanId"] == ""
+        assert int(records[0]["endTimeUnixNano"]) >= int(records[0]["startTimeUnixNano"])
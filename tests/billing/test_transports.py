@@ -0,0 +1,101 @@
+import json
+from pathlib import Path
+from unittest.mock import Mock
+
+import pytest
+import requests
+from fastapi import HTTPException
+
+from billing.services.messages_service import MessageService
+from billing.services.reports_service import ReportService
+from billing.transports import RecordingTransport, ReplayTransport, close_transport, pooled_transport
+
+BASE_URL = "http://test-service.com"
+
+
+def make_response(status_code: int, body: object, headers: dict[str, str] | None = None) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(body).encode()
+    response.headers.update(headers or {})
+    return response
+
+
+@pytest.fixture
+def archive_path(tmp_path: Path) -> Path:
+    inner = Mock()
+    inner.get.side_effect = lambda url, timeout=None: {
+        f"{BASE_URL}/messages/current-period": make_response(
+            200, {"messages": [{"id": 1, "timestamp": "2024-01-01T00:00:00", "text": "hello", "report_id": 5}]}
+        ),
+        f"{BASE_URL}/reports/5": make_response(200, {"id": 5, "name": "Report", "credit_cost": "7"}),
+        f"{BASE_URL}/reports/6": make_response(404, {}),
+    }[url]
+    inner.head.return_value = make_response(200, "", {"ETag": "etag-1"})
+    path = tmp_path / "upstream.jsonl"
+    transport = RecordingTransport(inner, path)
+
+    MessageService(BASE_URL, transport).fetch_messages()
+    MessageService(BASE_URL, transport).fetch_version()
+    ReportService(BASE_URL, transport).fetch_report(5)
+    ReportService(BASE_URL, transport).fetch_report(6)
+    return path
+
+
+class TestRecordReplay:
+    def test_replay__services_return_recorded_data(self, archive_path: Path) -> None:
+        transport = ReplayTransport(archive_path, latency_scale=0)
+
+        messages = MessageService(BASE_URL, transport).fetch_messages()
+        report = ReportService(BASE_URL, transport).fetch_report(5)
+
+        assert [message.report_id for message in messages] == [5]
+        assert report is not None and report.name == "Report"
+        assert ReportService(BASE_URL, transport).fetch_report(6) is None
+        assert MessageService(BASE_URL, transport).fetch_version() == "etag-1"
+
+    def test_replay__sleeps_for_scaled_recorded_latency(self, archive_path: Path) -> None:
+        recorded_latency = json.loads(archive_path.read_text().splitlines()[0])["elapsed_seconds"]
+        sleep = Mock()
+        transport = ReplayTransport(archive_path, latency_scale=2.0, sleep=sleep)
+
+        MessageService(BASE_URL, transport).fetch_messages()
+
+        sleep.assert_called_once_with(recorded_latency * 2.0)
+
+    def test_latency_over_timeout__sleeps_for_timeout_and_raises(self, archive_path: Path) -> None:
+        sleep = Mock()
+        transport = ReplayTransport(archive_path, latency_scale=1e9, sleep=sleep)
+
+        with pytest.raises(requests.exceptions.Timeout):
+            transport.get(f"{BASE_URL}/reports/5", timeout=0.5)
+
+        sleep.assert_called_once_with(0.5)
+
+    def test_unrecorded_url__raises_like_upstream_failure(self, archive_path: Path) -> None:
+        transport = ReplayTransport(archive_path, latency_scale=0)
+
+        with pytest.raises(HTTPException):
+            ReportService(BASE_URL, transport).fetch_report(999)
+
+
+class TestPooledTransport:
+    def test_session__pools_connections_per_host(self) -> None:
+        transport = pooled_transport(pool_size=16)
+
+        assert isinstance(transport, requests.Session)
+        adapter = transport.get_adapter("https://owpublic.blob.core.windows.net")
+        assert isinstance(adapter, requests.adapters.HTTPAdapter)
+        assert adapter._pool_maxsize == 16  # type: ignore[attr-defined]
+
+
+class TestCloseTransport:
+    def test_recording_transport__closes_inner_session(self, tmp_path: Path) -> None:
+        inner = Mock()
+
+        close_transport(RecordingTransport(inner, tmp_path / "upstream.jsonl"))
+
+        inner.close.assert_called_once_with()
+
+    def test_transport_without_close__ignored(self) -> None:
+        close_transport(requests)
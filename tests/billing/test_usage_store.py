@@ -0,0 +1,69 @@
+from pathlib import Path
+
+import pytest
+
+from billing.schemas import UsageEntry
+from billing.usage_store import UsageStore
+
+PRICING = "pricing-1"
+
+
+def make_entry(message_id: int, credits_used: float = 1.0) -> UsageEntry:
+    return UsageEntry(message_id=message_id, timestamp="2024-01-01T00:00:00", credits_used=credits_used)
+
+
+@pytest.fixture
+def path(tmp_path: Path) -> Path:
+    return tmp_path / "usage.sqlite"
+
+
+@pytest.fixture
+def store(path: Path) -> UsageStore:
+    return UsageStore(path)
+
+
+class TestUsageStore:
+    def test_append__entries_in_ingestion_order(self, store: UsageStore) -> None:
+        store.append([make_entry(3), make_entry(1)], PRICING)
+        store.append([make_entry(2)], PRICING)
+
+        assert [entry.message_id for entry in store.iter_entries(PRICING)] == [3, 1, 2]
+
+    def test_reingested_message__replaced_in_place(self, store: UsageStore) -> None:
+        store.append([make_entry(1), make_entry(2)], PRICING)
+
+        store.append([make_entry(1, credits_used=5.0)], PRICING)
+
+        assert [(entry.message_id, entry.credits_used) for entry in store.iter_entries(PRICING)] == [(1, 5.0), (2, 1.0)]
+
+    def test_append__changes_version(self, store: UsageStore) -> None:
+        before = store.version()
+
+        store.append([make_entry(1)], PRICING)
+
+        assert store.version() != before
+
+    def test_other_instance__reads_the_same_usage(self, store: UsageStore, path: Path) -> None:
+        store.append([make_entry(1)], PRICING)
+        store.mark_backfilled(PRICING)
+
+        other = UsageStore(path)
+
+        assert other.is_backfilled(PRICING)
+        assert list(other.iter_entries(PRICING)) == [make_entry(1)]
+        assert other.version() == store.version()
+
+    def test_new_store__not_backfilled(self, store: UsageStore) -> None:
+        store.append([make_entry(1)], PRICING)
+
+        assert not store.is_backfilled(PRICING)
+
+    def test_other_pricing__neither_read_nor_backfilled(self, store: UsageStore) -> None:
+        store.append([make_entry(1), make_entry(2)], PRICING)
+        store.mark_backfilled(PRICING)
+
+        store.append([make_entry(2, credits_used=5.0)], "pricing-2")
+
+        assert not store.is_backfilled("pricing-2")
+        assert [entry.message_id for entry in store.iter_entries(PRICING)] == [1]
+        assert [entry.credits_used for entry in store.iter_entries("pricing-2")] == [5.0]
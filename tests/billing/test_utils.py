@@ -1,4 +1,4 @@
-from billing.utils import is_word
+from billing.utils import STREAMING_TEXT_THRESHOLD, count_third_position_chars, is_word, iter_words
 
 
 class TestIsWord:
@@ -39,3 +39,23 @@ class TestIsWord:
         assert is_word("résumé")
 
     # TODO: I'm sure there are many other tests I could do but I'll leave at this for now.
+
+
+class TestIterWords:
+    def test_short_text__matches_split(self) -> None:
+        assert list(iter_words(" a  b\tc\n")) == ["a", "b", "c"]
+
+    def test_long_text__matches_split(self) -> None:
+        text = "a\u00a0bc\u2003 d\x1c" * STREAMING_TEXT_THRESHOLD
+
+        assert list(iter_words(text)) == text.split()
+
+
+class TestCountThirdPositionChars:
+    def test_counts_every_third_character(self) -> None:
+        assert count_third_position_chars("abaaba", {"a"}) == 2
+
+    def test_long_text__matches_slice(self) -> None:
+        text = "abcdefg" * STREAMING_TEXT_THRESHOLD
+
+        assert count_third_position_chars(text, {"a", "e"}) == sum(1 for char in text[2::3] if char in "ae")
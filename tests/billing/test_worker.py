@@ -0,0 +1,35 @@
+import threading
+from unittest.mock import Mock
+
+from billing.worker import RefreshWorker
+
+
+class TestRefreshWorker:
+    def test_successful_refresh__sets_ready(self) -> None:
+        refresh = Mock()
+        worker = RefreshWorker(refresh, interval_seconds=60)
+
+        worker.start()
+        assert worker.ready.wait(timeout=5)
+        worker.stop(timeout=5)
+
+        refresh.assert_called_once()
+
+    def test_failed_refresh__not_ready_and_retried(self) -> None:
+        retried = threading.Event()
+        calls = 0
+
+        def refresh() -> None:
+            nonlocal calls
+            calls += 1
+            if calls > 1:
+                retried.set()
+            raise RuntimeError("upstream down")
+
+        worker = RefreshWorker(refresh, interval_seconds=0.01)
+
+        worker.start()
+        assert retried.wait(timeout=5)
+        worker.stop(timeout=5)
+
+        assert not worker.ready.is_set()
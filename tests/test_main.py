@@ -0,0 +1,64 @@
+from collections.abc import Generator
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+
+
+class TestReadyEndpoint:
+    @pytest.fixture
+    def mock_refresh(self) -> Generator[None, None, None]:
+        with patch("main.refresh_usage_responses"), patch("main.USAGE_REFRESH_INTERVAL_SECONDS", 60):
+            yield
+
+    def test_without_lifespan__returns_503(self) -> None:
+        response = TestClient(app).get("/ready")
+
+        assert response.status_code == 503
+
+    def test_after_warm_up__returns_200(self, mock_refresh: None) -> None:
+        with TestClient(app) as client:
+            assert app.state.refresh_worker.ready.wait(timeout=5)
+
+            response = client.get("/ready")
+
+        assert response.status_code == 200
+
+
+class TestLifespan:
+    def test_startup__builds_container_once(self) -> None:
+        with (
+            patch("main.refresh_usage_responses"),
+            patch("main.USAGE_REFRESH_ENABLED", False),
+            TestClient(app) as client,
+        ):
+            container = app.state.container
+            client.get("/ready")
+
+            assert app.state.container is container
+        # Shut down with the app.
+        assert container.report_service._executor._shutdown
+
+
+class TestMetricsEndpoint:
+    def test_metrics__reports_usage_admission(self) -> None:
+        with (
+            patch("main.refresh_usage_responses"),
+            patch("main.USAGE_REFRESH_ENABLED", False),
+            TestClient(app) as client,
+        ):
+            app.state.container.usage_admission.stats.shed = 1
+            app.state.container.usage_admission.stats.admitted = 3
+
+            response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.json() == {
+            "usage_in_flight": 0,
+            "usage_queued": 0,
+            "usage_admitted_total": 3,
+            "usage_shed_total": 1,
+            "usage_shed_rate": 0.25,
+        }
@@ -0,0 +1,124 @@
+import base64
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from billing.constants import BASE_SERVICE_URL
+
+# Budgets for a cold process, generous enough for a slow CI machine while still catching e.g. a heavy import being
+# added at module level (which usually costs hundreds of milliseconds).
+IMPORT_BUDGET_SECONDS = 1.5
+FIRST_REQUEST_BUDGET_SECONDS = 1.0
+# Wall clock budgets are flaky on a loaded machine, so they only run when asked for (e.g. in a dedicated CI job).
+timing_test = pytest.mark.skipif(
+    os.environ.get("RUN_TIMING_TESTS", "").lower() != "true", reason="set RUN_TIMING_TESTS=true to run"
+)
+
+PROJECT_ROOT = Path(__file__).parents[1]
+
+STARTUP_SCRIPT = """
+import json
+import sys
+import time
+
+start = time.perf_counter()
+import main
+import_seconds = time.perf_counter() - start
+imported_modules = sorted(sys.modules)
+
+from fastapi.testclient import TestClient
+
+with TestClient(main.app) as client:
+    start = time.perf_counter()
+    response = client.get("/usage")
+    first_request_seconds = time.perf_counter() - start
+
+print(json.dumps({
+    "import_seconds": import_seconds,
+    "first_request_seconds": first_request_seconds,
+    "status_code": response.status_code,
+    "imported_modules": imported_modules,
+}))
+"""
+
+
+def run_python(code: str, env: dict[str, str] | None = None) -> Any:
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=PROJECT_ROOT,
+        env={**os.environ, **(env or {})},
+        capture_output=True,
+        text=True,
+        check=True,
+        timeout=60,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def archive_record(method: str, url: str, body: dict[str, Any] | None = None) -> str:
+    return json.dumps(
+        {
+            "method": method,
+            "url": url,
+            "status_code": 200,
+            "headers": {"ETag": '"version-1"', "Content-Type": "application/json"},
+            "body": base64.b64encode(json.dumps(body).encode() if body is not None else b"").decode(),
+            "elapsed_seconds": 0,
+        }
+    )
+
+
+@pytest.fixture(scope="module")
+def startup(tmp_path_factory: pytest.TempPathFactory) -> Any:
+    messages = {
+        "messages": [
+            {"id": 1, "text": "Hello world", "timestamp": "2024-01-01T00:00:00"},
+            {"id": 2, "text": "Generate a report", "timestamp": "2024-01-01T00:00:00", "report_id": 5},
+        ]
+    }
+    archive_path = tmp_path_factory.mktemp("startup") / "upstream.jsonl"
+    archive_path.write_text(
+        "\n".join(
+            [
+                archive_record("HEAD", f"{BASE_SERVICE_URL}/messages/current-period"),
+                archive_record("GET", f"{BASE_SERVICE_URL}/messages/current-period", messages),
+                archive_record("GET", f"{BASE_SERVICE_URL}/reports/5", {"id": 5, "name": "Report", "credit_cost": 7}),
+            ]
+        )
+    )
+    # The upstream is replayed without latency, so the request only measures our own work.
+    return run_python(
+        STARTUP_SCRIPT,
+        env={
+            "UPSTREAM_REPLAY_PATH": str(archive_path),
+            "UPSTREAM_REPLAY_LATENCY_SCALE": "0",
+            "USAGE_REFRESH_ENABLED": "false",
+        },
+    )
+
+
+class TestStartup:
+    @timing_test
+    def test_import__within_budget(self, startup: Any) -> None:
+        assert startup["import_seconds"] < IMPORT_BUDGET_SECONDS
+
+    def test_first_request__succeeds(self, startup: Any) -> None:
+        assert startup["status_code"] == 200
+
+    @timing_test
+    def test_first_request__within_budget(self, startup: Any) -> None:
+        assert startup["first_request_seconds"] < FIRST_REQUEST_BUDGET_SECONDS
+
+    def test_import__defers_http_client(self, startup: Any) -> None:
+        assert "requests" not in startup["imported_modules"]
+
+    def test_batch_cli__does_not_import_fastapi(self) -> None:
+        imported_modules = run_python("import json, sys; import billing.batch; print(json.dumps(sorted(sys.modules)))")
+
+        assert "fastapi" not in imported_modules
+        assert "requests" not in imported_modules